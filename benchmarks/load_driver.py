@@ -0,0 +1,169 @@
+# benchmarks/load_driver.py
+"""Drive /analyze-document at fixed concurrency levels and report latency and throughput.
+
+For each concurrency level the corpus is replayed until --requests calls have been made.
+Reports p50/p95/p99 latency, requests per second, per-stage medians and p95s from the
+X-Timing header, and the server's peak RSS scraped from /metrics. With --stream the
+streaming endpoint is used instead, and the time until each event type first arrives
+(event:summary, event:result, ...) is reported in place of the stages.
+
+Run the server without caches so repeated files are really processed:
+    ANALYSIS_CACHE_BACKEND=none EXTRACTION_CACHE_ENABLED=false
+"""
+import os
+import json
+import time
+import argparse
+import mimetypes
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+PEAK_RSS_METRIC = "docanalysis_process_peak_rss_bytes"
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def parse_timing(header: str) -> dict:
+    """Parse an X-Timing header into {stage: milliseconds}."""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+
+def scrape_peak_rss(base_url: str) -> dict:
+    try:
+        text = requests.get(f"{base_url}/metrics", timeout=10).text
+    except requests.RequestException:
+        return {}
+    peaks = {}
+    for line in text.splitlines():
+        if line.startswith(PEAK_RSS_METRIC):
+            labels, _, value = line.rpartition(" ")
+            peaks[labels[len(PEAK_RSS_METRIC):] or "process"] = int(float(value))
+    return peaks
+
+
+def _read_events(response: requests.Response, started: float) -> tuple:
+    """(status, {"event:<name>": ms to its first arrival}) for a server-sent event stream."""
+    arrivals, status = {}, response.status_code
+    for line in response.iter_lines(decode_unicode=True):
+        if line and line.startswith("event: "):
+            name = line[len("event: "):]
+            arrivals.setdefault(f"event:{name}", (time.perf_counter() - started) * 1000)
+            if name == "error":
+                status = "stream error"
+    return status, arrivals
+
+
+def _send(session: requests.Session, url: str, path: str, mode: str, stream: bool = False) -> dict:
+    params = {"mode": mode} if mode and not stream else None
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    started = time.perf_counter()
+    try:
+        with open(path, "rb") as f:
+            response = session.post(url, params=params, files={"file": (os.path.basename(path), f, content_type)},
+                                    timeout=600, stream=stream)
+        if stream:
+            status, timing = _read_events(response, started)
+        else:
+            status = response.status_code
+            timing = parse_timing(response.headers.get("X-Timing"))
+    except requests.RequestException as e:
+        status, timing = f"error: {type(e).__name__}", {}
+    return {"file": path, "status": status, "ms": (time.perf_counter() - started) * 1000, "stages": timing}
+
+
+def run_level(base_url: str, files: list, concurrency: int, total: int, mode: str, stream: bool = False) -> dict:
+    url = f"{base_url}/analyze-document/stream" if stream else f"{base_url}/analyze-document"
+    sessions = [requests.Session() for _ in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda i: _send(sessions[i % concurrency], url, files[i % len(files)], mode, stream),
+            range(total),
+        ))
+    elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    latencies = [r["ms"] for r in ok]
+    stages = defaultdict(list)
+    by_extension = defaultdict(list)
+    for r in ok:
+        for stage, ms in r["stages"].items():
+            stages[stage].append(ms)
+        by_extension[os.path.splitext(r["file"])[1].lower()].append(r["ms"])
+    errors = defaultdict(int)
+    for r in results:
+        if r["status"] != 200:
+            errors[str(r["status"])] += 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(ok),
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed, 2),
+        "rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {q: round(percentile(latencies, f), 1) for q, f in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "stages_ms": {
+            stage: {"p50": round(percentile(v, 0.5), 1), "p95": round(percentile(v, 0.95), 1), "count": len(v)}
+            for stage, v in sorted(stages.items())
+        },
+        "by_extension_p50_ms": {ext: round(percentile(v, 0.5), 1) for ext, v in sorted(by_extension.items())},
+        "peak_rss_bytes": scrape_peak_rss(base_url),
+    }
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(f"\n== concurrency {report['concurrency']}: {report['ok']}/{report['requests']} ok in {report['elapsed_s']}s, "
+          f"{report['rps']} req/s")
+    print(f"   latency p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms")
+    if report["errors"]:
+        print(f"   errors {report['errors']}")
+    for stage, values in report["stages_ms"].items():
+        print(f"   {stage:<20} p50 {values['p50']:>9} ms  p95 {values['p95']:>9} ms  (n={values['count']})")
+    for ext, ms in report["by_extension_p50_ms"].items():
+        print(f"   {ext:<20} p50 {ms:>9} ms")
+    for label, value in report["peak_rss_bytes"].items():
+        print(f"   peak RSS {label} {value / (1024 * 1024):.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--corpus", default="bench_corpus")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=48, help="Requests per concurrency level")
+    parser.add_argument("--mode", default=None, help="Pipeline mode query parameter (sequential, parallel, single)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Use /analyze-document/stream and report when each event first arrives")
+    parser.add_argument("--output", default=None, help="Also write the reports as JSON to this path")
+    args = parser.parse_args()
+
+    files = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus))
+    if not files:
+        raise SystemExit(f"No files in {args.corpus}; run benchmarks/make_corpus.py first")
+
+    reports = []
+    for level in (int(value) for value in args.concurrency.split(",")):
+        report = run_level(args.url.rstrip("/"), files, level, args.requests, args.mode, args.stream)
+        print_report(report)
+        reports.append(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
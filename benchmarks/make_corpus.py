@@ -0,0 +1,173 @@
+# benchmarks/make_corpus.py
+"""Generate a synthetic benchmark corpus covering every extension the API accepts.
+
+Writes digital and scanned PDFs, docx, csv, xlsx, png, jpg and txt files of
+configurable size into one directory. Output is deterministic for a given --seed.
+"""
+import os
+import csv
+import random
+import argparse
+import logging
+from datetime import date, timedelta
+
+from PIL import Image, ImageDraw, ImageFont
+from docx import Document
+from openpyxl import Workbook
+
+WORDS = (
+    "invoice payment contract party agreement term total amount due date customer supplier "
+    "delivery services period notice renewal balance assets liabilities revenue expenses "
+    "quarter annual report clause obligation schedule signature effective tax net gross"
+).split()
+
+LINES_PER_PAGE = 45
+COMPANY_HEADER = "Northwind Supplies B.V.    Registered office: Keizersgracht 100, Amsterdam    VAT NL001234567B01"
+LEGAL_FOOTER = [
+    "This document is confidential and intended solely for the addressee. If you have received it in error,",
+    "please notify the sender and delete it. Northwind Supplies B.V. general terms and conditions apply.",
+]
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def _page_lines(rng: random.Random, page: int) -> list:
+    due = date(2025, 1, 1) + timedelta(days=rng.randint(0, 365))
+    # Letterhead and footer repeated on every page, as real multi-page documents have
+    lines = [COMPANY_HEADER, f"Invoice INV-{rng.randint(10000, 99999)} page {page + 1}", f"Payment due {due.isoformat()}"]
+    body = LINES_PER_PAGE - len(lines) - len(LEGAL_FOOTER) - 1
+    lines += [_sentence(rng) for _ in range(body)]
+    return lines + LEGAL_FOOTER + [f"Page {page + 1}"]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_digital_pdf(path: str, pages: list) -> None:
+    """Minimal PDF with a real text layer, one Helvetica text object per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 50 800 Td 14 TL " + " ".join(f"({_pdf_escape(line[:95])}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def render_page_image(lines: list, width: int = 1240, height: int = 1754) -> Image.Image:
+    """Text rendered onto a white A4 page at roughly 150 DPI, like a scan."""
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    y = 60
+    for line in lines:
+        draw.text((60, y), line, fill=0, font=font)
+        y += (height - 120) // len(lines)
+    return image
+
+
+def write_scanned_pdf(path: str, pages: list) -> None:
+    images = [render_page_image(lines).convert("RGB") for lines in pages]
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+
+
+def write_docx(path: str, pages: list) -> None:
+    document = Document()
+    for lines in pages:
+        document.add_heading(lines[0], level=2)
+        for line in lines[1:]:
+            document.add_paragraph(line)
+    document.save(path)
+
+
+def _rows(rng: random.Random, count: int) -> list:
+    start = date(2025, 1, 1)
+    return [
+        [f"INV-{10000 + i}", (start + timedelta(days=i % 365)).isoformat(), rng.choice(WORDS),
+         rng.randint(1, 50), round(rng.uniform(5, 500), 2)]
+        for i in range(count)
+    ]
+
+
+def write_csv(path: str, rows: list) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["invoice", "date", "item", "quantity", "unit_price"])
+        writer.writerows(rows)
+
+
+def write_xlsx(path: str, rows: list) -> None:
+    workbook = Workbook(write_only=True)
+    for name in ("Invoices", "Archive"):
+        sheet = workbook.create_sheet(name)
+        sheet.append(["invoice", "date", "item", "quantity", "unit_price"])
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def write_txt(path: str, pages: list) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join("\n".join(lines) for lines in pages))
+
+
+def generate(output_dir: str, pages: int, rows: int, copies: int, seed: int) -> list:
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for copy in range(copies):
+        rng = random.Random(seed + copy)
+        content = [_page_lines(rng, page) for page in range(pages)]
+        table = _rows(rng, rows)
+        writers = {
+            "digital.pdf": lambda p: write_digital_pdf(p, content),
+            "scanned.pdf": lambda p: write_scanned_pdf(p, content[:max(1, pages // 4)]),
+            "document.docx": lambda p: write_docx(p, content),
+            "table.csv": lambda p: write_csv(p, table),
+            "workbook.xlsx": lambda p: write_xlsx(p, table),
+            "scan.png": lambda p: render_page_image(content[0]).save(p),
+            "photo.jpg": lambda p: render_page_image(content[0]).save(p, quality=85),
+            "notes.txt": lambda p: write_txt(p, content),
+        }
+        for name, write in writers.items():
+            path = os.path.join(output_dir, f"{copy:03d}_{name}")
+            write(path)
+            written.append(path)
+            logging.info(f"Wrote {path} ({os.path.getsize(path)} bytes)")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench_corpus")
+    parser.add_argument("--pages", type=int, default=8, help="Pages per PDF/docx/txt document")
+    parser.add_argument("--rows", type=int, default=2000, help="Rows per csv/xlsx sheet")
+    parser.add_argument("--copies", type=int, default=3, help="Distinct variants of each file type")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    files = generate(args.output, args.pages, args.rows, args.copies, args.seed)
+    print(f"Generated {len(files)} files in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/mock_llm_server.py
+"""OpenAI-compatible stand-in for offline benchmarks.
+
+Serves POST /v1/chat/completions with canned JSON answers picked from the system
+prompt (classification, analysis, combined or summary merge), after a configurable
+latency, and fails a configurable fraction of calls with 429 or 500. Requests with
+"stream": true get the answer as server-sent chunks.
+
+Run the API against it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=mock LLM_FALLBACK_PROVIDER=none
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Defaults, overridable on the command line
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LLM_LATENCY_MS", "400"))
+MOCK_JITTER_MS = float(os.getenv("MOCK_LLM_JITTER_MS", "150"))
+MOCK_RATE_LIMIT_RATE = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))
+MOCK_SERVER_ERROR_RATE = float(os.getenv("MOCK_LLM_SERVER_ERROR_RATE", "0"))
+MOCK_MALFORMED_RATE = float(os.getenv("MOCK_LLM_MALFORMED_RATE", "0"))
+# Extra latency per 1000 prompt tokens, so input size shows up in response times
+MOCK_PREFILL_MS_PER_1K = float(os.getenv("MOCK_LLM_PREFILL_MS_PER_1K", "0"))
+
+STREAM_FIRST_TOKEN_SHARE = 0.2
+STREAM_CHUNK_CHARS = 8
+
+ANALYSIS = {
+    "document_type": "Invoice",
+    "summary": "Invoice for office supplies issued to a customer.",
+    "key_points": [
+        "Invoice Number: INV-12345",
+        "Date: December 1, 2024",
+        "Customer: ABC Corp",
+        "Total Amount: $2,400.00",
+    ],
+    "deadlines": [{"description": "Payment due date", "date": "2024-12-15"}],
+}
+
+app = FastAPI(title="Mock LLM")
+config = argparse.Namespace(
+    latency_ms=MOCK_LATENCY_MS,
+    jitter_ms=MOCK_JITTER_MS,
+    rate_limit_rate=MOCK_RATE_LIMIT_RATE,
+    server_error_rate=MOCK_SERVER_ERROR_RATE,
+    malformed_rate=MOCK_MALFORMED_RATE,
+    prefill_ms_per_1k=MOCK_PREFILL_MS_PER_1K,
+)
+stats = {"requests": 0, "rate_limited": 0, "server_errors": 0, "malformed": 0, "prompt_tokens": 0}
+
+
+def _canned_answer(system_prompt: str) -> dict:
+    """Pick the response shape the caller's prompt asks for."""
+    if '"summary": "..."' in system_prompt:
+        return {"summary": "Merged summary of a long multi-section document."}
+    if "'category'" in system_prompt:
+        return {**ANALYSIS, "category": "Invoice"}
+    if "key_points" in system_prompt:
+        return ANALYSIS
+    return {"document_type": "Invoice"}
+
+
+def _error(status: int, message: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(status_code=status, content={"error": {"message": message, "type": "mock_error"}}, headers=headers)
+
+
+async def _stream_chunks(model: str, content: str, spread_ms: float, usage: dict):
+    """OpenAI-style chat.completion.chunk events, a few characters each, ending with usage and [DONE]."""
+    pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+    base = {"id": f"chatcmpl-mock-{stats['requests']}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model}
+    for piece in pieces:
+        chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(spread_ms / max(1, len(pieces)) / 1000)
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    messages = body.get("messages") or []
+    system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    user_content = next((m.get("content", "") for m in messages if m.get("role") == "user"), "")
+    prompt_tokens = (len(system_prompt) + len(user_content)) // 4
+    stats["prompt_tokens"] += prompt_tokens
+    delay = max(0.0, random.gauss(config.latency_ms, config.jitter_ms)) + prompt_tokens / 1000 * config.prefill_ms_per_1k
+    streaming = bool(body.get("stream"))
+    # A streamed reply starts after a fifth of the latency and spreads the rest over its chunks
+    await asyncio.sleep(delay * (STREAM_FIRST_TOKEN_SHARE if streaming else 1.0) / 1000)
+
+    roll = random.random()
+    if roll < config.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return _error(429, "Rate limit reached (mock)", {"retry-after-ms": "200"})
+    if roll < config.rate_limit_rate + config.server_error_rate:
+        stats["server_errors"] += 1
+        return _error(500, "Internal server error (mock)")
+
+    content = json.dumps(_canned_answer(system_prompt))
+    if random.random() < config.malformed_rate:
+        stats["malformed"] += 1
+        content = content[: len(content) // 2]
+
+    completion_tokens = len(content) // 4
+    if streaming:
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        return StreamingResponse(
+            _stream_chunks(body.get("model", "mock"), content, delay * (1 - STREAM_FIRST_TOKEN_SHARE), usage),
+            media_type="text/event-stream",
+        )
+    return {
+        "id": f"chatcmpl-mock-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "config": vars(config)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_LATENCY_MS, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=MOCK_JITTER_MS, help="Latency standard deviation")
+    parser.add_argument("--rate-limit-rate", type=float, default=MOCK_RATE_LIMIT_RATE, help="Fraction of calls answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=MOCK_SERVER_ERROR_RATE, help="Fraction of calls answered with 500")
+    parser.add_argument("--malformed-rate", type=float, default=MOCK_MALFORMED_RATE, help="Fraction of replies with truncated JSON")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=MOCK_PREFILL_MS_PER_1K, help="Extra latency per 1000 prompt tokens")
+    args = parser.parse_args()
+
+    for name in ("latency_ms", "jitter_ms", "rate_limit_rate", "server_error_rate", "malformed_rate", "prefill_ms_per_1k"):
+        setattr(config, name, getattr(args, name))
+    logging.basicConfig(level=logging.INFO)
+    logging.info(f"Mock LLM listening on http://{args.host}:{args.port}/v1 with {vars(config)}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# benchmarks/startup_report.py
+"""Report what importing the app costs and how long a fresh server takes to answer /health.
+
+Runs `python -X importtime -c "import main"` in a clean interpreter and lists the most
+expensive top-level imports, plus which of the heavy extractor and LLM libraries were
+pulled in (they should all load lazily, so none by default). With --serve it also starts
+uvicorn once per WARMUP_EXTRACTORS setting and reports the time until /health first
+answers 200, the app's own start-up marks from /startup, and the server's RSS.
+
+    python benchmarks/startup_report.py --serve --warmup none,all
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import startup_service  # noqa: E402
+
+
+def import_costs(module: str, env: dict) -> dict:
+    """Top-level import times (microseconds, cumulative) from -X importtime for `import module`."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    top_level, loaded = {}, set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        if not name[1:].startswith(" "):  # nested imports are indented under their importer
+            top_level[name.strip()] = int(cumulative)
+    return {"wall_seconds": round(wall, 3), "top_level_us": top_level, "loaded": loaded}
+
+
+def _rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def time_to_health(warmup: str, port: int, env: dict, timeout: float) -> dict:
+    """Start uvicorn with the given WARMUP_EXTRACTORS and time the first 200 from /health."""
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**env, "WARMUP_EXTRACTORS": warmup},
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise SystemExit(f"server exited with {server.returncode}")
+            try:
+                if requests.get(f"{base_url}/health", timeout=timeout).status_code == 200:
+                    break
+            except requests.RequestException:
+                time.sleep(0.02)
+        else:
+            raise SystemExit(f"/health not ready after {timeout}s")
+        health_seconds = time.perf_counter() - started
+        report = requests.get(f"{base_url}/startup", timeout=10).json()
+        return {
+            "warmup": warmup,
+            "health_seconds": round(health_seconds, 3),
+            "app_seconds": report["seconds"],
+            "preload_ms": report["preload_ms"],
+            "rss_mb": _rss_mb(server.pid),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15, help="Top-level imports to list")
+    parser.add_argument("--serve", action="store_true", help="Also time a fresh server until /health answers")
+    parser.add_argument("--warmup", default="none,all",
+                        help="Comma-separated WARMUP_EXTRACTORS values to try with --serve, e.g. none,llm,all")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    # Keep caches and OCR workers out of the measurement
+    env = {**os.environ, "WARMUP_EXTRACTORS": "none", "OCR_POOL_WORKERS": os.getenv("OCR_POOL_WORKERS", "0")}
+    costs = import_costs(args.module, env)
+    print(f"import {args.module}: {costs['wall_seconds']:.3f}s wall (interpreter start-up included)")
+    for name, micros in sorted(costs["top_level_us"].items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {micros / 1000:>8.1f} ms  {name}")
+    eager = {
+        group: [module for module in modules if module in costs["loaded"]]
+        for group, modules in startup_service.HEAVY_LIBRARIES.items()
+    }
+    eager = {group: modules for group, modules in eager.items() if modules}
+    print(f"heavy libraries loaded at import: {eager or 'none'}")
+
+    runs = []
+    if args.serve:
+        print()
+        print(f"{'warmup':<20} {'/health s':>10} {'imported s':>11} {'ready s':>8} {'RSS MB':>8}")
+        for warmup in args.warmup.split(","):
+            # "+" separates groups on the command line since "," separates runs
+            run = time_to_health(warmup.replace("+", ","), args.port, env, args.timeout)
+            runs.append(run)
+            print(f"{warmup:<20} {run['health_seconds']:>10.3f} {run['app_seconds'].get('imported', 0):>11.3f} "
+                  f"{run['app_seconds'].get('ready', 0):>8.3f} {run['rss_mb'] or 0:>8.1f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "module": args.module,
+                "wall_seconds": costs["wall_seconds"],
+                "top_level_us": costs["top_level_us"],
+                "eager": eager,
+                "serve": runs,
+            }, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
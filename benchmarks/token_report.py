@@ -0,0 +1,121 @@
+# benchmarks/token_report.py
+"""Measure what text normalization saves on a corpus: input tokens, cost and LLM latency.
+
+Extracts every file in the corpus in-process (same extractors as the API), then runs
+normalize_service with all enabled rules and with each rule on its own. Reports estimated
+tokens per file before and after, the normalization time, and what the reduction is
+worth at the given price and prefill speed.
+
+    python benchmarks/token_report.py --corpus bench_corpus --usd-per-mtok 2.50 --prefill-ms-per-1k 30
+
+For an end-to-end check, run load_driver.py against mock_llm_server.py started with
+--prefill-ms-per-1k once with NORMALIZE_ENABLED=false and once with it on, and compare
+latencies and the mock's /stats prompt_tokens.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import mimetypes
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("EXTRACTION_CACHE_ENABLED", "false")
+
+import textract_service  # noqa: E402
+import normalize_service  # noqa: E402
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def extract_all(paths: list) -> dict:
+    texts = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        try:
+            texts[path] = await textract_service.extract_text_from_upload(
+                path, None, mimetypes.guess_type(path)[0], content_hash=content_hash
+            ) or ""
+        except Exception as e:
+            print(f"skipping {path}: {e}")
+    return texts
+
+
+def measure(texts: dict, rules: list) -> dict:
+    """Token totals and timing for one rule set over {path: text}."""
+    raw, normalized, seconds = 0, 0, []
+    per_extension = defaultdict(lambda: [0, 0])
+    for path, text in texts.items():
+        started = time.perf_counter()
+        _, report = normalize_service.normalize(text, rules)
+        seconds.append(time.perf_counter() - started)
+        raw += report["tokens_raw"]
+        normalized += report["tokens_normalized"]
+        ext = os.path.splitext(path)[1].lower()
+        per_extension[ext][0] += report["tokens_raw"]
+        per_extension[ext][1] += report["tokens_normalized"]
+    return {
+        "rules": rules,
+        "tokens_raw": raw,
+        "tokens_normalized": normalized,
+        "reduction": round(1 - normalized / raw, 4) if raw else 0.0,
+        "normalize_ms_p50": round(percentile(seconds, 0.5) * 1000, 2),
+        "normalize_ms_max": round(max(seconds, default=0.0) * 1000, 2),
+        "per_extension": {ext: {"raw": r, "normalized": n} for ext, (r, n) in sorted(per_extension.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default="bench_corpus")
+    parser.add_argument("--usd-per-mtok", type=float, default=2.50, help="Input price per million tokens")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=30.0, help="Model prefill time per 1000 input tokens")
+    parser.add_argument("--calls-per-document", type=float, default=1.0,
+                        help="LLM calls that receive the whole text (classification only sees its first 4000 characters)")
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+        if os.path.isfile(os.path.join(args.corpus, name))
+    )
+    texts = asyncio.run(extract_all(paths))
+    textract_service.shutdown_process_pool()
+
+    results = [measure(texts, normalize_service.RULES)]
+    results += [measure(texts, [rule]) for rule in normalize_service.RULES]
+
+    print(f"{len(texts)} documents from {args.corpus}")
+    print(f"{'rules':<16} {'raw tok':>9} {'norm tok':>9} {'saved':>7} {'p50 ms':>7} {'$ saved/1k docs':>16} {'ms saved/doc':>13}")
+    for result in results:
+        saved_tokens = (result["tokens_raw"] - result["tokens_normalized"]) * args.calls_per_document
+        per_doc = saved_tokens / max(1, len(texts))
+        usd_per_1k_docs = per_doc * 1000 * args.usd_per_mtok / 1_000_000
+        ms_per_doc = per_doc / 1000 * args.prefill_ms_per_1k - result["normalize_ms_p50"]
+        name = "all" if len(result["rules"]) > 1 else result["rules"][0]
+        print(f"{name:<16} {result['tokens_raw']:>9} {result['tokens_normalized']:>9} {result['reduction']:>7.1%} "
+              f"{result['normalize_ms_p50']:>7.2f} {usd_per_1k_docs:>16.2f} {ms_per_doc:>13.0f}")
+
+    print()
+    print("per file type (all rules): raw -> normalized tokens")
+    for ext, counts in results[0]["per_extension"].items():
+        reduction = 1 - counts["normalized"] / counts["raw"] if counts["raw"] else 0.0
+        print(f"  {ext:<6} {counts['raw']:>9} -> {counts['normalized']:>9}  ({reduction:.1%})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"documents": len(texts), "settings": vars(args), "results": results}, f, indent=2)
+        print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
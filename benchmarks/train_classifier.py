@@ -0,0 +1,135 @@
+# benchmarks/train_classifier.py
+"""Train and evaluate the local document classifier on labels collected from the LLM.
+
+With CLASSIFIER_COLLECT_LABELS=true the server appends LLM classifications to
+CLASSIFIER_LABEL_LOG (and its rotated ".1" file). Records are split deterministically (by a hash of the text) into training and held-out sets.
+
+    python benchmarks/train_classifier.py train      # fit and write CLASSIFIER_MODEL_PATH
+    python benchmarks/train_classifier.py eval       # accuracy vs. latency on the held-out set
+
+eval compares the trained model (or keyword scoring with --keywords) with the LLM labels
+and, for a range of confidence thresholds, reports how many documents would be
+classified locally, their accuracy, and the expected classification latency given the
+LLM latencies recorded alongside the labels.
+"""
+import os
+import sys
+import time
+import zlib
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import classifier_service  # noqa: E402
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.99)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def split(records: list, holdout: float) -> tuple:
+    train, test = [], []
+    for record in records:
+        bucket = zlib.crc32(record["text"].encode("utf-8")) % 1000
+        (test if bucket < holdout * 1000 else train).append(record)
+    return train, test
+
+
+def load_records(path: str) -> list:
+    # The same document may have been labelled several times; keep its latest label
+    latest = {}
+    for record in classifier_service.read_labels(path):
+        latest[record["text"]] = record
+    return list(latest.values())
+
+
+def train(args) -> None:
+    train_set, test_set = split(load_records(args.labels), args.holdout)
+    print(f"training on {len(train_set)} documents ({len(test_set)} held out)")
+    print("label counts: " + ", ".join(f"{k}={v}" for k, v in Counter(r["label"] for r in train_set).most_common()))
+    started = time.perf_counter()
+    model = classifier_service.LinearModel().fit(
+        [(r["text"], r["label"]) for r in train_set], epochs=args.epochs, learning_rate=args.learning_rate
+    )
+    classifier_service.save_model(model, args.model)
+    print(f"trained in {time.perf_counter() - started:.1f}s; wrote {args.model}")
+
+
+def evaluate(args) -> None:
+    _, test_set = split(load_records(args.labels), args.holdout)
+    if not test_set:
+        sys.exit("no held-out documents; collect more labels or raise --holdout")
+    if args.keywords:
+        predict, name = classifier_service.keyword_predict, "keywords"
+    else:
+        model = classifier_service.load_model(args.model)
+        if model is None:
+            sys.exit(f"no model at {args.model}; run `train` first or pass --keywords")
+        predict, name = model.predict, "linear"
+
+    rows, local_ms, predictions = [], [], []
+    for record in test_set:
+        started = time.perf_counter()
+        label, confidence = predict(record["text"])
+        local_ms.append((time.perf_counter() - started) * 1000)
+        # A combined classify-and-analyze call says little about classification latency
+        llm_latency = record.get("llm_ms") if record.get("source", "classify") == "classify" else None
+        rows.append((label == record["label"], confidence, llm_latency))
+        predictions.append(label)
+    llm_ms = [ms for _, _, ms in rows if ms is not None]
+    llm_p50 = percentile(llm_ms, 0.5)
+
+    print(f"{name} classifier on {len(rows)} held-out documents")
+    print(f"accuracy (always local): {sum(ok for ok, _, _ in rows) / len(rows):.3f}")
+    print(f"local latency: p50 {percentile(local_ms, 0.5):.2f} ms, p95 {percentile(local_ms, 0.95):.2f} ms")
+    print(f"LLM latency:   p50 {llm_p50:.0f} ms, p95 {percentile(llm_ms, 0.95):.0f} ms ({len(llm_ms)} samples)")
+    print()
+    print(f"{'threshold':>9} {'local':>7} {'local acc':>9} {'overall acc':>11} {'mean ms':>8}")
+    mean_local = sum(local_ms) / len(local_ms)
+    for threshold in THRESHOLDS:
+        covered = [ok for ok, confidence, _ in rows if confidence >= threshold]
+        coverage = len(covered) / len(rows)
+        local_accuracy = sum(covered) / len(covered) if covered else float("nan")
+        # Documents below the threshold get the LLM's label, which is the reference here
+        overall = (sum(covered) + len(rows) - len(covered)) / len(rows)
+        mean_ms = mean_local + (1 - coverage) * llm_p50
+        marker = "  <- CLASSIFIER_MIN_CONFIDENCE" if threshold == classifier_service.CLASSIFIER_MIN_CONFIDENCE else ""
+        print(f"{threshold:>9.2f} {coverage:>7.1%} {local_accuracy:>9.3f} {overall:>11.3f} {mean_ms:>8.0f}{marker}")
+
+    print()
+    print("per label (always local): precision / recall")
+    for label in classifier_service.LABELS:
+        predicted = [prediction == label for prediction in predictions]
+        actual = [r["label"] == label for r in test_set]
+        true_positive = sum(p and a for p, a in zip(predicted, actual))
+        precision = true_positive / sum(predicted) if sum(predicted) else float("nan")
+        recall = true_positive / sum(actual) if sum(actual) else float("nan")
+        print(f"  {label:<24} {precision:.3f} / {recall:.3f}  (n={sum(actual)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["train", "eval"])
+    parser.add_argument("--labels", default=classifier_service.CLASSIFIER_LABEL_LOG)
+    parser.add_argument("--model", default=classifier_service.CLASSIFIER_MODEL_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of documents held out for eval")
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--keywords", action="store_true", help="evaluate keyword scoring instead of the model")
+    args = parser.parse_args()
+    if not os.path.exists(args.labels):
+        sys.exit(f"label log {args.labels} not found")
+    if args.command == "train":
+        train(args)
+    else:
+        evaluate(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# cache_service.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import asyncio
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from prompts import CLASSIFICATION_PROMPT, ANALYSIS_PROMPTS, COMBINED_PROMPT, SUMMARY_MERGE_PROMPT
+
+# Cache configuration
+CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "memory").lower()  # memory | sqlite | none
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+CACHE_SQLITE_PATH = os.getenv("ANALYSIS_CACHE_PATH", ".cache/analysis_cache.sqlite3")
+
+# Extraction cache configuration
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", ".cache/extraction")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Any edit to the prompts changes this version and invalidates old entries
+PROMPT_VERSION = hashlib.sha256(
+    "\x00".join([CLASSIFICATION_PROMPT, ANALYSIS_PROMPTS, COMBINED_PROMPT, SUMMARY_MERGE_PROMPT]).encode("utf-8")
+).hexdigest()[:16]
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run blocking I/O operations in executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+def hash_bytes(file_bytes: bytes) -> str:
+    """SHA-256 hex digest of the uploaded content."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(content_hash: str, model: str, prompt_version: str = PROMPT_VERSION) -> str:
+    """Build the cache key from the content hash, the LLM model and the prompt version."""
+    return f"{content_hash}:{model}:{prompt_version}"
+
+
+class MemoryCache:
+    """In-process LRU cache with size and TTL eviction."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl_seconds and time.time() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache backed by SQLite, evicting least recently used rows past max_entries."""
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE analysis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM analysis_cache WHERE key NOT IN "
+                "(SELECT key FROM analysis_cache ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM analysis_cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+
+class ExtractionCache:
+    """Persistent zlib-compressed store of extracted text, evicting least recently used files by total bytes."""
+
+    def __init__(self, directory: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._scan())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".zz")
+
+    def _scan(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".zz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return zlib.decompress(data).decode("utf-8")
+
+    def set(self, key: str, text: str) -> None:
+        data = zlib.compress(text.encode("utf-8"), 6)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self._lock:
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - previous
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(self._scan())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, path, _ in self._scan():
+                os.remove(path)
+            self._total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._scan())
+
+
+def _build_backend():
+    if CACHE_BACKEND == "none":
+        logging.info("Analysis cache disabled.")
+        return None
+    if CACHE_BACKEND == "sqlite":
+        try:
+            logging.info(f"Analysis cache using SQLite at: {CACHE_SQLITE_PATH}")
+            return SQLiteCache()
+        except Exception as e:
+            logging.warning(f"Failed to open SQLite cache: {e}. Falling back to in-memory cache.")
+    return MemoryCache()
+
+
+def _build_extraction_backend():
+    if not EXTRACTION_CACHE_ENABLED:
+        logging.info("Extraction cache disabled.")
+        return None
+    try:
+        return ExtractionCache()
+    except Exception as e:
+        logging.warning(f"Failed to open extraction cache at {EXTRACTION_CACHE_DIR}: {e}")
+        return None
+
+
+_backend = _build_backend()
+_stats = {"hits": 0, "misses": 0}
+_extraction_backend = _build_extraction_backend()
+_extraction_stats = {"hits": 0, "misses": 0}
+
+
+async def lookup(key: str) -> Optional[dict]:
+    """Look up a cached analysis, counting the hit or miss."""
+    if _backend is None:
+        return None
+    try:
+        value = await _run_blocking(_backend.get, key)
+    except Exception as e:
+        logging.warning(f"Cache lookup failed: {e}")
+        value = None
+    if value is None:
+        _stats["misses"] += 1
+    else:
+        _stats["hits"] += 1
+    return value
+
+
+async def store(key: str, value: dict) -> None:
+    """Store an analysis result. Failures are logged and never break the request."""
+    if _backend is None:
+        return
+    try:
+        await _run_blocking(_backend.set, key, value)
+    except Exception as e:
+        logging.warning(f"Cache store failed: {e}")
+
+
+async def lookup_extraction(key: str) -> Optional[str]:
+    """Look up previously extracted text, counting the hit or miss."""
+    if _extraction_backend is None:
+        return None
+    try:
+        text = await _run_blocking(_extraction_backend.get, key)
+    except Exception as e:
+        logging.warning(f"Extraction cache lookup failed: {e}")
+        text = None
+    if text is None:
+        _extraction_stats["misses"] += 1
+    else:
+        _extraction_stats["hits"] += 1
+    return text
+
+
+async def store_extraction(key: str, text: str) -> None:
+    """Store extracted text. Failures are logged and never break the request."""
+    if _extraction_backend is None:
+        return
+    try:
+        await _run_blocking(_extraction_backend.set, key, text)
+    except Exception as e:
+        logging.warning(f"Extraction cache store failed: {e}")
+
+
+def get_stats() -> dict:
+    """Hit/miss counters and backend details for the stats endpoint."""
+    size = 0
+    if _backend is not None:
+        try:
+            size = len(_backend)
+        except Exception as e:
+            logging.warning(f"Failed to read cache size: {e}")
+    if _backend is None:
+        backend = "none"
+    else:
+        backend = "sqlite" if isinstance(_backend, SQLiteCache) else "memory"
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        "backend": backend,
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "entries": size,
+        "max_entries": CACHE_MAX_ENTRIES,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+        "prompt_version": PROMPT_VERSION,
+        "extraction": {
+            "enabled": _extraction_backend is not None,
+            "hits": _extraction_stats["hits"],
+            "misses": _extraction_stats["misses"],
+            "bytes": _extraction_backend.total_bytes if _extraction_backend is not None else 0,
+            "max_bytes": EXTRACTION_CACHE_MAX_BYTES,
+        },
+    }
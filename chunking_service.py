@@ -0,0 +1,118 @@
+# chunking_service.py
+import os
+import re
+import math
+from collections import Counter
+from typing import List
+
+# Chunking configuration
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "12000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "200"))
+MAX_MERGED_KEY_POINTS = int(os.getenv("MAX_MERGED_KEY_POINTS", "10"))
+
+# Extractors separate PDF pages with a form feed
+PAGE_BREAK = "\f"
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate from character count; close enough for budgeting prompt size."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def needs_chunking(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> bool:
+    return estimate_tokens(text) > max_tokens
+
+
+def _split_units(text: str, max_tokens: int) -> List[str]:
+    """Break text into units no larger than max_tokens, preferring page, then paragraph, then line boundaries."""
+    units = []
+    for page in text.split(PAGE_BREAK):
+        if estimate_tokens(page) <= max_tokens:
+            units.append(page)
+            continue
+        for paragraph in _PARAGRAPH_RE.split(page):
+            if estimate_tokens(paragraph) <= max_tokens:
+                units.append(paragraph)
+                continue
+            for line in paragraph.split("\n"):
+                if estimate_tokens(line) <= max_tokens:
+                    units.append(line)
+                    continue
+                # A single enormous line: hard split on characters
+                step = int(max_tokens * CHARS_PER_TOKEN)
+                units.extend(line[i:i + step] for i in range(0, len(line), step))
+    return [unit.strip() for unit in units if unit.strip()]
+
+
+def split_text(text: str, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Pack boundary-aligned units into chunks of at most max_tokens.
+
+    Each chunk after the first starts with trailing units of the previous chunk, up to
+    overlap_tokens, so facts spanning a boundary are seen whole by at least one chunk.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in _split_units(text, max_tokens):
+        unit_tokens = estimate_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            overlap, overlap_size = [], 0
+            for previous in reversed(current):
+                size = estimate_tokens(previous)
+                if overlap_size + size > overlap_tokens or overlap_size + size + unit_tokens > max_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += size
+            current, current_tokens = overlap, overlap_size
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _normalize(value: str) -> str:
+    return _NORMALIZE_RE.sub(" ", str(value).lower()).strip()
+
+
+def merge_analyses(results: List[dict], doc_type: str) -> dict:
+    """Merge per-chunk analyses into the single-document response shape.
+
+    document_type is the most common chunk answer; key_points and deadlines are
+    de-duplicated in chunk order. summary is the first chunk's and is normally
+    replaced by a merged summary by the caller.
+    """
+    results = [r for r in results if isinstance(r, dict)]
+    types = Counter(r.get("document_type") for r in results if r.get("document_type"))
+    document_type = types.most_common(1)[0][0] if types else doc_type
+
+    key_points, seen_points = [], set()
+    deadlines, seen_deadlines = [], set()
+    for result in results:
+        for point in result.get("key_points") or []:
+            key = _normalize(point)
+            if key and key not in seen_points:
+                seen_points.add(key)
+                key_points.append(point)
+        for deadline in result.get("deadlines") or []:
+            if not isinstance(deadline, dict):
+                continue
+            key = (str(deadline.get("date", "")).strip(), _normalize(deadline.get("description", "")))
+            if key not in seen_deadlines:
+                seen_deadlines.add(key)
+                deadlines.append(deadline)
+    deadlines.sort(key=lambda d: str(d.get("date", "")))
+
+    summaries = [r.get("summary") for r in results if r.get("summary")]
+    return {
+        "document_type": document_type,
+        "summary": summaries[0] if summaries else "",
+        "key_points": key_points[:MAX_MERGED_KEY_POINTS],
+        "deadlines": deadlines,
+    }
@@ -0,0 +1,299 @@
+# classifier_service.py
+import os
+import re
+import json
+import math
+import zlib
+import random
+import logging
+import asyncio
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+# Labels offered by CLASSIFICATION_PROMPT, in prompt order
+LABELS = ["Invoice", "BalanceSheet", "ProfitAndLossStatement", "Contract", "GeneralDocument"]
+
+# Local classifier configuration
+CLASSIFIER_ENABLED = os.getenv("CLASSIFIER_ENABLED", "true").lower() == "true"
+CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", ".cache/classifier_model.json")
+# Keyword scoring is not calibrated (a contract that mentions "invoice" a few times scores
+# ~0.99 Invoice), so without a trained model every document goes to the LLM unless enabled
+CLASSIFIER_KEYWORD_FALLBACK = os.getenv("CLASSIFIER_KEYWORD_FALLBACK", "false").lower() == "true"
+# LLM classifications can be appended here as training data for `benchmarks/train_classifier.py`.
+# Records hold the start of each document's text, so collection is off unless enabled
+CLASSIFIER_LABEL_LOG = os.getenv("CLASSIFIER_LABEL_LOG", ".cache/classifier_labels.jsonl")
+CLASSIFIER_COLLECT_LABELS = os.getenv("CLASSIFIER_COLLECT_LABELS", "false").lower() == "true"
+# The log is rotated to CLASSIFIER_LABEL_LOG + ".1" (replacing the previous one) at this size
+CLASSIFIER_LABEL_LOG_MAX_BYTES = int(os.getenv("CLASSIFIER_LABEL_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+# While collecting, this share of locally classified documents still goes to the LLM, so the
+# labels also cover documents the model is confident about
+CLASSIFIER_AUDIT_RATE = float(os.getenv("CLASSIFIER_AUDIT_RATE", "0.05"))
+# Local predictions below this probability fall through to the LLM
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.85"))
+
+# Same prefix the LLM classification prompt sees
+MAX_CHARS = 4000
+FEATURE_BITS = 18
+FEATURE_DIM = 1 << FEATURE_BITS
+
+_WORD_RE = re.compile(r"[a-z]+|\d+")
+
+# Fallback scoring until a model has been trained: (pattern, weight) per label
+_KEYWORDS = {
+    "Invoice": [
+        (r"\binvoice\b", 3.0), (r"\binvoice (no|number|#)", 2.0), (r"\bbill to\b", 2.0),
+        (r"\bamount due\b", 2.0), (r"\bdue date\b", 1.0), (r"\bsubtotal\b", 1.5),
+        (r"\b(vat|tax)\b", 0.5), (r"\bqty\b|\bquantity\b", 1.0), (r"\bunit price\b", 1.5),
+        (r"\bpayment terms\b", 1.0), (r"\bfactuur\b|\brechnung\b|\bfactura\b", 3.0),
+    ],
+    "BalanceSheet": [
+        (r"\bbalance sheet\b", 4.0), (r"\btotal assets\b", 2.5), (r"\btotal liabilities\b", 2.5),
+        (r"\bcurrent assets\b", 1.5), (r"\bnon-current\b", 1.0), (r"\bshareholders'? equity\b", 2.0),
+        (r"\bretained earnings\b", 1.0), (r"\baccounts payable\b", 0.5), (r"\bbalans\b|\bbilanz\b", 3.0),
+    ],
+    "ProfitAndLossStatement": [
+        (r"\bprofit and loss\b|\bp&l\b|\bincome statement\b", 4.0), (r"\bgross profit\b", 2.0),
+        (r"\bnet (income|profit|loss)\b", 2.0), (r"\boperating (income|expenses)\b", 1.5),
+        (r"\bcost of (goods sold|sales)\b", 2.0), (r"\brevenue\b", 1.0), (r"\bebitda\b", 1.5),
+        (r"\bwinst-?\s?en-?\s?verlies\b|\bgewinn- und verlust\b", 4.0),
+    ],
+    "Contract": [
+        (r"\bagreement\b", 2.0), (r"\bcontract\b", 2.0), (r"\bhereinafter\b", 2.0),
+        (r"\bparties\b", 1.0), (r"\bterm(ination)?\b", 0.5), (r"\bgoverning law\b", 2.0),
+        (r"\bin witness whereof\b", 2.5), (r"\bshall\b", 0.3), (r"\bindemnif", 1.5),
+        (r"\bconfidential(ity)?\b", 0.5), (r"\bovereenkomst\b|\bvertrag\b", 3.0),
+    ],
+}
+_KEYWORD_PATTERNS = {label: [(re.compile(p), w) for p, w in rules] for label, rules in _KEYWORDS.items()}
+# GeneralDocument's score: what a document needs to beat to get a specific label
+_KEYWORD_BASELINE = 2.0
+
+
+def features(text: str) -> dict:
+    """Hashed word unigram and bigram counts (log-scaled, L2-normalised) of the text's first MAX_CHARS."""
+    words = _WORD_RE.findall(text[:MAX_CHARS].lower())
+    counts = {}
+    for i, word in enumerate(words):
+        grams = (word,) if i == 0 else (word, words[i - 1] + " " + word)
+        for gram in grams:
+            index = zlib.crc32(gram.encode("utf-8")) & (FEATURE_DIM - 1)
+            counts[index] = counts.get(index, 0) + 1
+    if not counts:
+        return {}
+    scaled = {index: 1.0 + math.log(count) for index, count in counts.items()}
+    norm = math.sqrt(sum(value * value for value in scaled.values()))
+    return {index: value / norm for index, value in scaled.items()}
+
+
+def _softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+
+class LinearModel:
+    """Multinomial logistic regression over hashed n-gram features, with sparse weights."""
+
+    def __init__(self, labels: List[str] = LABELS, weights: Optional[List[dict]] = None,
+                 bias: Optional[List[float]] = None):
+        self.labels = list(labels)
+        self.weights = weights or [{} for _ in self.labels]
+        self.bias = bias or [0.0] * len(self.labels)
+
+    def probabilities(self, feats: dict) -> List[float]:
+        scores = [
+            self.bias[k] + sum(value * weights.get(index, 0.0) for index, value in feats.items())
+            for k, weights in enumerate(self.weights)
+        ]
+        return _softmax(scores)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        probs = self.probabilities(features(text))
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.labels[best], probs[best]
+
+    def fit(self, examples: List[Tuple[str, str]], epochs: int = 10, learning_rate: float = 0.5,
+            l2: float = 1e-5, seed: int = 0) -> "LinearModel":
+        """Train with SGD on (text, label) pairs; labels outside self.labels are ignored."""
+        index_of = {label: k for k, label in enumerate(self.labels)}
+        data = [(features(text), index_of[label]) for text, label in examples if label in index_of]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch)
+            for feats, target in data:
+                probs = self.probabilities(feats)
+                for k, weights in enumerate(self.weights):
+                    gradient = probs[k] - (1.0 if k == target else 0.0)
+                    if abs(gradient) < 1e-4:
+                        continue
+                    self.bias[k] -= rate * gradient
+                    for index, value in feats.items():
+                        weight = weights.get(index, 0.0)
+                        weights[index] = weight - rate * (gradient * value + l2 * weight)
+        for weights in self.weights:  # drop near-zero weights to keep the model file small
+            for index in [index for index, weight in weights.items() if abs(weight) < 1e-4]:
+                del weights[index]
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "feature_bits": FEATURE_BITS,
+            "labels": self.labels,
+            "bias": self.bias,
+            "weights": [{str(index): round(weight, 6) for index, weight in weights.items()} for weights in self.weights],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinearModel":
+        if data.get("feature_bits") != FEATURE_BITS:
+            raise ValueError(f"Model uses {data.get('feature_bits')} feature bits, expected {FEATURE_BITS}")
+        weights = [{int(index): weight for index, weight in weights.items()} for weights in data["weights"]]
+        return cls(data["labels"], weights, data["bias"])
+
+
+def keyword_predict(text: str) -> Tuple[str, float]:
+    """Keyword scoring used before a model has been trained. Returns (label, pseudo-probability)."""
+    text = text[:MAX_CHARS].lower()
+    scores = [
+        sum(weight * min(3, len(pattern.findall(text))) for pattern, weight in _KEYWORD_PATTERNS[label])
+        for label in LABELS[:-1]
+    ]
+    scores.append(_KEYWORD_BASELINE)
+    probs = _softmax(scores)
+    best = max(range(len(probs)), key=probs.__getitem__)
+    return LABELS[best], probs[best]
+
+
+def save_model(model: LinearModel, path: str = CLASSIFIER_MODEL_PATH) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def load_model(path: str = CLASSIFIER_MODEL_PATH) -> Optional[LinearModel]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return LinearModel.from_dict(json.load(f))
+
+
+def read_labels(path: str = CLASSIFIER_LABEL_LOG) -> Iterable[dict]:
+    """Records of the label log and its rotated predecessor, oldest first.
+
+    Records are {"text", "label", "llm_ms", "source"}; unreadable lines are skipped.
+    """
+    for log_path in (f"{path}.1", path):
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("text") and record.get("label") in LABELS:
+                    yield record
+
+
+def _build_model() -> Optional[LinearModel]:
+    if not CLASSIFIER_ENABLED:
+        logging.info("Local document classifier disabled.")
+        return None
+    try:
+        model = load_model()
+    except Exception as e:
+        logging.warning(f"Failed to load classifier model from {CLASSIFIER_MODEL_PATH}: {e}")
+        return None
+    if model is None:
+        if CLASSIFIER_KEYWORD_FALLBACK:
+            logging.info("No trained classifier model; using keyword scoring.")
+        else:
+            logging.info("No trained classifier model; every document is classified by the LLM.")
+    return model
+
+
+_model = _build_model()
+_label_lock = threading.Lock()
+_stats = {"local": 0, "fallthrough": 0, "audited": 0, "labels_recorded": 0}
+
+
+def predict(text: str) -> Optional[Tuple[str, float]]:
+    """Local (label, confidence) from the trained model, or keyword scoring when enabled; None otherwise."""
+    if _model is not None:
+        return _model.predict(text)
+    if CLASSIFIER_KEYWORD_FALLBACK:
+        return keyword_predict(text)
+    return None
+
+
+def classify(text: str) -> Optional[dict]:
+    """{"document_type": label} when the local classifier is confident enough, else None.
+
+    Takes a few milliseconds, so it runs inline on the event loop.
+    """
+    if not CLASSIFIER_ENABLED or not text:
+        return None
+    prediction = predict(text)
+    if prediction is None:
+        return None
+    label, confidence = prediction
+    if confidence < CLASSIFIER_MIN_CONFIDENCE:
+        _stats["fallthrough"] += 1
+        return None
+    if CLASSIFIER_COLLECT_LABELS and random.random() < CLASSIFIER_AUDIT_RATE:
+        _stats["audited"] += 1
+        return None
+    _stats["local"] += 1
+    logging.info(f"Classified locally as {label} ({confidence:.2f})")
+    return {"document_type": label}
+
+
+def _append_label(record: dict) -> None:
+    path = CLASSIFIER_LABEL_LOG
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record) + "\n"
+    with _label_lock:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if CLASSIFIER_LABEL_LOG_MAX_BYTES > 0 and size and size + len(line) > CLASSIFIER_LABEL_LOG_MAX_BYTES:
+            os.replace(path, f"{path}.1")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+async def record_label(text: str, label: str, llm_ms: Optional[float] = None, source: str = "classify") -> None:
+    """Keep an LLM classification as training data. Failures are logged and never break the request.
+
+    source is "classify" for the classification call or "single" for the combined call, whose
+    llm_ms also covers the analysis.
+    """
+    if not CLASSIFIER_COLLECT_LABELS or not text or label not in LABELS:
+        return
+    record = {"text": text[:MAX_CHARS], "label": label, "llm_ms": llm_ms, "source": source}
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _append_label, record)
+        _stats["labels_recorded"] += 1
+    except Exception as e:
+        logging.warning(f"Failed to record classifier label: {e}")
+
+
+def get_stats() -> dict:
+    decided = _stats["local"] + _stats["fallthrough"]
+    return {
+        "enabled": CLASSIFIER_ENABLED,
+        "model": "linear" if _model is not None else ("keywords" if CLASSIFIER_KEYWORD_FALLBACK else None),
+        "min_confidence": CLASSIFIER_MIN_CONFIDENCE,
+        "collect_labels": CLASSIFIER_COLLECT_LABELS,
+        **_stats,
+        "local_rate": round(_stats["local"] / decided, 4) if decided else None,
+    }
@@ -0,0 +1,148 @@
+# docx_service.py
+import os
+import re
+import logging
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from typing import List, Tuple
+
+# Embedded images OCR'd when a document has no text of its own
+DOCX_MAX_OCR_IMAGES = int(os.getenv("DOCX_MAX_OCR_IMAGES", "20"))
+OCR_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif")
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+
+_PARAGRAPH = W + "p"
+_TABLE = W + "tbl"
+_ROW = W + "tr"
+_CELL = W + "tc"
+_TEXT = W + "t"
+_TAB = W + "tab"
+_BREAKS = (W + "br", W + "cr")
+_BODY = W + "body"
+
+_HEADER_RE = re.compile(r"^word/header\d*\.xml$")
+_FOOTER_RE = re.compile(r"^word/footer\d*\.xml$")
+
+
+class _PartReader:
+    """Turns one WordprocessingML part into lines while it is being parsed.
+
+    Paragraphs become lines and table rows become "| cell | cell |" lines, in document
+    order. Elements are cleared as soon as they have been read, so memory stays
+    bounded by the largest single paragraph or table row.
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.paragraphs = []  # text buffers of open paragraphs (text boxes nest inside paragraphs)
+        self.rows = []        # cells of open table rows (tables can nest inside cells)
+        self.cells = []       # paragraph texts of open cells
+        self.fallback_depth = 0
+
+    def _emit(self, text: str) -> None:
+        if self.cells:
+            self.cells[-1].append(text)
+        elif text:
+            self.lines.append(text)
+
+    def read(self, stream) -> List[str]:
+        parents = []
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                parents.append(elem)
+                if tag == MC_FALLBACK:
+                    self.fallback_depth += 1  # same content as the mc:Choice branch; skip the duplicate
+                elif self.fallback_depth:
+                    continue
+                elif tag == _PARAGRAPH:
+                    self.paragraphs.append([])
+                elif tag == _ROW:
+                    self.rows.append([])
+                elif tag == _CELL:
+                    self.cells.append([])
+                continue
+
+            parents.pop()
+            if tag == MC_FALLBACK:
+                self.fallback_depth -= 1
+            elif self.fallback_depth:
+                pass
+            elif tag == _TEXT and self.paragraphs:
+                self.paragraphs[-1].append(elem.text or "")
+            elif tag == _TAB and self.paragraphs:
+                self.paragraphs[-1].append("\t")
+            elif tag in _BREAKS and self.paragraphs:
+                self.paragraphs[-1].append("\n")
+            elif tag == _PARAGRAPH and self.paragraphs:
+                self._emit("".join(self.paragraphs.pop()).strip())
+            elif tag == _CELL and self.cells:
+                cell = " ".join(" ".join(text.split()) for text in self.cells.pop() if text)
+                if self.rows:
+                    self.rows[-1].append(cell.replace("|", "\\|"))
+            elif tag == _ROW and self.rows:
+                cells = self.rows.pop()
+                if any(cells):
+                    self._emit("| " + " | ".join(cells) + " |")
+            elif tag == _TABLE and not self.cells:
+                self.lines.append("")  # blank line after a top-level table
+
+            if tag in (_PARAGRAPH, _TABLE, _ROW, _CELL):
+                elem.clear()
+                if parents and parents[-1].tag == _BODY:
+                    parents[-1].remove(elem)
+        return self.lines
+
+
+def _read_part(archive: zipfile.ZipFile, name: str) -> str:
+    with archive.open(name) as stream:
+        lines = _PartReader().read(stream)
+    return "\n".join(lines).strip()
+
+
+def _image_targets(archive: zipfile.ZipFile) -> List[str]:
+    """Archive paths of images referenced by the main document, in relationship order."""
+    try:
+        with archive.open("word/_rels/document.xml.rels") as stream:
+            relationships = ET.parse(stream).getroot().iter(REL)
+            targets = [rel.get("Target", "") for rel in relationships if rel.get("Type", "").endswith("/image")]
+    except KeyError:
+        targets = []
+    names = set(archive.namelist())
+    paths = [posixpath.normpath(posixpath.join("word", target)) for target in targets if "://" not in target]
+    if not paths:  # no relationships part: fall back to whatever media is in the package
+        paths = sorted(name for name in names if name.startswith("word/media/"))
+    return [path for path in dict.fromkeys(paths) if path in names and path.lower().endswith(OCR_IMAGE_EXTENSIONS)]
+
+
+def extract_docx(file_path: str) -> Tuple[str, List[str]]:
+    """Text of a .docx file: headers, body and footers, footnotes and endnotes.
+
+    Blocking; run it in an executor. Returns (text, image_paths); image_paths lists the
+    archive members of embedded images to OCR and is only filled when there is no text.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        headers = sorted(name for name in names if _HEADER_RE.match(name))
+        footers = sorted(name for name in names if _FOOTER_RE.match(name))
+        notes = [name for name in ("word/footnotes.xml", "word/endnotes.xml") if name in names]
+
+        sections = []
+        for name in headers + ["word/document.xml"] + footers + notes:
+            text = _read_part(archive, name)
+            # Default, first-page and even-page headers often repeat the same text
+            if text and text not in sections:
+                sections.append(text)
+        text = "\n\n".join(sections)
+        images = [] if text.strip() else _image_targets(archive)[:DOCX_MAX_OCR_IMAGES]
+    logging.info(f"Extracted {len(text)} characters from {len(sections)} DOCX parts; {len(images)} images to OCR.")
+    return text, images
+
+
+def read_member(file_path: str, name: str) -> bytes:
+    with zipfile.ZipFile(file_path) as archive:
+        return archive.read(name)
@@ -1,102 +1,230 @@
 import os
 import json
+import time
 import logging
 import asyncio
-from typing import Optional
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
-try:
-    import google.generativeai as genai
-except Exception as import_error:  # pragma: no cover
-    genai = None
-    logging.error(f"Failed to import google-generativeai: {import_error}")
+from chunking_service import estimate_tokens
+from prompts import CLASSIFICATION_PROMPT, ANALYSIS_PROMPTS, COMBINED_PROMPT, SUMMARY_MERGE_PROMPT
+import llm_resilience
+import cache_service
+import metrics_service
 
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_RPM_LIMIT = int(os.getenv("GEMINI_RPM_LIMIT", "1000"))
+GEMINI_TPM_LIMIT = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+# Threads for the few SDK calls that have no async variant (file upload, image decoding)
+GEMINI_BLOCKING_WORKERS = int(os.getenv("GEMINI_BLOCKING_WORKERS", "4"))
+# Uploaded files expire on Google's side after 48 hours; reuse handles for a little less
+GEMINI_FILE_TTL_SECONDS = int(os.getenv("GEMINI_FILE_TTL_SECONDS", str(47 * 3600)))
+GEMINI_FILE_CACHE_MAX = int(os.getenv("GEMINI_FILE_CACHE_MAX", "512"))
+
+_caller = llm_resilience.ResilientCaller("gemini", GEMINI_RPM_LIMIT, GEMINI_TPM_LIMIT)
+
+
+def get_stats() -> dict:
+    return _caller.get_stats()
+
+
+def is_configured() -> bool:
+    return bool(GEMINI_API_KEY) and _genai() is not None
+
+
+def is_available() -> bool:
+    """Configured and not failing fast behind an open circuit breaker."""
+    return is_configured() and _caller.breaker.state != llm_resilience.CircuitBreaker.OPEN
+
+
+_configure_lock = threading.Lock()
+_configured = False
+_sdk = None
+_sdk_error = None
+_models = {}
+_executor = ThreadPoolExecutor(max_workers=max(1, GEMINI_BLOCKING_WORKERS), thread_name_prefix="gemini")
+_uploaded_files = OrderedDict()  # content hash -> (uploaded_at, file handle)
+
+
+def _genai():
+    """The google.generativeai module, imported on first use (it is slow to import); None if not installed."""
+    global _sdk, _sdk_error
+    if _sdk is None and _sdk_error is None:
+        try:
+            import google.generativeai as genai
+            _sdk = genai
+        except Exception as import_error:  # pragma: no cover
+            _sdk_error = import_error
+            logging.error(f"Failed to import google-generativeai: {import_error}")
+    return _sdk
 
 
 def _ensure_client_configured() -> None:
+    global _configured
+    if _configured:
+        return
+    genai = _genai()
     if genai is None:
         raise RuntimeError("google-generativeai is not installed. Add 'google-generativeai' to requirements.txt")
     if not GEMINI_API_KEY:
         raise RuntimeError("GEMINI_API_KEY (or GOOGLE_API_KEY) is not set in environment.")
-    genai.configure(api_key=GEMINI_API_KEY)
+    with _configure_lock:
+        if not _configured:
+            genai.configure(api_key=GEMINI_API_KEY)
+            _configured = True
+            logging.info(f"Gemini client configured for model: {GEMINI_MODEL}")
+
+
+def init_client() -> None:
+    """Configure the SDK and build the long-lived models once, at startup."""
+    if not is_configured():
+        return
+    _get_model()
+    _get_model(response_mime_type="application/json")
 
 
 def _get_model(response_mime_type: Optional[str] = None):
-    _ensure_client_configured()
-    generation_config = None
-    if response_mime_type:
-        generation_config = {"response_mime_type": response_mime_type}
-    return genai.GenerativeModel(model_name=GEMINI_MODEL, generation_config=generation_config)
+    """Long-lived GenerativeModel per generation config."""
+    model = _models.get(response_mime_type)
+    if model is None:
+        _ensure_client_configured()
+        generation_config = None
+        if response_mime_type:
+            generation_config = {"response_mime_type": response_mime_type}
+        model = _genai().GenerativeModel(model_name=GEMINI_MODEL, generation_config=generation_config)
+        _models[response_mime_type] = model
+    return model
 
 
 async def _run_blocking(func, *args, **kwargs):
+    """Run an unavoidable blocking SDK call on the dedicated, bounded Gemini executor."""
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+    return await loop.run_in_executor(_executor, lambda: func(*args, **kwargs))
 
 
-async def classify_document(text: str) -> dict:
-    """Classify document type using Gemini, returning {"document_type": str}."""
-    logging.info("Classifying document type with Gemini...")
-    prompt = (
-        "Analyze the following text and respond ONLY with a JSON object containing a single "
-        "'document_type' key. Choose from: 'Invoice', 'BalanceSheet', 'ProfitAndLossStatement', "
-        "'Contract', 'GeneralDocument'. Example: {\"document_type\": \"Invoice\"}.\n\n" 
-        + (text[:4000] if text else "")
-    )
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _record_usage(response) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics_service.record_tokens(
+            "gemini", getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0)
+        )
+
+
+async def _generate_json(system_prompt: str, content: str, description: str):
+    """Send one JSON-mode generation through the resilient caller and parse the reply."""
     model = _get_model(response_mime_type="application/json")
 
-    def _invoke():
-        return model.generate_content(prompt)
+    async def _request():
+        response = await model.generate_content_async([system_prompt, content])
+        _record_usage(response)
+        text = (response.text or "").strip()
+        return json.loads(text) if text else {}
+
+    return await _caller.call(_request, estimate_tokens(system_prompt) + estimate_tokens(content), description)
+
+
+async def _stream_json(system_prompt: str, content: str, description: str) -> AsyncIterator[str]:
+    """Yield the text of a streamed JSON-mode generation as it arrives.
 
-    response = await _run_blocking(_invoke)
-    content = (response.text or "").strip()
+    Opening the stream goes through the resilient caller; once text has been yielded
+    nothing is retried, and a failure mid-stream raises LLMCallError.
+    """
+    model = _get_model(response_mime_type="application/json")
+
+    async def _open():
+        return await model.generate_content_async([system_prompt, content], stream=True)
+
+    response = await _caller.call(_open, estimate_tokens(system_prompt) + estimate_tokens(content), description)
     try:
-        data = json.loads(content) if content else {}
-        if isinstance(data, dict) and "document_type" in data:
-            return {"document_type": data["document_type"]}
-        return {"document_type": str(data) or "GeneralDocument"}
+        async for chunk in response:
+            text = getattr(chunk, "text", "")
+            if text:
+                yield text
+        _record_usage(response)
     except Exception as e:
-        logging.warning(f"Gemini classification parse error: {e}; raw={content[:200]}")
-        return {"document_type": "GeneralDocument"}
+        kind = llm_resilience.classify_error(e)
+        raise llm_resilience.LLMCallError(f"gemini {description} failed mid-stream ({kind}): {e}", "gemini", kind) from e
+
+
+async def classify_document(text: str) -> dict:
+    """Classify document type using Gemini, returning {"document_type": str}. Raises LLMCallError on failure."""
+    logging.info("Classifying document type with Gemini...")
+    data = await _generate_json(CLASSIFICATION_PROMPT, text[:4000] if text else "", "classification")
+    if isinstance(data, dict) and "document_type" in data:
+        return {"document_type": data["document_type"]}
+    return {"document_type": str(data) or "GeneralDocument"}
 
 
 async def analyze_document_by_type(text: str, doc_type: str) -> dict:
-    """Analyze document and return structured JSON summary using Gemini."""
+    """Analyze document with the shared analysis prompt using Gemini. Raises LLMCallError on failure.
+
+    Uses the same prompt and response shape as openai_service so the two backends are interchangeable.
+    """
     logging.info(f"Analyzing document with Gemini. Type hint: {doc_type}")
-    system_instructions = (
-        "You are an expert document analysis AI. Respond ONLY with a valid JSON object. "
-        "Include: 'language', 'document_type', 1-3 sentence 'summary', and 'extracted_data'"
-        " object with key-value pairs explicitly present in the text."
-    )
-
-    prompt = (
-        f"Document type hint: {doc_type}.\n\n"
-        "Analyze the following text. Return JSON in the structure:\n"
-        "{\n  \"language\": \"English\",\n  \"document_type\": \"Invoice\",\n  \"summary\": \"...\",\n  \"extracted_data\": {\n    \"Invoice Number\": \"...\"\n  }\n}\n\n"
-        + (text or "")
-    )
+    data = await _generate_json(ANALYSIS_PROMPTS, text or "", "analysis")
+    if isinstance(data, dict):
+        return data
+    return {"document_type": doc_type, "summary": str(data), "key_points": [], "deadlines": []}
 
-    model = _get_model(response_mime_type="application/json")
 
-    def _invoke():
-        return model.generate_content([system_instructions, prompt])
+async def stream_analysis(text: str, doc_type: str) -> AsyncIterator[str]:
+    """Analysis with the shared prompt, yielding the JSON text as Gemini generates it."""
+    logging.info(f"Streaming document analysis with Gemini. Type hint: {doc_type}")
+    async for delta in _stream_json(ANALYSIS_PROMPTS, text or "", "analysis stream"):
+        yield delta
+
+
+async def classify_and_analyze(text: str) -> tuple:
+    """Classify and analyze in a single Gemini request. Returns (classification, analysis) dicts."""
+    logging.info("Classifying and analyzing document in one Gemini request...")
+    data = await _generate_json(COMBINED_PROMPT, text or "", "combined analysis")
+    if isinstance(data, dict):
+        category = data.pop("category", None) or data.get("document_type", "GeneralDocument")
+        return {"document_type": category}, data
+    return {"document_type": "GeneralDocument"}, {"document_type": "GeneralDocument", "summary": str(data), "key_points": [], "deadlines": []}
+
 
-    response = await _run_blocking(_invoke)
-    content = (response.text or "").strip()
+async def merge_summaries(summaries: list) -> str:
+    """Reduce step for chunked analysis: merge per-section summaries into one."""
+    sections = "\n".join(f"{i}. {summary}" for i, summary in enumerate(summaries, 1))
     try:
-        data = json.loads(content) if content else {}
-        if isinstance(data, dict):
-            return data
-        return {"analysis_output": str(data)}
-    except Exception as e:
-        logging.warning(f"Gemini analysis parse error: {e}; raw={content[:200]}")
-        return {"error": "Failed to analyze document."}
+        data = await _generate_json(SUMMARY_MERGE_PROMPT, sections, "summary merge")
+    except llm_resilience.LLMCallError as e:
+        logging.warning(f"Gemini summary merge failed: {e}. Using the first section summary.")
+        return summaries[0]
+    if isinstance(data, dict) and data.get("summary"):
+        return str(data["summary"])
+    return summaries[0]
+
+
+async def _get_uploaded_file(file_path: str, file_bytes: Optional[bytes], mime_type: Optional[str]):
+    """Upload a file once per content hash and reuse the handle until it nears expiry."""
+    if file_bytes:
+        content_hash = cache_service.hash_bytes(file_bytes)
+    else:
+        content_hash = await _run_blocking(cache_service.hash_file, file_path)
+
+    entry = _uploaded_files.get(content_hash)
+    if entry is not None and time.time() - entry[0] < GEMINI_FILE_TTL_SECONDS:
+        _uploaded_files.move_to_end(content_hash)
+        logging.info(f"Reusing Gemini file upload for content {content_hash[:12]}")
+        return entry[1]
+
+    source = BytesIO(file_bytes) if file_bytes else file_path
+    uploaded = await _run_blocking(_genai().upload_file, path=source, mime_type=mime_type)
+    _uploaded_files[content_hash] = (time.time(), uploaded)
+    while len(_uploaded_files) > GEMINI_FILE_CACHE_MAX:
+        _uploaded_files.popitem(last=False)
+    return uploaded
 
 
 async def extract_text_from_file(file_path: str, file_bytes: bytes, mime_type: Optional[str]) -> str:
@@ -104,43 +232,37 @@ async def extract_text_from_file(file_path: str, file_bytes: bytes, mime_type: O
     logging.info(f"Extracting text with Gemini from file: {file_path}")
     model = _get_model()
 
-    def _upload_and_generate():
+    async def _upload_and_generate():
         # For images, use direct content generation instead of file upload
         if file_bytes and mime_type and mime_type.startswith('image/'):
-            from io import BytesIO
             from PIL import Image
             try:
                 # Convert bytes to PIL Image
-                image = Image.open(BytesIO(file_bytes))
-                prompt = (
-                    "Extract the plain textual content from this image. "
-                    "Return ONLY the extracted text with no additional commentary."
-                )
-                resp = model.generate_content([prompt, image])
-                return (resp.text or "").strip()
+                image = await _run_blocking(lambda: Image.open(BytesIO(file_bytes)).copy())
             except Exception as e:
                 logging.error(f"Error processing image with PIL: {e}")
                 return ""
+            prompt = (
+                "Extract the plain textual content from this image. "
+                "Return ONLY the extracted text with no additional commentary."
+            )
+            resp = await model.generate_content_async([prompt, image])
+            _record_usage(resp)
+            return (resp.text or "").strip()
         else:
             # For other file types, use file upload
-            if file_bytes:
-                from io import BytesIO
-                file_obj = BytesIO(file_bytes)
-                uploaded = genai.upload_file(path=file_obj, mime_type=mime_type)
-            else:
-                uploaded = genai.upload_file(path=file_path, mime_type=mime_type)
+            uploaded = await _get_uploaded_file(file_path, file_bytes, mime_type)
             prompt = (
                 "Extract the plain textual content from the provided file. "
                 "Return ONLY the extracted text with no additional commentary."
             )
-            resp = model.generate_content([prompt, uploaded])
+            resp = await model.generate_content_async([prompt, uploaded])
+            _record_usage(resp)
             return (resp.text or "").strip()
 
     try:
-        text = await _run_blocking(_upload_and_generate)
+        text = await _caller.call(_upload_and_generate, 0, "text extraction")
         return text
     except Exception as e:
         logging.error(f"Gemini extract_text_from_file error: {e}")
         return ""
-
-
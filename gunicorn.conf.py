@@ -0,0 +1,18 @@
+# gunicorn.conf.py
+# Picked up by start.sh. Worker count, bind address and timeout stay on its command line.
+
+
+def on_starting(server):
+    """Import the libraries selected by WARMUP_EXTRACTORS in the master, before any worker forks.
+
+    Forked workers inherit the loaded modules and share their pages copy-on-write, so
+    each one starts faster and adds less RSS. Only the spreadsheet and LLM libraries,
+    which run inside the workers, can be preloaded; PDF and OCR work happens in spawned
+    process pools that import their own copies. Only libraries are preloaded: the app
+    itself (SQLite connections, thread pools, LLM clients) is still built per worker.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    import startup_service
+    startup_service.preload()
@@ -0,0 +1,301 @@
+# job_service.py
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+# Job subsystem configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+# Web worker processes (set by start.sh, read by gunicorn). Each runs its own queue and job
+# workers, so with more than one the store must be shared or a status poll can miss the job
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+JOB_STORE_BACKEND = os.getenv("JOB_STORE_BACKEND", "sqlite" if WEB_CONCURRENCY > 1 else "memory").lower()  # memory | sqlite
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite3")
+JOB_STORE_MAX_JOBS = int(os.getenv("JOB_STORE_MAX_JOBS", "10000"))
+# Unfinished jobs carry a lease renewed by their process; once it lapses the process is
+# presumed dead and the job is marked failed by whichever worker notices first
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+INCOMPLETE = (QUEUED, RUNNING)
+
+# Stage statuses
+PENDING = "pending"
+DONE = "done"
+SKIPPED = "skipped"
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run blocking I/O operations in executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+class MemoryJobStore:
+    """In-process job store keeping the most recent JOB_STORE_MAX_JOBS jobs."""
+
+    def __init__(self, max_jobs: int = JOB_STORE_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def put(self, job: dict) -> None:
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            while len(self._jobs) > self.max_jobs:
+                # Evict the oldest finished job; queued and running ones are kept even over the limit
+                oldest = next((job_id for job_id, stored in self._jobs.items() if stored["status"] not in INCOMPLETE), None)
+                if oldest is None:
+                    break
+                del self._jobs[oldest]
+
+    def renew(self, owner: str) -> None:
+        pass  # only this process can see the jobs
+
+    def fail_stale(self, error: str) -> int:
+        return 0  # nothing survives a restart
+
+
+class SQLiteJobStore:
+    """Job store persisted to SQLite so status and results survive restarts."""
+
+    def __init__(self, path: str = JOB_STORE_PATH, max_jobs: int = JOB_STORE_MAX_JOBS):
+        self.path = path
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shared by every web worker; wait for another process's write rather than failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, data TEXT NOT NULL, "
+            "owner TEXT, lease_until REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:  # stores created before leases existed
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, job: dict) -> None:
+        lease_until = time.time() + JOB_LEASE_SECONDS if job["status"] in INCOMPLETE else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, created_at, data, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?)",
+                (job["id"], job["status"], job["created_at"], json.dumps(job), job.get("owner"), lease_until),
+            )
+            # Only finished jobs are evicted; queued and running ones are kept even over the limit
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) "
+                "AND id NOT IN (SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?)",
+                (*INCOMPLETE, self.max_jobs),
+            )
+            self._conn.commit()
+
+    def renew(self, owner: str) -> None:
+        """Extend the lease of every unfinished job this process owns."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + JOB_LEASE_SECONDS, owner, *INCOMPLETE),
+            )
+            self._conn.commit()
+
+    def fail_stale(self, error: str) -> int:
+        """Mark unfinished jobs whose owner stopped renewing their lease as failed."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM jobs WHERE status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+                (*INCOMPLETE, time.time()),
+            ).fetchall()
+        for (data,) in rows:
+            job = json.loads(data)
+            job.update(status=FAILED, error=error, updated_at=time.time())
+            self.put(job)
+        return len(rows)
+
+
+def _build_store():
+    if JOB_STORE_BACKEND == "sqlite":
+        try:
+            logging.info(f"Job store using SQLite at: {JOB_STORE_PATH}")
+            return SQLiteJobStore()
+        except Exception as e:
+            logging.warning(f"Failed to open SQLite job store: {e}. Falling back to in-memory store.")
+    return MemoryJobStore()
+
+
+_store = _build_store()
+_queue: Optional[asyncio.Queue] = None
+_workers = []
+_owner = None  # host:pid of this process, set by start_workers
+
+# Called by a worker as handler(job, on_stage); returns the job result
+JobHandler = Callable[[dict, Callable[[str], Awaitable[None]]], Awaitable[dict]]
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at JOB_QUEUE_MAX_SIZE."""
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    return await _run_blocking(_store.get, job_id)
+
+
+async def _save(job: dict) -> None:
+    job["updated_at"] = time.time()
+    await _run_blocking(_store.put, job)
+
+
+async def submit(stages: list, payload: dict) -> dict:
+    """Create a job and enqueue it. Raises QueueFullError when the queue is full."""
+    if _queue is None:
+        raise RuntimeError("Job workers are not running.")
+    now = time.time()
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": QUEUED,
+        "stage": None,
+        "stages": {stage: PENDING for stage in stages},
+        "created_at": now,
+        "updated_at": now,
+        "error": None,
+        "result": None,
+        "payload": payload,
+        "owner": _owner,
+    }
+    await _save(job)
+    try:
+        _queue.put_nowait(job["id"])
+    except asyncio.QueueFull:
+        job["status"] = FAILED
+        job["error"] = f"Job queue is full ({JOB_QUEUE_MAX_SIZE} jobs)."
+        await _save(job)
+        raise QueueFullError(job["error"])
+    return job
+
+
+async def _run_job(job_id: str, handler: JobHandler) -> None:
+    job = await get_job(job_id)
+    if job is None:
+        logging.warning(f"Job {job_id} disappeared before it could run.")
+        return
+
+    async def on_stage(stage: str):
+        if job["stage"] is not None:
+            job["stages"][job["stage"]] = DONE
+        job["stage"] = stage
+        job["stages"][stage] = RUNNING
+        await _save(job)
+
+    job["status"] = RUNNING
+    await _save(job)
+    try:
+        job["result"] = await handler(job, on_stage)
+        job["status"] = COMPLETED
+        for stage, state in job["stages"].items():
+            job["stages"][stage] = DONE if state in (RUNNING, DONE) else SKIPPED
+    except Exception as e:
+        logging.error(f"Job {job_id} failed", exc_info=True)
+        job["status"] = FAILED
+        job["error"] = getattr(e, "detail", None) or str(e)
+        if job["stage"] is not None:
+            job["stages"][job["stage"]] = FAILED
+    job["stage"] = None
+    await _save(job)
+
+
+async def _worker(handler: JobHandler) -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id, handler)
+        except Exception:
+            logging.error(f"Unexpected error while running job {job_id}", exc_info=True)
+        finally:
+            _queue.task_done()
+
+
+async def _fail_stale() -> None:
+    failed = await _run_blocking(_store.fail_stale, "The server process running the job stopped before it finished.")
+    if failed:
+        logging.warning(f"Marked {failed} interrupted jobs as failed.")
+
+
+async def _heartbeat() -> None:
+    """Renew this process's job leases and fail jobs of processes that have gone away."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await _run_blocking(_store.renew, _owner)
+            await _fail_stale()
+        except Exception:
+            logging.error("Job lease renewal failed", exc_info=True)
+
+
+async def start_workers(handler: JobHandler, concurrency: int = JOB_WORKERS) -> None:
+    """Create the bounded job queue and start the worker tasks."""
+    global _queue, _owner
+    _queue = asyncio.Queue(maxsize=JOB_QUEUE_MAX_SIZE)
+    _owner = f"{socket.gethostname()}:{os.getpid()}"
+    if WEB_CONCURRENCY > 1 and isinstance(_store, MemoryJobStore):
+        logging.warning(f"Job store is in memory but WEB_CONCURRENCY={WEB_CONCURRENCY}; "
+                        f"status requests reaching another worker will not find the job. Use JOB_STORE_BACKEND=sqlite.")
+    # Other live workers keep renewing their leases, so only jobs of dead processes are failed
+    await _fail_stale()
+    for _ in range(max(1, concurrency)):
+        _workers.append(asyncio.create_task(_worker(handler)))
+    if isinstance(_store, SQLiteJobStore):
+        _workers.append(asyncio.create_task(_heartbeat()))
+    logging.info(f"Started {max(1, concurrency)} job workers (queue size {JOB_QUEUE_MAX_SIZE}, store {type(_store).__name__}).")
+
+
+async def stop_workers() -> None:
+    """Cancel the worker tasks."""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+def queue_depth() -> int:
+    return _queue.qsize() if _queue is not None else 0
+
+
+def public_view(job: dict) -> dict:
+    """Job status as returned by the API, without the internal payload or the result body."""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "stages": job["stages"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "error": job["error"],
+        "queue_depth": queue_depth(),
+    }
@@ -0,0 +1,121 @@
+# json_stream.py
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "start", "key", "index", "expecting_key")
+
+    def __init__(self, kind: str, path: tuple, start: int):
+        self.kind = kind          # "{" or "["
+        self.path = path          # keys and indices from the root to this container
+        self.start = start        # offset of the opening bracket
+        self.key = None           # current key (objects)
+        self.index = -1           # current element index (arrays)
+        self.expecting_key = kind == "{"
+
+
+class IncrementalJSONParser:
+    """Parse a JSON document arriving in pieces, reporting values as soon as they are complete.
+
+    feed() returns (path, value) for every value closed by the new text whose path is at
+    most max_depth long: with the default of 2, each top-level field, and each element of
+    a top-level array, as soon as its closing quote or bracket arrives. The root object
+    itself is reported last, with path (). Text before the first "{" or "[" (a code fence,
+    say) and after the root closes is ignored.
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.text = ""
+        self.root = None
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._string_path = ()
+        self._scalar_start: Optional[int] = None
+        self._scalar_path = ()
+
+    def _child_path(self) -> tuple:
+        """Path of a value starting now in the innermost container; advances array indices."""
+        frame = self._stack[-1]
+        if frame.kind == "[":
+            frame.index += 1
+            return frame.path + (frame.index,)
+        return frame.path + (frame.key,)
+
+    def _complete(self, path: tuple, start: int, end: int, events: list) -> None:
+        if len(path) > self.max_depth:
+            return
+        try:
+            value = json.loads(self.text[start:end])
+        except ValueError as e:
+            logging.debug(f"Unparseable streamed JSON value at {path}: {e}")
+            return
+        if not path:
+            self.root = value
+            self.done = True
+        events.append((path, value))
+
+    def _end_scalar(self, end: int, events: list) -> None:
+        if self._scalar_start is not None:
+            self._complete(self._scalar_path, self._scalar_start, end, events)
+            self._scalar_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[tuple, Any]]:
+        events = []
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1].key = json.loads(text[self._string_start:i + 1])
+                        self._stack[-1].expecting_key = False
+                    else:
+                        self._complete(self._string_path, self._string_start, i + 1, events)
+                continue
+            if not self._stack:
+                if char in "{[":
+                    self._stack.append(_Frame(char, (), i))
+                continue
+
+            if char in _WHITESPACE or char in ",:}]":
+                self._end_scalar(i, events)
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+                frame = self._stack[-1]
+                self._string_is_key = frame.kind == "{" and frame.expecting_key
+                if not self._string_is_key:
+                    self._string_path = self._child_path()
+            elif char in "{[":
+                self._stack.append(_Frame(char, self._child_path(), i))
+            elif char in "}]":
+                frame = self._stack.pop()
+                self._complete(frame.path, frame.start, i + 1, events)
+            elif char == ",":
+                if self._stack[-1].kind == "{":
+                    self._stack[-1].expecting_key = True
+            elif char == ":" or char in _WHITESPACE:
+                pass
+            elif self._scalar_start is None:
+                self._scalar_start = i
+                self._scalar_path = self._child_path()
+        self._pos = len(text)
+        return events
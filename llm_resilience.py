@@ -0,0 +1,254 @@
+# llm_resilience.py
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import metrics_service
+
+# Circuit breaker configuration
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Expected completion size, added to the prompt estimate when charging the tokens-per-minute bucket
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "500"))
+
+# Error kinds
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+TIMEOUT = "timeout"
+PARSE = "parse"
+CLIENT = "client"
+UNKNOWN = "unknown"
+
+
+class RetryPolicy:
+    """How often and how patiently to retry one kind of error."""
+
+    def __init__(self, max_attempts: int, base_delay: float = 0.5, max_delay: float = 20.0,
+                 trips_breaker: bool = True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.trips_breaker = trips_breaker
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        if self.base_delay <= 0:
+            return 0.0
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+RETRY_POLICIES = {
+    RATE_LIMIT: RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=30.0),
+    SERVER: RetryPolicy(max_attempts=4, base_delay=0.5, max_delay=10.0),
+    TIMEOUT: RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=10.0),
+    # A malformed response usually succeeds on an immediate retry and says nothing about provider health
+    PARSE: RetryPolicy(max_attempts=2, base_delay=0.0, trips_breaker=False),
+    # Bad requests, auth and safety blocks will not fix themselves
+    CLIENT: RetryPolicy(max_attempts=1, trips_breaker=False),
+    UNKNOWN: RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=5.0),
+}
+
+
+class LLMCallError(Exception):
+    """An LLM call failed after its retry policy was exhausted."""
+
+    def __init__(self, message: str, provider: str, kind: str):
+        super().__init__(message)
+        self.provider = provider
+        self.kind = kind
+
+
+class CircuitOpenError(LLMCallError):
+    """The provider's circuit breaker is open; the call was not attempted."""
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def classify_error(exc: Exception) -> str:
+    """Map an exception from either SDK onto one of the error kinds."""
+    if isinstance(exc, json.JSONDecodeError):
+        return PARSE
+    if isinstance(exc, asyncio.TimeoutError) or "Timeout" in type(exc).__name__:
+        return TIMEOUT
+    status = _status_code(exc)
+    if status == 429 or type(exc).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return RATE_LIMIT
+    if status is not None and status >= 500:
+        return SERVER
+    if status is not None and 400 <= status < 500:
+        return CLIENT
+    if "Connection" in type(exc).__name__ or isinstance(exc, (ConnectionError, OSError)):
+        return SERVER
+    return UNKNOWN
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Delay requested by the provider through Retry-After / retry-after-ms headers, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None  # HTTP-date form; fall back to our own backoff
+    return None
+
+
+class CircuitBreaker:
+    """Opens after consecutive provider failures and lets one probe through after the reset timeout."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError, or admit the call. Returns True when the call is the half-open probe."""
+        state = self.state
+        if state == self.OPEN or (state == self.HALF_OPEN and self._probing):
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(
+                f"{self.name} circuit breaker is open; retry in {retry_in:.1f}s", self.name, "circuit_open"
+            )
+        if state == self.HALF_OPEN:
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """End a probe that recorded neither success nor failure (it was cancelled)."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.failures >= self.failure_threshold:
+            logging.info(f"{self.name} circuit breaker closed.")
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.failure_threshold:
+            if self.failures == self.failure_threshold:
+                logging.error(f"{self.name} circuit breaker opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """Refills at rate_per_minute up to capacity; acquire waits until enough is available."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)  # an oversized request still gets through once the bucket is full
+        async with self._lock:
+            self._refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self.rate_per_second)
+                self._refill()
+            self.available -= amount
+
+
+class ResilientCaller:
+    """Rate-limited, retried and circuit-broken calls to one LLM provider."""
+
+    def __init__(self, provider: str, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.provider = provider
+        self.breaker = CircuitBreaker(provider)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.retries = 0
+
+    async def call(self, func: Callable[[], Awaitable], estimated_tokens: int = 0, description: str = "request"):
+        """Await func() until it succeeds or the policy for its error kind is exhausted.
+
+        func should include response parsing so malformed output is retried under the
+        parse policy. Raises CircuitOpenError without calling func when the breaker is
+        open, and LLMCallError when retries run out.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            probe = self.breaker.before_call()
+            try:
+                if self.request_bucket is not None:
+                    await self.request_bucket.acquire(1)
+                if self.token_bucket is not None:
+                    await self.token_bucket.acquire(estimated_tokens + EXPECTED_OUTPUT_TOKENS)
+                result = await func()
+            except Exception as e:
+                kind = classify_error(e)
+                policy = RETRY_POLICIES[kind]
+                if policy.trips_breaker:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()  # the provider answered, so it is healthy
+                if attempt >= policy.max_attempts:
+                    metrics_service.inc(metrics_service.LLM_FAILURES, provider=self.provider, kind=kind)
+                    logging.error(f"{self.provider} {description} failed after {attempt} attempts ({kind}): {e}")
+                    raise LLMCallError(f"{self.provider} {description} failed ({kind}): {e}", self.provider, kind) from e
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = policy.backoff(attempt)
+                self.retries += 1
+                metrics_service.inc(metrics_service.LLM_RETRIES, provider=self.provider, kind=kind)
+                logging.warning(f"{self.provider} {description} attempt {attempt} failed ({kind}): {e}. Retrying in {delay:.2f}s")
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                # A cancelled probe (hedge loser, client disconnect) must not leave the breaker stuck open
+                if probe:
+                    self.breaker.release_probe()
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> dict:
+        return {
+            "provider": self.provider,
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retries": self.retries,
+        }
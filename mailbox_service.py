@@ -0,0 +1,281 @@
+# mailbox_service.py
+import os
+import re
+import email
+import hashlib
+import logging
+import asyncio
+import tempfile
+import threading
+import concurrent.futures
+from email import policy
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional, Tuple
+
+from fastapi import HTTPException
+
+import pipeline_service
+
+MAILBOX_EXTENSIONS = (".eml", ".mbox")
+
+# Mailbox ingestion configuration
+MAX_MAILBOX_BYTES = int(os.getenv("MAX_MAILBOX_BYTES", str(20 * 1024 * 1024 * 1024)))
+MAX_MESSAGE_BYTES = int(os.getenv("MAX_MESSAGE_BYTES", str(50 * 1024 * 1024)))
+# Messages analyzed at once; each message's body and attachments run concurrently within it
+MAILBOX_CONCURRENCY = int(os.getenv("MAILBOX_CONCURRENCY", "8"))
+# Parsed messages buffered ahead of the consumers; bounds memory to roughly this many messages
+MAILBOX_QUEUE_SIZE = int(os.getenv("MAILBOX_QUEUE_SIZE", "16"))
+MAILBOX_ANALYZE_BODIES = os.getenv("MAILBOX_ANALYZE_BODIES", "true").lower() == "true"
+
+_MBOXRD_QUOTED_FROM = re.compile(rb"^>+From ")
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote"}
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run blocking I/O operations in executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+class _HTMLText(HTMLParser):
+    """Visible text of an HTML mail body, with line breaks at block elements."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style", "head"):
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style", "head"):
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self.parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def _html_to_text(html: str) -> str:
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def iter_raw_messages(file_path: str, is_mbox: bool) -> Iterator[Tuple[int, Optional[bytes], Optional[str]]]:
+    """Yield (index, raw message bytes, error) one message at a time.
+
+    An mbox file is split on "From " separator lines while it is read line by line, so
+    only the current message is held in memory; a message over MAX_MESSAGE_BYTES is
+    skipped and reported with raw=None.
+    """
+    with open(file_path, "rb") as f:
+        if not is_mbox:
+            raw = f.read(MAX_MESSAGE_BYTES + 1)
+            if len(raw) > MAX_MESSAGE_BYTES:
+                yield 0, None, f"Message larger than {MAX_MESSAGE_BYTES} bytes"
+            else:
+                yield 0, raw, None
+            return
+
+        index = 0
+        lines, size, too_large = [], 0, False
+        previous_blank = True
+        for line in f:
+            if line.startswith(b"From ") and previous_blank:
+                if lines or too_large:
+                    yield (index, None, f"Message larger than {MAX_MESSAGE_BYTES} bytes") if too_large \
+                        else (index, b"".join(lines), None)
+                    index += 1
+                lines, size, too_large = [], 0, False
+                previous_blank = False
+                continue  # the separator is not part of the message
+            previous_blank = not line.strip()
+            if too_large:
+                continue
+            if _MBOXRD_QUOTED_FROM.match(line):
+                line = line[1:]
+            size += len(line)
+            if size > MAX_MESSAGE_BYTES:
+                lines, too_large = [], True
+                continue
+            lines.append(line)
+        if too_large:
+            yield index, None, f"Message larger than {MAX_MESSAGE_BYTES} bytes"
+        elif any(line.strip() for line in lines):
+            yield index, b"".join(lines), None
+
+
+def parse_message(raw: bytes) -> dict:
+    """Headers, plain-text body and file attachments of one RFC 822 message. CPU-bound."""
+    message = email.message_from_bytes(raw, policy=policy.default)
+    body = ""
+    body_part = message.get_body(preferencelist=("plain", "html"))
+    if body_part is not None:
+        try:
+            body = body_part.get_content()
+        except (LookupError, UnicodeDecodeError):
+            body = (body_part.get_payload(decode=True) or b"").decode("utf-8", errors="replace")
+        if body_part.get_content_type() == "text/html":
+            body = _html_to_text(body)
+
+    attachments = []
+    for number, part in enumerate(message.iter_attachments(), start=1):
+        filename = part.get_filename()
+        disposition = part.get_content_disposition()
+        # Inline parts are logos and signature images, not documents
+        if disposition == "inline" or (disposition is None and not filename):
+            continue
+        attachments.append({
+            "filename": filename or f"attachment-{number}",
+            "content_type": part.get_content_type(),
+            "data": part.get_payload(decode=True) or b"",
+        })
+    return {
+        "message_id": str(message.get("Message-ID", "") or ""),
+        "subject": str(message.get("Subject", "") or ""),
+        "from": str(message.get("From", "") or ""),
+        "date": str(message.get("Date", "") or ""),
+        "body": body.strip(),
+        "attachments": attachments,
+    }
+
+
+def _write_temp(data: bytes, suffix: str) -> Tuple[str, str]:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(data)
+    return tmp.name, hashlib.sha256(data).hexdigest()
+
+
+async def _analyze_part(filename: str, content_type: str, data: bytes, ocr_profile: Optional[str]) -> dict:
+    """Run one message body or attachment through the analysis pipeline."""
+    tmp_path, content_hash = await _run_blocking(_write_temp, data, Path(filename).suffix.lower())
+    try:
+        result, meta = await pipeline_service.analyze_file(
+            tmp_path, filename, content_type, content_hash, ocr_profile=ocr_profile
+        )
+        return {"filename": filename, "status": "ok", **meta, "result": result}
+    except HTTPException as e:
+        return {"filename": filename, "status": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logging.error(f"Mailbox part failed: {filename}", exc_info=True)
+        return {"filename": filename, "status": "error", "status_code": 500, "detail": str(e)}
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def _analyze_message(index: int, raw: bytes, allowed_extensions: list, ocr_profile: Optional[str]) -> dict:
+    try:
+        message = await _run_blocking(parse_message, raw)
+    except Exception as e:
+        return {"index": index, "status": "error", "detail": f"Unparseable message: {e}"}
+    del raw
+
+    # The body comes from the message's text part (parse_message), so it is told apart from
+    # the attachments by position, never by filename: an attachment may be called anything
+    analyze_body = MAILBOX_ANALYZE_BODIES and bool(message["body"])
+    parts, skipped = [], []
+    if analyze_body:
+        parts.append(("message-body.txt", "text/plain", message["body"].encode("utf-8")))
+    for attachment in message["attachments"]:
+        ext = Path(attachment["filename"]).suffix.lower()
+        if ext in allowed_extensions:
+            parts.append((attachment["filename"], attachment["content_type"], attachment["data"]))
+        else:
+            skipped.append({"filename": attachment["filename"], "detail": f"Unsupported file type: {ext}"})
+
+    results = await asyncio.gather(*(_analyze_part(name, ctype, data, ocr_profile) for name, ctype, data in parts))
+    body = results[0] if analyze_body else None
+    return {
+        "index": index,
+        "status": "ok",
+        "message_id": message["message_id"],
+        "subject": message["subject"],
+        "from": message["from"],
+        "date": message["date"],
+        "body": body,
+        "attachments": results[1:] if analyze_body else results,
+        "skipped": skipped,
+    }
+
+
+async def analyze_mailbox(file_path: str, is_mbox: bool, allowed_extensions: list,
+                          ocr_profile: Optional[str] = None) -> AsyncIterator[dict]:
+    """Analyze every message of a saved .mbox/.eml file, yielding one result per message as it completes.
+
+    A reader thread splits messages off the file into a bounded queue (backpressure keeps
+    memory flat) and MAILBOX_CONCURRENCY consumers analyze them. Closing the generator
+    stops the reader and cancels outstanding work.
+    """
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue(maxsize=MAILBOX_QUEUE_SIZE)
+    results = asyncio.Queue()
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(messages.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    def _produce() -> None:
+        try:
+            for item in iter_raw_messages(file_path, is_mbox):
+                if not _put(item):
+                    return
+        except Exception as e:
+            logging.error("Mailbox reader failed", exc_info=True)
+            _put((-1, None, f"Mailbox could not be read: {e}"))
+        finally:
+            if not stop.is_set():
+                for _ in range(MAILBOX_CONCURRENCY):
+                    _put(None)
+
+    async def _consume() -> None:
+        try:
+            while True:
+                item = await messages.get()
+                if item is None:
+                    return
+                index, raw, error = item
+                if error is not None:
+                    await results.put({"index": index, "status": "error", "detail": error})
+                else:
+                    await results.put(await _analyze_message(index, raw, allowed_extensions, ocr_profile))
+        finally:
+            await results.put(None)
+
+    producer = loop.run_in_executor(None, _produce)
+    consumers = [asyncio.create_task(_consume()) for _ in range(MAILBOX_CONCURRENCY)]
+    running = len(consumers)
+    try:
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+            else:
+                yield result
+    finally:
+        stop.set()
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        await producer
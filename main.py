@@ -1,21 +1,46 @@
 # main.py
 
+# Load environment variables from .env file before any service module reads its settings
+from dotenv import load_dotenv
+load_dotenv()
+
+import startup_service  # first, so start-up timings cover every import below
+
 import os
-import tempfile
+import json
+import asyncio
 import logging
 from pathlib import Path
-from dotenv import load_dotenv
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from typing import List, Optional
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 import textract_service
-import openai_service
-
-# Load environment variables from .env file
-load_dotenv()
+import cache_service
+import upload_service
+import pipeline_service
+import provider_router
+import job_service
+import ocr_service
+import similarity_service
+import mailbox_service
+import metrics_service
 
 app = FastAPI(title="Document Analysis API")
 logging.basicConfig(level=logging.INFO)
 
+# Refuse oversized bodies before Starlette spools them to disk; added before CORS so that
+# CORS stays the outer middleware and the 413 carries its headers
+app.add_middleware(
+    upload_service.UploadSizeLimitMiddleware,
+    max_bytes=upload_service.MAX_UPLOAD_BYTES,
+    path_limits={
+        "/analyze-batch": upload_service.MAX_BATCH_BYTES,
+        "/analyze-mailbox": mailbox_service.MAX_MAILBOX_BYTES,
+    },
+)
+
 # Configure CORS - Allow all origins for document upload
 app.add_middleware(
     CORSMiddleware,
@@ -25,6 +50,7 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+startup_service.mark("imported")
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = [".pdf", ".docx", ".csv", ".xlsx", ".png", ".jpg", ".jpeg", ".txt"]
@@ -37,80 +63,153 @@ def validate_file(file: UploadFile):
             detail=f"Unsupported file type: {ext}. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
 
+@app.on_event("startup")
+async def startup():
+    # Imports whatever WARMUP_EXTRACTORS selects; already done if the gunicorn master preloaded it
+    startup_service.preload()
+    provider_router.init_clients()
+    # Every web worker has its own OCR pool; without a warm-up it starts with the first OCR job
+    if "ocr" in startup_service.warmup_pools():
+        ocr_service.start_pool()
+    await job_service.start_workers(_run_analysis_job)
+    startup_service.mark("ready")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_service.stop_workers()
+    textract_service.shutdown_process_pool()
+    ocr_service.shutdown_pool()
+    provider_router.shutdown()
+
 @app.get("/")
 async def root():
     return {
         "message": "Document Analysis API",
         "endpoints": {
             "health": "GET /health",
-            "analyze-document": "POST /analyze-document"
+            "ocr-status": "GET /ocr/status",
+            "startup": "GET /startup",
+            "analyze-document": "POST /analyze-document",
+            "analyze-document-stream": "POST /analyze-document/stream",
+            "analyze-batch": "POST /analyze-batch",
+            "analyze-mailbox": "POST /analyze-mailbox",
+            "cache-stats": "GET /cache/stats",
+            "pipeline-stats": "GET /pipeline/stats",
+            "metrics": "GET /metrics",
+            "submit-job": "POST /jobs",
+            "job-status": "GET /jobs/{job_id}",
+            "job-result": "GET /jobs/{job_id}/result"
         }
     }
 
 @app.get("/health", status_code=200)
 async def health_check():
-    return {"status": "ok"}
+    ocr = ocr_service.pool_state()
+    last_check = ocr["last_check"] or {}
+    return {"status": "degraded" if last_check.get("status") == "error" else "ok", "ocr": ocr}
+
+@app.get("/ocr/status")
+async def ocr_status(response: Response):
+    """Readiness: runs a tiny OCR job through the pool; 503 when it fails or times out."""
+    check = await ocr_service.readiness_check()
+    if check["status"] == "error":
+        response.status_code = 503
+    return {**check, "pool": ocr_service.get_stats()}
+
+@app.get("/startup")
+async def startup_report():
+    return startup_service.get_report()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {**cache_service.get_stats(), "near_duplicates": similarity_service.get_stats()}
+
+@app.get("/pipeline/stats")
+async def pipeline_stats():
+    return pipeline_service.get_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics."""
+    cache_stats = cache_service.get_stats()
+    metrics_service.set_gauge("docanalysis_analysis_cache_hits", cache_stats["hits"], "Analysis cache hits.")
+    metrics_service.set_gauge("docanalysis_analysis_cache_misses", cache_stats["misses"], "Analysis cache misses.")
+    metrics_service.set_gauge("docanalysis_extraction_cache_hits", cache_stats["extraction"]["hits"], "Extraction cache hits.")
+    metrics_service.set_gauge("docanalysis_extraction_cache_misses", cache_stats["extraction"]["misses"], "Extraction cache misses.")
+    for provider in provider_router.get_stats()["providers"]:
+        metrics_service.set_gauge(
+            "docanalysis_llm_breaker_open",
+            0 if provider["breaker_state"] == "closed" else 1,
+            "1 while a provider's circuit breaker is open or half-open.",
+            provider=provider["provider"],
+        )
+    metrics_service.set_gauge("docanalysis_job_queue_depth", job_service.queue_depth(), "Jobs waiting in the queue.")
+    metrics_service.set_gauge("docanalysis_ocr_queue_depth", ocr_service.queue_depth(), "OCR jobs waiting for a pool worker.")
+    if startup_service.ready_seconds() is not None:
+        metrics_service.set_gauge("docanalysis_startup_seconds", startup_service.ready_seconds(),
+                                  "Seconds from the first import to serving.")
+    for process, peak in metrics_service.peak_rss_bytes().items():
+        metrics_service.set_gauge("docanalysis_process_peak_rss_bytes", peak, "Peak resident set size.", process=process)
+    return metrics_service.render()
+
+def validate_mode(mode: Optional[str]):
+    if mode is not None and mode not in pipeline_service.PIPELINE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported pipeline mode: {mode}. Allowed modes: {', '.join(pipeline_service.PIPELINE_MODES)}"
+        )
+
+def validate_ocr_profile(ocr_profile: Optional[str]):
+    if ocr_profile is not None and ocr_profile not in ocr_service.OCR_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported OCR profile: {ocr_profile}. Allowed profiles: {', '.join(ocr_service.OCR_PROFILES)}"
+        )
+
+def _set_cache_headers(response: Response, status: str):
+    stats = cache_service.get_stats()
+    response.headers["X-Cache"] = status
+    response.headers["X-Cache-Hits"] = str(stats["hits"])
+    response.headers["X-Cache-Misses"] = str(stats["misses"])
 
 @app.post("/analyze-document")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(response: Response, file: UploadFile = File(...), mode: Optional[str] = Query(None),
+                           ocr_profile: Optional[str] = Query(None)):
     """Main endpoint to upload and analyze a document."""
     tmp_path = None
+    metrics_service.start_request_timing()
     try:
         validate_file(file)  # ✅ Check file extension
+        validate_mode(mode)
+        validate_ocr_profile(ocr_profile)
 
-        # Save file temporarily to disk
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp:
-            file_bytes = await file.read()
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
+        # Stream the upload to disk in chunks, hashing as we go
+        with metrics_service.stage_timer("upload"):
+            tmp_path, content_hash, _ = await upload_service.save_upload(file)
 
-        # 1. Extract text using the hybrid service
-        logging.info(f"Processing file: {file.filename}, content_type: {file.content_type}")
-        extracted_text = await textract_service.extract_text_from_upload(
+        result, meta = await pipeline_service.analyze_file(
             tmp_path,
-            file_bytes,
-            file.content_type if hasattr(file, "content_type") else None
+            file.filename,
+            file.content_type if hasattr(file, "content_type") else None,
+            content_hash,
+            mode=mode,
+            ocr_profile=ocr_profile
         )
-        logging.info(f"Extracted text length: {len(extracted_text) if extracted_text else 0}")
-        if not extracted_text or not extracted_text.strip():
-            raise HTTPException(
-                status_code=422, 
-                detail="Failed to extract text from document. File may be corrupted or unsupported."
-            )
-
-        # 2. Classify the document type
-        classification_result = await openai_service.classify_document(extracted_text)
-        logging.info(f"classification_result type: {type(classification_result)}, value: {classification_result}")
-        if not isinstance(classification_result, dict):
-            classification_result = {"document_type": str(classification_result)}
-        doc_type = classification_result.get("document_type", "GeneralDocument")
-
-        # 3. Perform specialized analysis
-        analysis_result = await openai_service.analyze_document_by_type(extracted_text, doc_type)
-        
-        # Ensure analysis_result is a dictionary
-        if not isinstance(analysis_result, dict):
-            logging.warning("OpenAI returned non-dict analysis result. Wrapping it.")
-            analysis_result = {"document_type": doc_type, "summary": str(analysis_result), "key_points": [], "deadlines": []}
-
-        # Optional debug logging
-        logging.info(f"analysis_result type: {type(analysis_result)}, value: {analysis_result}")
-
-        # Extract structured fields from analysis_result
-        document_type = analysis_result.get("document_type", doc_type)
-        summary = analysis_result.get("summary", "")
-        key_points = analysis_result.get("key_points", [])
-        deadlines = analysis_result.get("deadlines", [])
-        
-        # Build simplified response for frontend
-        return {
-            "filename": file.filename,
-            "document_type": document_type,
-            "summary": summary,
-            "key_points": key_points,
-            "deadlines": deadlines
-        }
+        _set_cache_headers(response, meta["cache"])
+        response.headers["X-Pipeline-Mode"] = meta["mode"]
+        if "similarity" in meta:
+            response.headers["X-Similarity"] = str(meta["similarity"])
+        response.headers["X-LLM-Latency-Ms"] = str(meta["llm_ms"])
+        if "tokens" in meta:
+            response.headers["X-Tokens"] = f"raw={meta['tokens']['raw']}; normalized={meta['tokens']['normalized']}"
+        response.headers["X-Timing"] = metrics_service.timing_header()
+        ocr_summary = metrics_service.ocr_header()
+        if ocr_summary:
+            response.headers["X-OCR"] = ocr_summary
+        return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error("An error occurred in the /analyze endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -118,3 +217,232 @@ async def analyze_document(file: UploadFile = File(...)):
         # Clean up the temporary file
         if tmp_path and os.path.exists(tmp_path):
             os.remove(tmp_path)
+
+def _remove_files(paths: List[str]) -> None:
+    """Delete temporary uploads; ones already removed by the request itself are skipped."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove temporary upload {path}: {e}")
+
+def _streaming_response(stream, media_type: str, tmp_paths: List[str], headers: Optional[dict] = None):
+    """StreamingResponse that removes tmp_paths once it ends.
+
+    The generator's own cleanup never runs when the client disconnects before streaming
+    starts; the background task runs either way.
+    """
+    try:
+        return StreamingResponse(stream, media_type=media_type, headers=headers,
+                                 background=BackgroundTask(_remove_files, tmp_paths))
+    except BaseException:
+        _remove_files(tmp_paths)
+        raise
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/analyze-document/stream")
+async def analyze_document_stream(file: UploadFile = File(...), ocr_profile: Optional[str] = Query(None)):
+    """Analyze a document, streaming progress and partial results as server-sent events."""
+    validate_file(file)
+    validate_ocr_profile(ocr_profile)
+    tmp_path, content_hash, _ = await upload_service.save_upload(file)
+
+    async def _stream():
+        try:
+            yield _sse("uploaded", {"filename": file.filename})
+            async for event, data in pipeline_service.analyze_file_stream(
+                tmp_path,
+                file.filename,
+                file.content_type if hasattr(file, "content_type") else None,
+                content_hash,
+                ocr_profile=ocr_profile
+            ):
+                yield _sse(event, data)
+        except HTTPException as e:
+            yield _sse("error", {"status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logging.error("An error occurred in the /analyze-document/stream endpoint", exc_info=True)
+            yield _sse("error", {"status_code": 500, "detail": str(e)})
+
+    # No-transform and no proxy buffering, so each event reaches the client as soon as it is written
+    headers = {"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+    return _streaming_response(_stream(), "text/event-stream", [tmp_path], headers)
+
+async def _run_analysis_job(job: dict, on_stage) -> dict:
+    """Job body: run the analyze-document pipeline on the saved upload, then remove it."""
+    payload = job["payload"]
+    try:
+        result, _ = await pipeline_service.analyze_file(
+            payload["tmp_path"],
+            payload["filename"],
+            payload["content_type"],
+            payload["content_hash"],
+            on_stage=on_stage,
+            ocr_profile=payload.get("ocr_profile")
+        )
+        return result
+    finally:
+        if os.path.exists(payload["tmp_path"]):
+            os.remove(payload["tmp_path"])
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), ocr_profile: Optional[str] = Query(None)):
+    """Queue a document for analysis and return its job id right away."""
+    validate_file(file)
+    validate_ocr_profile(ocr_profile)
+    tmp_path, content_hash, _ = await upload_service.save_upload(file)
+    try:
+        job = await job_service.submit(pipeline_service.STAGES, {
+            "tmp_path": tmp_path,
+            "filename": file.filename,
+            "content_type": file.content_type if hasattr(file, "content_type") else None,
+            "content_hash": content_hash,
+            "ocr_profile": ocr_profile,
+        })
+    except job_service.QueueFullError as e:
+        os.remove(tmp_path)
+        raise HTTPException(status_code=503, detail=str(e))
+    return job_service.public_view(job)
+
+async def _get_job_or_404(job_id: str) -> dict:
+    job = await job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    return job_service.public_view(await _get_job_or_404(job_id))
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await _get_job_or_404(job_id)
+    if job["status"] == job_service.FAILED:
+        raise HTTPException(status_code=500, detail=job["error"])
+    if job["status"] != job_service.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}.")
+    return job["result"]
+
+async def _save_batch(files: List[UploadFile]):
+    """Save every upload (and every supported zip member) to disk before streaming starts.
+
+    At most MAX_BATCH_FILES documents and MAX_BATCH_BYTES bytes are kept; the rest are skipped with 413.
+    """
+    saved, skipped = [], []
+    total = 0
+    try:
+        for file in files:
+            ext = Path(file.filename).suffix.lower()
+            if ext != ".zip" and ext not in ALLOWED_EXTENSIONS:
+                skipped.append({"filename": file.filename, "status_code": 400, "detail": f"Unsupported file type: {ext}"})
+                continue
+            if len(saved) >= upload_service.MAX_BATCH_FILES:
+                skipped.append({"filename": file.filename, "status_code": 413,
+                                "detail": f"Batch limit of {upload_service.MAX_BATCH_FILES} files reached"})
+                continue
+            try:
+                tmp_path, content_hash, size = await upload_service.save_upload(file)
+            except HTTPException as e:
+                skipped.append({"filename": file.filename, "status_code": e.status_code, "detail": e.detail})
+                continue
+
+            if ext != ".zip":
+                if total + size > upload_service.MAX_BATCH_BYTES:
+                    os.remove(tmp_path)
+                    skipped.append({"filename": file.filename, "status_code": 413,
+                                    "detail": f"Batch size limit of {upload_service.MAX_BATCH_BYTES} bytes reached"})
+                    continue
+                total += size
+                saved.append({
+                    "filename": file.filename,
+                    "tmp_path": tmp_path,
+                    "content_hash": content_hash,
+                    "content_type": file.content_type if hasattr(file, "content_type") else None,
+                })
+                continue
+            try:
+                members, skipped_members = await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    upload_service.save_zip_members,
+                    tmp_path,
+                    ALLOWED_EXTENSIONS,
+                    upload_service.MAX_UPLOAD_BYTES,
+                    upload_service.MAX_BATCH_FILES - len(saved),
+                    upload_service.MAX_BATCH_BYTES - total,
+                )
+            finally:
+                os.remove(tmp_path)
+            total += sum(member["size"] for member in members)
+            saved.extend(members)
+            skipped.extend({"status_code": 400, **entry} for entry in skipped_members)
+    except Exception:
+        for entry in saved:
+            os.remove(entry["tmp_path"])
+        raise
+    return saved, skipped
+
+async def _analyze_batch_item(entry: dict, ocr_profile: Optional[str] = None) -> dict:
+    try:
+        result, meta = await pipeline_service.analyze_file(
+            entry["tmp_path"], entry["filename"], entry["content_type"], entry["content_hash"],
+            ocr_profile=ocr_profile
+        )
+        return {"filename": entry["filename"], "status": "ok", **meta, "result": result}
+    except HTTPException as e:
+        return {"filename": entry["filename"], "status": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logging.error(f"Batch item failed: {entry['filename']}", exc_info=True)
+        return {"filename": entry["filename"], "status": "error", "status_code": 500, "detail": str(e)}
+    finally:
+        if os.path.exists(entry["tmp_path"]):
+            os.remove(entry["tmp_path"])
+
+@app.post("/analyze-batch")
+async def analyze_batch(files: List[UploadFile] = File(...), ocr_profile: Optional[str] = Query(None)):
+    """Analyze many documents (or zip archives of documents) concurrently, streaming NDJSON results."""
+    validate_ocr_profile(ocr_profile)
+    saved, skipped = await _save_batch(files)
+    logging.info(f"Batch received: {len(saved)} documents, {len(skipped)} skipped")
+
+    async def _stream():
+        # Concurrency is bounded by the pipeline's extraction and LLM semaphores
+        tasks = [asyncio.create_task(_analyze_batch_item(entry, ocr_profile)) for entry in saved]
+        try:
+            for entry in skipped:
+                yield json.dumps({"status": "error", **entry}) + "\n"
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away or streaming failed; stop the remaining work (tasks remove their files)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return _streaming_response(_stream(), "application/x-ndjson", [entry["tmp_path"] for entry in saved])
+
+@app.post("/analyze-mailbox")
+async def analyze_mailbox(file: UploadFile = File(...), ocr_profile: Optional[str] = Query(None)):
+    """Analyze every message of an .eml or .mbox file with its attachments, streaming one NDJSON line per message."""
+    ext = Path(file.filename).suffix.lower()
+    if ext not in mailbox_service.MAILBOX_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {ext}. Allowed types: {', '.join(mailbox_service.MAILBOX_EXTENSIONS)}"
+        )
+    validate_ocr_profile(ocr_profile)
+    tmp_path, _, size = await upload_service.save_upload(file, max_bytes=mailbox_service.MAX_MAILBOX_BYTES)
+    logging.info(f"Mailbox received: {file.filename} ({size} bytes)")
+
+    async def _stream():
+        messages = mailbox_service.analyze_mailbox(tmp_path, ext == ".mbox", ALLOWED_EXTENSIONS, ocr_profile)
+        try:
+            async for result in messages:
+                yield json.dumps(result) + "\n"
+        finally:
+            await messages.aclose()
+
+    return _streaming_response(_stream(), "application/x-ndjson", [tmp_path])
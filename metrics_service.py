@@ -0,0 +1,194 @@
+# metrics_service.py
+import os
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# Fraction of requests whose full LLM payloads and analysis results are logged (0 disables)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = "docanalysis_stage_duration_seconds"
+LLM_TOKENS = "docanalysis_llm_tokens_total"
+LLM_RETRIES = "docanalysis_llm_retries_total"
+LLM_FAILURES = "docanalysis_llm_failures_total"
+OCR_SECONDS = "docanalysis_ocr_image_seconds"
+OCR_CONFIDENCE = "docanalysis_ocr_confidence"
+PDF_PAGES = "docanalysis_pdf_pages_total"
+CLASSIFICATIONS = "docanalysis_classifications_total"
+INPUT_TOKENS = "docanalysis_input_tokens_total"
+
+# Histograms that are not durations
+_BUCKETS = {
+    OCR_CONFIDENCE: (10, 20, 30, 40, 50, 60, 70, 80, 90, 95, 100),
+}
+
+_HELP = {
+    STAGE_SECONDS: ("histogram", "Time spent in each pipeline stage."),
+    LLM_TOKENS: ("counter", "LLM tokens reported by the provider, by direction."),
+    LLM_RETRIES: ("counter", "LLM call retries, by error kind."),
+    LLM_FAILURES: ("counter", "LLM calls that failed after exhausting retries."),
+    OCR_SECONDS: ("histogram", "OCR time per image or scanned page, by profile."),
+    OCR_CONFIDENCE: ("histogram", "Mean Tesseract word confidence (0-100) per image or page, by profile."),
+    PDF_PAGES: ("counter", "PDF pages extracted, by pre-scan kind (digital, scanned, blank)."),
+    CLASSIFICATIONS: ("counter", "Document classifications, by source (local classifier or llm)."),
+    INPUT_TOKENS: ("counter", "Estimated tokens of extracted text, before (raw) and after (normalized) normalization."),
+}
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_counters = {}    # (name, labels) -> value
+_gauges = {}      # (name, labels) -> value
+
+# Per-request stage durations for the X-Timing header
+_request_timings: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("request_timings", default=None)
+# Per-request OCR results for the X-OCR header
+_request_ocr: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_ocr", default=None)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels) -> None:
+    buckets = _BUCKETS.get(name, DEFAULT_BUCKETS)
+    with _lock:
+        histogram = _histograms.setdefault(_key(name, labels), [0] * len(buckets) + [0.0, 0])
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, help_text: str = "", **labels) -> None:
+    with _lock:
+        if name not in _HELP:
+            _HELP[name] = ("gauge", help_text)
+        _gauges[_key(name, labels)] = value
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and in the current request's timings, if any."""
+    observe(STAGE_SECONDS, seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def stage_timer(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_ocr(profile: str, seconds: float, confidence: Optional[float]) -> None:
+    """Record one OCR'd image or page: stage time, per-profile time and confidence."""
+    record_stage("ocr", seconds)
+    observe(OCR_SECONDS, seconds, profile=profile)
+    if confidence is not None:
+        observe(OCR_CONFIDENCE, confidence, profile=profile)
+    results = _request_ocr.get()
+    if results is not None:
+        results.append((profile, seconds, confidence))
+
+
+def record_tokens(provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    if prompt_tokens:
+        inc(LLM_TOKENS, prompt_tokens, provider=provider, direction="prompt")
+    if completion_tokens:
+        inc(LLM_TOKENS, completion_tokens, provider=provider, direction="completion")
+
+
+def start_request_timing() -> None:
+    """Begin collecting stage timings for the current request (and tasks it spawns)."""
+    _request_timings.set({})
+    _request_ocr.set([])
+
+
+def timing_header() -> str:
+    """Current request's stage timings as "stage;dur=ms" pairs, in the order stages ran."""
+    timings = _request_timings.get() or {}
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def ocr_header() -> str:
+    """Current request's OCR summary, or "" when nothing was OCR'd."""
+    results = _request_ocr.get()
+    if not results:
+        return ""
+    seconds = sum(result[1] for result in results)
+    confidences = [result[2] for result in results if result[2] is not None]
+    parts = [f"profile={results[0][0]}", f"images={len(results)}", f"seconds={seconds:.2f}"]
+    if confidences:
+        parts.append(f"confidence={sum(confidences) / len(confidences):.1f}")
+    return "; ".join(parts)
+
+
+def peak_rss_bytes() -> dict:
+    """Peak resident set size of this process and of its finished child processes."""
+    if resource is None:
+        return {}
+    # ru_maxrss is KiB on Linux
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+
+def should_log_payload() -> bool:
+    """Sampled switch for verbose payload logging, kept off the hot path by default."""
+    return LOG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < LOG_PAYLOAD_SAMPLE_RATE
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        names = sorted({name for name, _ in list(_histograms) + list(_counters) + list(_gauges)})
+        for name in names:
+            metric_type, help_text = _HELP.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (hist_name, labels), values in sorted(_histograms.items()):
+                if hist_name != name:
+                    continue
+                for bound, count in zip(_BUCKETS.get(name, DEFAULT_BUCKETS), values):
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {values[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+            for store in (_counters, _gauges):
+                for (metric_name, labels), value in sorted(store.items()):
+                    if metric_name == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,257 @@
+# normalize_service.py
+import os
+import re
+import math
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+from chunking_service import PAGE_BREAK, estimate_tokens
+
+# Bump whenever normalization output changes, so analyses of differently normalized text are not reused
+NORMALIZER_VERSION = "3"
+
+# Normalization rules, applied in this order; each can be switched off on its own.
+# OCR noise removal is not one of them: textract_service applies it to OCR output only
+# (clean_ocr_text), since digital text has real lines that look like noise (totals, lists).
+RULES = ["whitespace", "repeated_lines", "boilerplate"]
+
+NORMALIZE_ENABLED = os.getenv("NORMALIZE_ENABLED", "true").lower() == "true"
+NORMALIZE_WHITESPACE = os.getenv("NORMALIZE_WHITESPACE", "true").lower() == "true"
+NORMALIZE_REPEATED_LINES = os.getenv("NORMALIZE_REPEATED_LINES", "true").lower() == "true"
+NORMALIZE_OCR_NOISE = os.getenv("NORMALIZE_OCR_NOISE", "true").lower() == "true"
+NORMALIZE_BOILERPLATE = os.getenv("NORMALIZE_BOILERPLATE", "true").lower() == "true"
+
+# Repeated lines: only the first and last few lines of each page are header/footer candidates,
+# and a line must recur verbatim on at least this share of pages (of a document with enough pages)
+NORMALIZE_EDGE_LINES = int(os.getenv("NORMALIZE_EDGE_LINES", "4"))
+# Pages with fewer non-blank lines have no edge lines: every line of a short page is content
+NORMALIZE_MIN_PAGE_LINES = int(os.getenv("NORMALIZE_MIN_PAGE_LINES", str(3 * NORMALIZE_EDGE_LINES)))
+NORMALIZE_MIN_PAGES = int(os.getenv("NORMALIZE_MIN_PAGES", "3"))
+NORMALIZE_REPEAT_RATIO = float(os.getenv("NORMALIZE_REPEAT_RATIO", "0.5"))
+# OCR noise: lines with a smaller share of letters and digits are dropped
+NORMALIZE_MIN_ALNUM_RATIO = float(os.getenv("NORMALIZE_MIN_ALNUM_RATIO", "0.4"))
+# Boilerplate: paragraphs and lines at least this long are kept only the first time they appear,
+# unless they contain digits (repeated line items and amounts are data)
+NORMALIZE_BOILERPLATE_MIN_CHARS = int(os.getenv("NORMALIZE_BOILERPLATE_MIN_CHARS", "80"))
+
+_SPACES_RE = re.compile(r"[ \t\u00a0\u2000-\u200b\u3000]+")
+_INVISIBLE_RE = re.compile(r"[\u200c-\u200f\u2060\ufeff\r]")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+# Bare page numbers ("7", "- 7 -", "Page 7 of 9", "7/9"), dropped from the first and last line of a page
+_PAGE_NUMBER_RE = re.compile(r"^[-\u2013\s]*(page\s*)?\d{1,4}(\s*(of|/)\s*\d{1,4})?[-\u2013\s]*$", re.I)
+
+
+def enabled_rules() -> List[str]:
+    flags = {
+        "whitespace": NORMALIZE_WHITESPACE,
+        "repeated_lines": NORMALIZE_REPEATED_LINES,
+        "boilerplate": NORMALIZE_BOILERPLATE,
+    }
+    return [rule for rule in RULES if flags[rule]] if NORMALIZE_ENABLED else []
+
+
+def cache_tag() -> str:
+    """Normalizer version and enabled rules, for analysis cache keys."""
+    return f"{NORMALIZER_VERSION}:{'+'.join(enabled_rules()) or 'off'}"
+
+
+def _is_table_row(line: str) -> bool:
+    # Markdown table rows from spreadsheet and DOCX extraction; repeated rows are real data
+    return line.lstrip().startswith("|")
+
+
+def _has_digits(text: str) -> bool:
+    return any(char.isdigit() for char in text)
+
+
+def _line_key(line: str) -> str:
+    """Comparison key that ignores case and spacing only; lines differing in any number are different lines."""
+    return " ".join(line.lower().split())
+
+
+def _pages(text: str) -> List[List[str]]:
+    return [page.split("\n") for page in text.split(PAGE_BREAK)]
+
+
+def _join(pages: List[List[str]]) -> str:
+    return PAGE_BREAK.join("\n".join(lines) for lines in pages)
+
+
+def collapse_whitespace(text: str) -> str:
+    """Runs of spaces and tabs become one space, lines are stripped, blank-line runs become one blank line."""
+    text = _INVISIBLE_RE.sub("", text)
+    pages = []
+    for page in text.split(PAGE_BREAK):
+        page = "\n".join(_SPACES_RE.sub(" ", line).strip() for line in page.split("\n"))
+        pages.append(_BLANK_RUN_RE.sub("\n\n", page).strip("\n"))
+    return f"\n{PAGE_BREAK}\n".join(page for page in pages if page.strip())
+
+
+def _edges(lines: List[str]) -> List[int]:
+    """Indexes of the header and footer candidates of one page; none on a short page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    if len(filled) < max(NORMALIZE_MIN_PAGE_LINES, 2 * NORMALIZE_EDGE_LINES + 1):
+        return []
+    edges = filled[:NORMALIZE_EDGE_LINES] + filled[-NORMALIZE_EDGE_LINES:]
+    return sorted(i for i in set(edges) if not _is_table_row(lines[i]))
+
+
+def remove_repeated_lines(text: str) -> str:
+    """Drop page headers and footers: edge lines that recur verbatim on most pages, and bare page numbers.
+
+    The first occurrence of a repeated line is kept.
+    """
+    pages = _pages(text)
+    if len(pages) < NORMALIZE_MIN_PAGES:
+        return text
+
+    def _page_numbers(lines: List[str], edges: List[int]) -> List[int]:
+        return [i for i in {edges[0], edges[-1]} if _PAGE_NUMBER_RE.match(lines[i])] if edges else []
+
+    page_counts = {}
+    numbered_pages = 0
+    for lines in pages:
+        edges = _edges(lines)
+        for key in {_line_key(lines[i]) for i in edges}:
+            if key:
+                page_counts[key] = page_counts.get(key, 0) + 1
+        numbered_pages += bool(_page_numbers(lines, edges))
+    min_pages = max(2, math.ceil(NORMALIZE_REPEAT_RATIO * len(pages)))
+    repeated = {key for key, count in page_counts.items() if count >= min_pages}
+    if not repeated and numbered_pages < min_pages:
+        return text
+
+    seen = set()
+    for lines in pages:
+        edges = _edges(lines)
+        # Page numbers differ on every page, so they are recognised by shape rather than repetition
+        drop = set(_page_numbers(lines, edges)) if numbered_pages >= min_pages else set()
+        for i in edges:
+            key = _line_key(lines[i])
+            if key in repeated:
+                if key in seen:
+                    drop.add(i)
+                seen.add(key)
+        lines[:] = [line for i, line in enumerate(lines) if i not in drop]
+    return _join(pages)
+
+
+def is_noise(line: str) -> bool:
+    """OCR garbage: mostly symbols ("~ ' . ,|"), or a scatter of single letters ("l i ' t .").
+
+    Lines with digits are always kept: amounts, dates and numbered lists are data.
+    """
+    stripped = line.strip()
+    if len(stripped) < 4 or _is_table_row(stripped) or _has_digits(stripped):
+        return False
+    chars = stripped.replace(" ", "")
+    alnum = sum(1 for char in chars if char.isalnum())
+    if alnum / len(chars) < NORMALIZE_MIN_ALNUM_RATIO:
+        return True
+    tokens = stripped.split()
+    return len(tokens) >= 4 and sum(1 for token in tokens if len(token) == 1) / len(tokens) >= 0.75
+
+
+def remove_ocr_noise(text: str) -> str:
+    """Drop lines that look like OCR garbage."""
+    return _join([[line for line in lines if not is_noise(line)] for lines in _pages(text)])
+
+
+def clean_ocr_text(text: str) -> str:
+    """remove_ocr_noise for OCR output, when NORMALIZE_OCR_NOISE is on. Never use it on digital text."""
+    if not (NORMALIZE_ENABLED and NORMALIZE_OCR_NOISE) or not text:
+        return text
+    return remove_ocr_noise(text)
+
+
+def _blocks(lines: List[str]) -> Iterable[List[str]]:
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def dedupe_boilerplate(text: str) -> str:
+    """Keep only the first copy of long paragraphs and lines (disclaimers, legal footers, signatures).
+
+    Paragraphs and lines with digits are never dropped: two identical line items are two charges.
+    """
+    # Paragraphs and lines are tracked apart, so a one-line paragraph does not match itself
+    seen_blocks, seen_lines = set(), set()
+    pages = []
+    for lines in _pages(text):
+        kept = []
+        for block in _blocks(lines):
+            key = _line_key(" ".join(block))
+            if len(key) >= NORMALIZE_BOILERPLATE_MIN_CHARS and not _is_table_row(block[0]) and not _has_digits(key):
+                if key in seen_blocks:
+                    continue
+                seen_blocks.add(key)
+            block_lines = []
+            for line in block:
+                key = _line_key(line)
+                if len(key) >= NORMALIZE_BOILERPLATE_MIN_CHARS and not _is_table_row(line) and not _has_digits(key):
+                    if key in seen_lines:
+                        continue
+                    seen_lines.add(key)
+                block_lines.append(line)
+            if block_lines:
+                kept.extend(block_lines + [""])
+        # Keep the blank lines around the page break
+        leading = [""] if lines and not lines[0].strip() else []
+        trailing = [""] if len(lines) > 1 and not lines[-1].strip() else []
+        pages.append(leading + kept[:-1] + trailing)
+    return _join(pages)
+
+
+_RULE_FUNCTIONS = {
+    "whitespace": collapse_whitespace,
+    "repeated_lines": remove_repeated_lines,
+    "boilerplate": dedupe_boilerplate,
+}
+
+_stats = {"documents": 0, "tokens_raw": 0, "tokens_normalized": 0, "removed_chars": {rule: 0 for rule in RULES}}
+
+
+def normalize(text: str, rules: Optional[List[str]] = None) -> Tuple[str, dict]:
+    """Shrink extracted text before it is sent to the LLM. CPU-bound.
+
+    rules defaults to enabled_rules(). Returns the text and a report with estimated
+    token counts before and after, and the characters each rule removed.
+    """
+    rules = enabled_rules() if rules is None else rules
+    report = {"tokens_raw": estimate_tokens(text), "removed_chars": {}}
+    for rule in RULES:
+        if rule in rules and text:
+            before = len(text)
+            text = _RULE_FUNCTIONS[rule](text)
+            report["removed_chars"][rule] = before - len(text)
+    if "whitespace" in rules and text:
+        before = len(text)
+        text = collapse_whitespace(text)  # other rules can leave blank-line runs behind
+        report["removed_chars"]["whitespace"] += before - len(text)
+    report["tokens_normalized"] = estimate_tokens(text)
+    return text, report
+
+
+def record(report: dict) -> None:
+    _stats["documents"] += 1
+    _stats["tokens_raw"] += report["tokens_raw"]
+    _stats["tokens_normalized"] += report["tokens_normalized"]
+    for rule, removed in report["removed_chars"].items():
+        _stats["removed_chars"][rule] += removed
+    logging.info(f"Normalized text from ~{report['tokens_raw']} to ~{report['tokens_normalized']} tokens")
+
+
+def get_stats() -> dict:
+    raw = _stats["tokens_raw"]
+    return {
+        "rules": enabled_rules(),
+        **_stats,
+        "reduction": round(1 - _stats["tokens_normalized"] / raw, 4) if raw else None,
+    }
@@ -0,0 +1,479 @@
+# ocr_service.py
+from __future__ import annotations
+
+import os
+import time
+import shlex
+import asyncio
+import logging
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# pytesseract, Pillow and tesserocr are imported on first use (see load_libraries), so
+# processes that never OCR anything do not pay for them
+# tesserocr is optional: it keeps the Tesseract engine and language data loaded in-process
+HAS_TESSEROCR = find_spec("tesserocr") is not None
+
+# Configure Tesseract path for Windows
+# Common installation paths for Windows
+TESSERACT_PATHS = [
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    os.getenv('TESSERACT_CMD')  # Custom path from environment variable
+]
+
+# Set Tesseract path if found; otherwise pytesseract looks for "tesseract" on the PATH
+TESSERACT_CMD = next((path for path in TESSERACT_PATHS if path and os.path.exists(path)), "tesseract")
+if TESSERACT_CMD != "tesseract":
+    logging.info(f"Tesseract configured at: {TESSERACT_CMD}")
+else:
+    logging.warning("Tesseract executable not found. OCR functionality may not work.")
+
+# Tesseract settings passed to every OCR call
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng")
+TESSERACT_CONFIG = os.getenv("TESSERACT_CONFIG", "")
+
+# Default speed/quality trade-off; a request may pick another profile
+OCR_PROFILE = os.getenv("OCR_PROFILE", "balanced").lower()
+
+# Resolution Tesseract is most accurate at; images that declare more are scaled down to it
+OCR_TARGET_DPI = int(os.getenv("OCR_TARGET_DPI", "300"))
+
+# Web worker processes on this host (start.sh exports it). Each one runs its own OCR and PDF
+# pools, so their sizes default to one web worker's share of the cores
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+CPU_SHARE = max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
+# Long-lived OCR worker processes (0 runs OCR on the default thread executor instead).
+# The pool starts with the first OCR job unless WARMUP_EXTRACTORS includes "ocr"
+OCR_POOL_WORKERS = int(os.getenv("OCR_POOL_WORKERS", str(min(4, CPU_SHARE))))
+# Workers are replaced after this many jobs each, to cap leaks in the native engine
+OCR_POOL_MAX_JOBS_PER_WORKER = int(os.getenv("OCR_POOL_MAX_JOBS_PER_WORKER", "500"))
+OCR_POOL_HEALTH_TIMEOUT_SECONDS = float(os.getenv("OCR_POOL_HEALTH_TIMEOUT_SECONDS", "10"))
+
+
+class OCRProfile:
+    """Preprocessing and Tesseract settings for one point on the speed/quality curve."""
+
+    def __init__(self, name: str, max_side: int, psm: int, oem: int, binarize: bool, detect_orientation: bool,
+                 detect_script: bool = False, min_side: int = 0):
+        self.name = name
+        self.max_side = max_side
+        self.min_side = min_side
+        self.psm = psm
+        self.oem = oem
+        self.binarize = binarize
+        self.detect_orientation = detect_orientation
+        self.detect_script = detect_script
+
+    def tesseract_config(self) -> str:
+        return f"--oem {self.oem} --psm {self.psm} {TESSERACT_CONFIG}".strip()
+
+
+OCR_PROFILES = {
+    # Downscale hard, grayscale only, assume one uniform block of text
+    "fast": OCRProfile("fast", max_side=1800, psm=6, oem=1, binarize=False, detect_orientation=False),
+    # Otsu binarization and automatic page segmentation, fix rotated scans
+    "balanced": OCRProfile("balanced", max_side=2800, psm=3, oem=1, binarize=True, detect_orientation=True),
+    # Upscale small images, add languages for the detected script
+    "accurate": OCRProfile("accurate", max_side=4200, psm=3, oem=1, binarize=True, detect_orientation=True,
+                           detect_script=True, min_side=1600),
+}
+
+if OCR_PROFILE not in OCR_PROFILES:
+    logging.warning(f"Unknown OCR_PROFILE '{OCR_PROFILE}'. Using 'balanced'.")
+    OCR_PROFILE = "balanced"
+
+# Tesseract OSD script names -> traineddata languages added by the accurate profile
+SCRIPT_LANGUAGES = {
+    "Cyrillic": "rus",
+    "Arabic": "ara",
+    "Greek": "ell",
+    "Hebrew": "heb",
+    "Devanagari": "hin",
+    "Han": "chi_sim",
+    "Hangul": "kor",
+    "Japanese": "jpn",
+    "Thai": "tha",
+}
+
+_installed_languages = None
+_engines = threading.local()  # tesserocr APIs are not thread-safe, so each thread keeps its own
+
+
+def engine_name() -> str:
+    return "tesserocr" if HAS_TESSEROCR else "pytesseract"
+
+
+def _pytesseract():
+    """pytesseract, imported on first use and pointed at TESSERACT_CMD."""
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
+
+
+def load_libraries() -> None:
+    """Import the OCR libraries now rather than on the first job."""
+    from PIL import Image, ImageOps  # noqa: F401
+    _pytesseract()
+    if HAS_TESSEROCR:
+        import tesserocr  # noqa: F401
+
+
+def _config_variables() -> list:
+    """The -c name=value pairs in TESSERACT_CONFIG, for engines configured by variables rather than a command line."""
+    tokens = shlex.split(TESSERACT_CONFIG)
+    variables = []
+    for i, token in enumerate(tokens):
+        if token == "-c" and i + 1 < len(tokens) and "=" in tokens[i + 1]:
+            variables.append(tuple(tokens[i + 1].split("=", 1)))
+    return variables
+
+
+def _get_api(lang: str, oem: int):
+    """A loaded tesserocr engine for this thread; initialising one reads the language data, so they are reused."""
+    apis = getattr(_engines, "apis", None)
+    if apis is None:
+        apis = _engines.apis = {}
+    api = apis.get((lang, oem))
+    if api is None:
+        import tesserocr
+        api = tesserocr.PyTessBaseAPI(lang=lang, oem=oem)
+        for name, value in _config_variables():
+            api.SetVariable(name, value)
+        apis[(lang, oem)] = api
+    return api
+
+
+def resolve_profile(name: Optional[str]) -> OCRProfile:
+    return OCR_PROFILES[(name or OCR_PROFILE).lower()]
+
+
+def _languages_for_script(script: str) -> str:
+    global _installed_languages
+    language = SCRIPT_LANGUAGES.get(script)
+    if not language or language in TESSERACT_LANG.split("+"):
+        return TESSERACT_LANG
+    if _installed_languages is None:
+        try:
+            _installed_languages = set(_pytesseract().get_languages(config=""))
+        except Exception:
+            _installed_languages = set()
+    return f"{TESSERACT_LANG}+{language}" if language in _installed_languages else TESSERACT_LANG
+
+
+def _normalize_size(image: Image.Image, profile: OCRProfile) -> Image.Image:
+    """Scale to OCR_TARGET_DPI when the image declares its DPI, then clamp the longest side to the profile."""
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] and dpi[0] > OCR_TARGET_DPI:
+        scale = OCR_TARGET_DPI / float(dpi[0])
+    longest = max(image.size) * scale
+    if longest > profile.max_side:
+        scale *= profile.max_side / longest
+    elif profile.min_side and longest < profile.min_side:
+        scale *= profile.min_side / longest
+    if abs(scale - 1.0) < 0.05:
+        return image
+    from PIL import Image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.LANCZOS if scale < 1 else Image.BICUBIC)
+
+
+def _otsu_threshold(image: Image.Image) -> int:
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_threshold, best_variance = 127, 0.0
+    for threshold, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += threshold * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def preprocess(image: Image.Image, profile: OCRProfile) -> Image.Image:
+    """Apply EXIF rotation, size normalization, grayscale and (optionally) Otsu binarization."""
+    from PIL import ImageOps
+    image = ImageOps.exif_transpose(image)
+    image = _normalize_size(image, profile)
+    image = ImageOps.autocontrast(image.convert("L"))
+    if profile.binarize:
+        threshold = _otsu_threshold(image)
+        image = image.point(lambda value: 255 if value > threshold else 0)
+    return image
+
+
+def _detect_orientation(image: Image.Image) -> Tuple[int, str]:
+    """(clockwise rotation needed, script name) from Tesseract OSD; (0, "") when it cannot tell."""
+    try:
+        if HAS_TESSEROCR:
+            import tesserocr
+            api = getattr(_engines, "osd", None)
+            if api is None:
+                api = _engines.osd = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.OSD_ONLY)
+            api.SetImage(image)
+            osd = api.DetectOrientationScript()
+            api.Clear()
+            if not osd:
+                return 0, ""
+            # orient_deg is the page's counter-clockwise orientation
+            return (360 - int(osd["orient_deg"])) % 360, str(osd.get("script_name", ""))
+        pytesseract = _pytesseract()
+        osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+        return int(osd.get("rotate", 0)), str(osd.get("script", ""))
+    except Exception as e:  # too little text for OSD, or the osd traineddata is missing
+        logging.debug(f"Orientation detection skipped: {e}")
+        return 0, ""
+
+
+def _text_and_confidence(data: dict) -> Tuple[str, Optional[float]]:
+    """Rebuild line/paragraph layout from image_to_data output and average the word confidences."""
+    paragraphs, lines = [], {}
+    confidences = []
+    for i, word in enumerate(data.get("text", [])):
+        word = (word or "").strip()
+        if not word:
+            continue
+        try:
+            confidence = float(data["conf"][i])
+        except (TypeError, ValueError):
+            confidence = -1.0
+        if confidence >= 0:
+            confidences.append(confidence)
+        paragraph = (data["block_num"][i], data["par_num"][i])
+        if paragraph not in lines:
+            lines[paragraph] = {}
+            paragraphs.append(paragraph)
+        lines[paragraph].setdefault(data["line_num"][i], []).append(word)
+    text = "\n\n".join(
+        "\n".join(" ".join(words) for words in lines[paragraph].values()) for paragraph in paragraphs
+    )
+    return text, (round(sum(confidences) / len(confidences), 1) if confidences else None)
+
+
+def _recognize(image: Image.Image, lang: str, profile: OCRProfile) -> Tuple[str, Optional[float]]:
+    if HAS_TESSEROCR:
+        api = _get_api(lang, profile.oem)
+        api.SetPageSegMode(profile.psm)
+        api.SetImage(image)
+        text = api.GetUTF8Text().strip()
+        confidence = api.MeanTextConf()
+        api.Clear()
+        return text, (float(confidence) if text else None)
+    pytesseract = _pytesseract()
+    data = pytesseract.image_to_data(
+        image, lang=lang, config=profile.tesseract_config(), output_type=pytesseract.Output.DICT
+    )
+    return _text_and_confidence(data)
+
+
+def ocr_image(image: Image.Image, profile_name: Optional[str] = None) -> Tuple[str, Optional[float], float]:
+    """OCR one image with the given profile. Blocking.
+
+    Returns (text, mean word confidence 0-100 or None, seconds spent).
+    """
+    started = time.perf_counter()
+    profile = resolve_profile(profile_name)
+    image = preprocess(image, profile)
+    lang = TESSERACT_LANG
+    if profile.detect_orientation:
+        rotate, script = _detect_orientation(image)
+        if rotate:
+            image = image.rotate(-rotate, expand=True, fillcolor=255)
+        if profile.detect_script and script:
+            lang = _languages_for_script(script)
+    text, confidence = _recognize(image, lang, profile)
+    seconds = time.perf_counter() - started
+    logging.info(f"OCR ({profile.name}, {lang}) took {seconds:.2f}s, {len(text)} chars, confidence {confidence}")
+    return text, confidence, seconds
+
+
+def _ocr_source(source: Union[str, bytes], profile_name: Optional[str]) -> Tuple[str, Optional[float], float]:
+    """Pool job: open the image in the worker so only a path (or the raw bytes) crosses the pipe."""
+    from PIL import Image
+    image = Image.open(source if isinstance(source, str) else BytesIO(source))
+    return ocr_image(image, profile_name)
+
+
+def _warm_worker() -> None:
+    """Pool initializer: load the engine and default language before the first job arrives."""
+    load_libraries()
+    if HAS_TESSEROCR:
+        _get_api(TESSERACT_LANG, resolve_profile(None).oem)
+
+
+def _ping() -> dict:
+    """Health-check job: OCR a blank image end to end."""
+    from PIL import Image
+    ocr_image(Image.new("L", (64, 32), 255), "fast")
+    return {"pid": os.getpid(), "engine": engine_name()}
+
+
+_pool = None
+_pool_jobs = 0
+_pool_stats = {"submitted": 0, "completed": 0, "failed": 0, "in_flight": 0, "recycled": 0, "restarted": 0}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """The OCR pool, replaced by a fresh one once its workers have served their job quota."""
+    global _pool, _pool_jobs
+    if _pool is not None and OCR_POOL_MAX_JOBS_PER_WORKER > 0 \
+            and _pool_jobs >= OCR_POOL_WORKERS * OCR_POOL_MAX_JOBS_PER_WORKER:
+        # Queued jobs still finish on the old workers, which then exit
+        _pool.shutdown(wait=False)
+        _pool = None
+        _pool_stats["recycled"] += 1
+        logging.info(f"Recycling OCR pool after {_pool_jobs} jobs.")
+    if _pool is None:
+        # "spawn" avoids forking a process that already runs event loop and executor threads
+        _pool = ProcessPoolExecutor(
+            max_workers=OCR_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+        _pool_jobs = 0
+    _pool_jobs += 1
+    return _pool
+
+
+def start_pool() -> None:
+    """Start and warm the OCR workers now rather than on the first OCR job."""
+    if OCR_POOL_WORKERS <= 0:
+        return
+    pool = _get_pool()
+    for _ in range(OCR_POOL_WORKERS):
+        pool.submit(_warm_worker)
+    logging.info(f"Started OCR pool with {OCR_POOL_WORKERS} workers ({engine_name()}).")
+
+
+def shutdown_pool() -> None:
+    """Stop the OCR pool. Called on application shutdown."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def queue_depth() -> int:
+    """OCR jobs waiting for a free worker."""
+    return max(0, _pool_stats["in_flight"] - max(1, OCR_POOL_WORKERS))
+
+
+async def ocr_async(source: Union[str, bytes], profile_name: Optional[str] = None) -> Tuple[str, Optional[float], float]:
+    """OCR an image file path or image bytes on the worker pool. Returns ocr_image's tuple."""
+    global _pool
+    loop = asyncio.get_running_loop()
+    _pool_stats["submitted"] += 1
+    _pool_stats["in_flight"] += 1
+    try:
+        executor = _get_pool() if OCR_POOL_WORKERS > 0 else None
+        result = await loop.run_in_executor(executor, _ocr_source, source, profile_name)
+        _pool_stats["completed"] += 1
+        return result
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); the next job gets a fresh pool
+        _pool_stats["failed"] += 1
+        _pool_stats["restarted"] += 1
+        _pool = None
+        raise
+    except Exception:
+        _pool_stats["failed"] += 1
+        raise
+    finally:
+        _pool_stats["in_flight"] -= 1
+
+
+_last_check = None   # result of the latest readiness check, reported by /health
+_check_task = None   # the readiness check in progress, shared by concurrent callers
+
+
+def pool_state() -> dict:
+    """Pool status from counters only: runs no job and never starts the pool."""
+    if OCR_POOL_WORKERS <= 0:
+        status = "disabled"
+    elif _pool is None:
+        status = "idle"  # not started yet, or dropped after a worker died; the next job starts it
+    else:
+        status = "running"
+    return {**get_stats(), "status": status, "last_check": _last_check}
+
+
+def _count_out() -> None:
+    _pool_stats["in_flight"] -= 1
+
+
+def _ping_finished(loop: asyncio.AbstractEventLoop) -> None:
+    """Done callback (may run on a pool thread): count the ping out once its worker is free."""
+    try:
+        loop.call_soon_threadsafe(_count_out)
+    except RuntimeError:  # the event loop has already closed
+        pass
+
+
+async def _run_check() -> dict:
+    global _pool, _last_check
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        # Submitted to the running pool directly, so a check never counts toward recycling
+        future = _pool.submit(_ping)
+        # Occupies a worker like any job until it finishes, even after a timeout
+        _pool_stats["in_flight"] += 1
+        future.add_done_callback(lambda _: _ping_finished(loop))
+        worker = await asyncio.wait_for(asyncio.wrap_future(future), timeout=OCR_POOL_HEALTH_TIMEOUT_SECONDS)
+        result = {"status": "ok", **worker}
+    except BrokenProcessPool as e:
+        _pool = None
+        _pool_stats["restarted"] += 1
+        result = {"status": "error", "engine": engine_name(), "detail": repr(e)}
+    except Exception as e:
+        result = {"status": "error", "engine": engine_name(), "detail": repr(e)}
+    if result["status"] == "error":
+        logging.warning(f"OCR pool readiness check failed: {result['detail']}")
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["checked_at"] = round(time.time(), 3)
+    _last_check = result
+    return result
+
+
+async def readiness_check() -> dict:
+    """Run a trivial OCR job through the running pool within OCR_POOL_HEALTH_TIMEOUT_SECONDS."""
+    global _check_task
+    if OCR_POOL_WORKERS <= 0:
+        return {"status": "disabled", "engine": engine_name()}
+    if _pool is None:
+        # Nothing to check; starting a pool here would spend a cold start on a probe
+        return {"status": "idle", "engine": engine_name()}
+    if _check_task is None or _check_task.done():
+        _check_task = asyncio.ensure_future(_run_check())
+    # Shielded so a caller that disconnects does not cancel the check for the others
+    return await asyncio.shield(_check_task)
+
+
+def get_stats() -> dict:
+    return {
+        "engine": engine_name(),
+        "workers": OCR_POOL_WORKERS,
+        "max_jobs_per_worker": OCR_POOL_MAX_JOBS_PER_WORKER,
+        "queue_depth": queue_depth(),
+        **_pool_stats,
+    }
@@ -2,73 +2,147 @@
 import os
 import json
 import logging
-from openai import AsyncOpenAI
-from prompts import CLASSIFICATION_PROMPT, ANALYSIS_PROMPTS
+from typing import AsyncIterator
+from prompts import CLASSIFICATION_PROMPT, ANALYSIS_PROMPTS, COMBINED_PROMPT, SUMMARY_MERGE_PROMPT
+from chunking_service import estimate_tokens
+import llm_resilience
+import metrics_service
 
-# Load OpenAI credentials
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-MAX_RETRIES = 3
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+
+_caller = llm_resilience.ResilientCaller("openai", OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT)
+_client = None
+
+def get_stats() -> dict:
+    return _caller.get_stats()
+
+def is_configured() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+def is_available() -> bool:
+    """Configured and not failing fast behind an open circuit breaker."""
+    return is_configured() and _caller.breaker.state != llm_resilience.CircuitBreaker.OPEN
+
+def get_client():
+    """The shared AsyncOpenAI client; the SDK is imported when it is first needed."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        # Retries are handled by llm_resilience, so the SDK's own retry loop is disabled
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _client
+
+def init_client() -> None:
+    """Build the client at startup so the first request does not pay for the SDK import."""
+    if is_configured():
+        get_client()
+
+async def _complete_json(system_prompt: str, user_content: str, description: str):
+    """Send one JSON-mode chat completion through the resilient caller and parse the reply."""
+    async def _request():
+        response = await get_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            temperature=0.2
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics_service.record_tokens("openai", usage.prompt_tokens, usage.completion_tokens)
+        content = response.choices[0].message.content.strip()
+        if metrics_service.should_log_payload():
+            logging.info(f"OpenAI {description} response: {content[:500]}")  # Log first 500 chars
+        return json.loads(content)
+
+    return await _caller.call(_request, estimate_tokens(system_prompt) + estimate_tokens(user_content), description)
+
+async def _stream_json(system_prompt: str, user_content: str, description: str) -> AsyncIterator[str]:
+    """Yield the text of a streamed JSON-mode completion as it arrives.
+
+    Opening the stream goes through the resilient caller; once text has been yielded
+    nothing is retried, and a failure mid-stream raises LLMCallError.
+    """
+    async def _open():
+        return await get_client().chat.completions.create(
+            model=OPENAI_MODEL,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            temperature=0.2,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+
+    stream = await _caller.call(_open, estimate_tokens(system_prompt) + estimate_tokens(user_content), description)
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                metrics_service.record_tokens("openai", usage.prompt_tokens, usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        kind = llm_resilience.classify_error(e)
+        raise llm_resilience.LLMCallError(f"openai {description} failed mid-stream ({kind}): {e}", "openai", kind) from e
 
 async def classify_document(text: str) -> dict:
-    """Step 1: Classify the document type with retries."""
+    """Step 1: Classify the document type. Raises LLMCallError if OpenAI keeps failing."""
     logging.info("Classifying document type...")
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            logging.info(f"Attempt {attempt}: Sending classification request to OpenAI...")
-            response = await client.chat.completions.create(
-                model=OPENAI_MODEL,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": CLASSIFICATION_PROMPT},
-                    {"role": "user", "content": text[:4000]}
-                ],
-                temperature=0.2
-            )
-            result = json.loads(response.choices[0].message.content)
-
-            if isinstance(result, dict) and 'document_type' in result:
-                return {"document_type": result['document_type']}
-            else:
-                logging.warning("Unexpected classification format.")
-                return {"document_type": str(result)}
-
-        except Exception as e:
-            logging.warning(f"Attempt {attempt} failed: {e}")
-    logging.error("All classification attempts failed.")
-    return {"document_type": "GeneralDocument"}
+    result = await _complete_json(CLASSIFICATION_PROMPT, text[:4000], "classification")
+    if isinstance(result, dict) and 'document_type' in result:
+        return {"document_type": result['document_type']}
+    else:
+        logging.warning("Unexpected classification format.")
+        return {"document_type": str(result)}
 
 async def analyze_document_by_type(text: str, doc_type: str) -> dict:
-    """Step 2: Analyze the document using a universal analysis prompt with retries."""
+    """Step 2: Analyze the document using a universal analysis prompt. Raises LLMCallError if OpenAI keeps failing."""
     logging.info(f"Analyzing document. Type: {doc_type}")
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            logging.info(f"Attempt {attempt}: Sending analysis request to OpenAI...")
-            response = await client.chat.completions.create(
-                model=OPENAI_MODEL,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": ANALYSIS_PROMPTS},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.2
-            )
-            content = response.choices[0].message.content.strip()
-            logging.info(f"OpenAI response: {content[:500]}")  # Log first 500 chars
-            result = json.loads(content)
-
-            if isinstance(result, dict):
-                logging.info(f"Successfully parsed OpenAI response. Keys: {result.keys()}")
-                return result
-            else:
-                logging.warning("Unexpected analysis format.")
-                return {"document_type": doc_type, "summary": str(result), "key_points": [], "deadlines": []}
-
-        except Exception as e:
-            logging.error(f"Attempt {attempt} failed: {e}", exc_info=True)
-    logging.error("All analysis attempts failed.")
-    return {"document_type": doc_type, "summary": "Failed to analyze document.", "key_points": [], "deadlines": []}
+    result = await _complete_json(ANALYSIS_PROMPTS, text, "analysis")
+    if isinstance(result, dict):
+        logging.info(f"Successfully parsed OpenAI response. Keys: {result.keys()}")
+        return result
+    else:
+        logging.warning("Unexpected analysis format.")
+        return {"document_type": doc_type, "summary": str(result), "key_points": [], "deadlines": []}
+
+async def stream_analysis(text: str, doc_type: str) -> AsyncIterator[str]:
+    """Step 2, streamed: yield the analysis JSON text as the model generates it."""
+    logging.info(f"Streaming document analysis. Type: {doc_type}")
+    async for delta in _stream_json(ANALYSIS_PROMPTS, text, "analysis stream"):
+        yield delta
+
+async def classify_and_analyze(text: str) -> tuple:
+    """Classify and analyze in a single request. Returns (classification, analysis) dicts."""
+    logging.info("Classifying and analyzing document in one request...")
+    result = await _complete_json(COMBINED_PROMPT, text, "combined analysis")
+    if isinstance(result, dict):
+        category = result.pop("category", None) or result.get("document_type", "GeneralDocument")
+        return {"document_type": category}, result
+    else:
+        logging.warning("Unexpected combined format.")
+        return {"document_type": "GeneralDocument"}, {"document_type": "GeneralDocument", "summary": str(result), "key_points": [], "deadlines": []}
 
+async def merge_summaries(summaries: list) -> str:
+    """Reduce step for chunked analysis: merge per-section summaries into one."""
+    logging.info(f"Merging {len(summaries)} section summaries...")
+    sections = "\n".join(f"{i}. {summary}" for i, summary in enumerate(summaries, 1))
+    try:
+        result = await _complete_json(SUMMARY_MERGE_PROMPT, sections, "summary merge")
+    except llm_resilience.LLMCallError as e:
+        logging.warning(f"Summary merge failed: {e}. Using the first section summary.")
+        return summaries[0]
+    if isinstance(result, dict) and result.get("summary"):
+        return str(result["summary"])
+    logging.warning("Unexpected summary merge format.")
+    return summaries[0]
 
 
 
@@ -0,0 +1,153 @@
+# pdf_text_service.py
+import re
+import logging
+from typing import List, Tuple
+
+# Page kinds found by the content-stream pre-scan
+DIGITAL = "digital"    # draws text with font operators
+SCANNED = "scanned"    # no text operators; images or vector outlines that need OCR
+BLANK = "blank"        # nothing drawn at all
+
+# Document classes from the first pages' kinds
+DOC_DIGITAL = "digital"
+DOC_SCANNED = "scanned"
+DOC_MIXED = "mixed"
+
+# Text-showing operators following their string or array operand: (..) Tj, [..] TJ, <..> Tj, (..) ' and (..) "
+_TEXT_OPERATOR_RE = re.compile(rb"[)\]>]\s*(?:Tj|TJ|'|\")")
+_TOKEN_RE = re.compile(
+    rb"\((?:\\.|[^\\)])*\)"      # literal string
+    rb"|<[0-9A-Fa-f\s]*>"        # hex string
+    rb"|/[^\s/\[\]()<>{}]*"      # name
+    rb"|[-+]?(?:\d+\.?\d*|\.\d+)"  # number
+    rb"|[A-Za-z'\"*]+"           # operator
+    rb"|[\[\]]",
+    re.S,
+)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+_ESCAPE_RE = re.compile(rb"\\([0-7]{1,3}|.)", re.S)
+# TJ adjustments below this (thousandths of an em) are treated as word gaps
+_WORD_GAP = -200
+# Fast-mode output with a smaller share of letters, digits and whitespace is considered garbled
+_MIN_READABLE_RATIO = 0.7
+
+
+# pdfminer is imported inside the functions that take its objects: they only run once
+# pdfplumber has opened a PDF, so importing this module stays cheap
+
+def _stream_bytes(obj) -> bytes:
+    from pdfminer.pdftypes import PDFStream, resolve1
+    obj = resolve1(obj)
+    if isinstance(obj, list):
+        return b"\n".join(_stream_bytes(item) for item in obj)
+    if isinstance(obj, PDFStream):
+        try:
+            return obj.get_data()
+        except Exception as e:
+            logging.debug(f"Unreadable PDF content stream: {e}")
+    return b""
+
+
+def _xobjects(page_obj) -> list:
+    from pdfminer.pdftypes import resolve1
+    resources = resolve1(page_obj.resources) or {}
+    return [resolve1(xobject) for xobject in (resolve1(resources.get("XObject")) or {}).values()]
+
+
+def page_kind(page_obj) -> str:
+    """Classify a pdfminer page from its content streams, without interpreting or laying out anything."""
+    from pdfminer.pdftypes import PDFStream
+    content = _stream_bytes(page_obj.contents)
+    if _TEXT_OPERATOR_RE.search(content):
+        return DIGITAL
+    has_image = False
+    for xobject in _xobjects(page_obj):
+        if not isinstance(xobject, PDFStream):
+            continue
+        subtype = getattr(xobject.get("Subtype"), "name", None)
+        if subtype == "Image":
+            has_image = True
+        elif subtype == "Form" and _TEXT_OPERATOR_RE.search(_stream_bytes(xobject)):
+            return DIGITAL
+    if has_image or b" BI" in content or content.strip():
+        return SCANNED
+    return BLANK
+
+
+def document_class(kinds: List[str]) -> str:
+    """Summarise sampled page kinds; blank pages do not count either way."""
+    kinds = set(kinds) - {BLANK}
+    if kinds == {SCANNED}:
+        return DOC_SCANNED
+    if kinds == {DIGITAL} or not kinds:
+        return DOC_DIGITAL
+    return DOC_MIXED
+
+
+def prescan(pdf, sample_pages: int) -> Tuple[int, List[str]]:
+    """(page count, kinds of the first sample_pages pages) for an open pdfplumber document."""
+    pages = pdf.pages
+    return len(pages), [page_kind(page.page_obj) for page in pages[:sample_pages]]
+
+
+def _decode_literal(token: bytes) -> bytes:
+    def _unescape(match):
+        value = match.group(1)
+        if value[:1].isdigit():
+            return bytes([int(value, 8) & 0xFF])
+        if value in (b"\n", b"\r"):
+            return b""  # line continuation
+        return _ESCAPES.get(value, value)
+    return _ESCAPE_RE.sub(_unescape, token[1:-1])
+
+
+def _decode_string(token: bytes) -> str:
+    if token.startswith(b"("):
+        raw = _decode_literal(token)
+    else:
+        digits = re.sub(rb"\s", b"", token[1:-1])
+        raw = bytes.fromhex((digits + b"0" * (len(digits) % 2)).decode("ascii"))
+    return raw.decode("cp1252", errors="replace")
+
+
+def raw_page_text(page_obj) -> str:
+    """Dump the strings a page's text operators show, in content-stream order.
+
+    No font decoding or layout reconstruction: good enough for simple-font Latin text,
+    which is what classification needs. Callers should check readable() and fall back.
+    """
+    parts = []
+    operands = []
+    for token in _TOKEN_RE.findall(_stream_bytes(page_obj.contents)):
+        first = token[:1]
+        if first in b"(<" and token != b"<":
+            operands.append(_decode_string(token))
+        elif first == b"[" or first == b"]" or first == b"/":
+            operands.append(token)
+        elif first.isdigit() or first in b"-+.":
+            operands.append(float(token))
+        else:
+            if token in (b"'", b'"', b"T*"):
+                parts.append("\n")
+            if token in (b"Tj", b"'", b'"'):
+                parts.extend(item for item in operands if isinstance(item, str))
+            elif token == b"TJ":
+                for item in operands:
+                    if isinstance(item, str):
+                        parts.append(item)
+                    elif isinstance(item, float) and item < _WORD_GAP:
+                        parts.append(" ")
+            elif token in (b"Td", b"TD") and len(operands) >= 2 and operands[-1] != 0:
+                parts.append("\n")
+            elif token == b"ET":
+                parts.append("\n")
+            operands = []
+    lines = (" ".join(line.split()) for line in "".join(parts).splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def readable(text: str) -> bool:
+    if not text:
+        return False
+    good = sum(1 for char in text if char.isalnum() or char.isspace() or char in ".,:;-/$%()'\"")
+    return good / len(text) >= _MIN_READABLE_RATIO
@@ -0,0 +1,417 @@
+# pipeline_service.py
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+
+import textract_service
+import ocr_service
+import provider_router
+import cache_service
+import similarity_service
+import classifier_service
+import normalize_service
+import chunking_service
+import llm_resilience
+import metrics_service
+import json_stream
+
+# Pipeline stages, in execution order
+STAGES = ["extract", "classify", "analyze"]
+
+StageCallback = Callable[[str], Awaitable[None]]
+
+# Global concurrency limits shared by every endpoint: CPU-bound extraction and outbound LLM calls
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", str(os.cpu_count() or 1)))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+_extraction_semaphore = asyncio.Semaphore(max(1, EXTRACTION_CONCURRENCY))
+_llm_semaphore = asyncio.Semaphore(max(1, LLM_CONCURRENCY))
+
+# Per-document limit on concurrently analyzed chunks (the global LLM limit still applies)
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+# LLM pipeline modes:
+#   sequential - classify, then analyze (two round-trips)
+#   parallel   - classify and analyze concurrently (two requests, one round-trip of latency)
+#   single     - one request returning both the classification and the analysis
+PIPELINE_MODES = ["sequential", "parallel", "single"]
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sequential").lower()
+if PIPELINE_MODE not in PIPELINE_MODES:
+    logging.warning(f"Unknown PIPELINE_MODE '{PIPELINE_MODE}'. Using 'sequential'.")
+    PIPELINE_MODE = "sequential"
+
+# Recent LLM-stage latencies per mode, in milliseconds
+LATENCY_WINDOW = int(os.getenv("PIPELINE_LATENCY_WINDOW", "1000"))
+_mode_latencies = {mode: deque(maxlen=LATENCY_WINDOW) for mode in PIPELINE_MODES}
+
+
+async def _notify(on_stage: Optional[StageCallback], stage: str):
+    if on_stage is not None:
+        await on_stage(stage)
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def get_stats() -> dict:
+    """Per-mode LLM latency summary over the most recent requests."""
+    modes = {}
+    for mode, latencies in _mode_latencies.items():
+        values = list(latencies)
+        modes[mode] = {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values), 1) if values else None,
+            "p50_ms": _percentile(values, 50) if values else None,
+            "p95_ms": _percentile(values, 95) if values else None,
+        }
+    return {
+        "default_mode": PIPELINE_MODE,
+        "modes": modes,
+        "router": provider_router.get_stats(),
+        "classifier": classifier_service.get_stats(),
+        "normalization": normalize_service.get_stats(),
+    }
+
+
+async def _classify(text: str) -> dict:
+    # Confident local predictions skip the LLM round-trip
+    with metrics_service.stage_timer("classify_local"):
+        local = classifier_service.classify(text)
+    if local is not None:
+        metrics_service.inc(metrics_service.CLASSIFICATIONS, source="local")
+        return local
+
+    # The label is only a hint (the analysis reports document_type itself), so a failure degrades gracefully
+    try:
+        async with _llm_semaphore:
+            started = time.perf_counter()
+            with metrics_service.stage_timer("classify"):
+                result = await provider_router.classify_document(text)
+    except llm_resilience.CircuitOpenError:
+        raise
+    except llm_resilience.LLMCallError as e:
+        logging.warning(f"Classification failed, continuing as GeneralDocument: {e}")
+        return {"document_type": "GeneralDocument"}
+    metrics_service.inc(metrics_service.CLASSIFICATIONS, source="llm")
+    if isinstance(result, dict):
+        llm_ms = round((time.perf_counter() - started) * 1000, 1)
+        await classifier_service.record_label(text, result.get("document_type"), llm_ms)
+    return result
+
+
+async def _analyze(text: str, doc_type: str) -> dict:
+    if chunking_service.needs_chunking(text):
+        with metrics_service.stage_timer("analyze"):
+            return await _analyze_chunked(text, doc_type)
+    async with _llm_semaphore:
+        with metrics_service.stage_timer("analyze"):
+            return await provider_router.analyze_document_by_type(text, doc_type)
+
+
+async def _analyze_chunked(text: str, doc_type: str) -> dict:
+    """Map-reduce analysis for documents too large for one prompt."""
+    chunks = chunking_service.split_text(text)
+    logging.info(f"Document is ~{chunking_service.estimate_tokens(text)} tokens; analyzing {len(chunks)} chunks.")
+    chunk_semaphore = asyncio.Semaphore(max(1, CHUNK_CONCURRENCY))
+
+    async def _analyze_chunk(chunk: str) -> dict:
+        async with chunk_semaphore, _llm_semaphore:
+            return await provider_router.analyze_document_by_type(chunk, doc_type)
+
+    results = await asyncio.gather(*(_analyze_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    succeeded = [r for r in results if isinstance(r, dict)]
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if not succeeded:
+        raise failed[0]
+    if failed:
+        logging.warning(f"{len(failed)} of {len(chunks)} chunks failed; merging the rest. First error: {failed[0]}")
+
+    merged = chunking_service.merge_analyses(succeeded, doc_type)
+    summaries = [r["summary"] for r in succeeded if r.get("summary")]
+    if len(summaries) > 1:
+        async with _llm_semaphore:
+            merged["summary"] = await provider_router.merge_summaries(summaries)
+    return merged
+
+
+async def _run_llm_stages(text: str, mode: str, on_stage: Optional[StageCallback]) -> Tuple[dict, dict]:
+    """Classification and analysis for the selected mode. Returns (classification, analysis)."""
+    if mode == "single" and chunking_service.needs_chunking(text):
+        logging.info("Document too large for a single combined request; using parallel mode.")
+        mode = "parallel"
+
+    if mode == "single":
+        await _notify(on_stage, "classify")
+        await _notify(on_stage, "analyze")
+        async with _llm_semaphore:
+            started = time.perf_counter()
+            with metrics_service.stage_timer("classify_analyze"):
+                classification, analysis = await provider_router.classify_and_analyze(text)
+        if isinstance(classification, dict):
+            llm_ms = round((time.perf_counter() - started) * 1000, 1)
+            await classifier_service.record_label(text, classification.get("document_type"), llm_ms, source="single")
+        return classification, analysis
+
+    if mode == "parallel":
+        # The analysis prompt determines document_type itself, so it does not need the label up front
+        await _notify(on_stage, "classify")
+        await _notify(on_stage, "analyze")
+        return await asyncio.gather(_classify(text), _analyze(text, "Unknown"))
+
+    await _notify(on_stage, "classify")
+    classification_result = await _classify(text)
+    if not isinstance(classification_result, dict):
+        classification_result = {"document_type": str(classification_result)}
+    await _notify(on_stage, "analyze")
+    analysis_result = await _analyze(text, classification_result.get("document_type", "GeneralDocument"))
+    return classification_result, analysis_result
+
+
+def _cache_keys(content_hash: str, ocr_profile: Optional[str]) -> Tuple[str, str]:
+    """(model_key, cache_key): repeat uploads of the same content, model and prompts are served from cache."""
+    model_key = f"{provider_router.cache_model_key()}:norm={normalize_service.cache_tag()}"
+    if ocr_profile and ocr_profile != ocr_service.OCR_PROFILE:
+        model_key = f"{model_key}:ocr={ocr_profile}"  # a different profile may extract different text
+    return model_key, cache_service.make_key(content_hash, model_key)
+
+
+async def _extract_text(file_path: str, filename: str, content_type: Optional[str], content_hash: str,
+                        ocr_profile: Optional[str]) -> Tuple[str, dict]:
+    """Extracted and normalized text, with estimated tokens before and after normalization."""
+    logging.info(f"Processing file: {filename}, content_type: {content_type}")
+    async with _extraction_semaphore:
+        extracted_text = await textract_service.extract_text_from_upload(
+            file_path,
+            None,
+            content_type,
+            content_hash=content_hash,
+            ocr_profile=ocr_profile
+        )
+    logging.info(f"Extracted text length: {len(extracted_text) if extracted_text else 0}")
+    if not extracted_text or not extracted_text.strip():
+        raise HTTPException(
+            status_code=422,
+            detail="Failed to extract text from document. File may be corrupted or unsupported."
+        )
+
+    # Strip whitespace padding, page headers and footers, OCR noise and repeated boilerplate
+    with metrics_service.stage_timer("normalize"):
+        extracted_text, normalize_report = await asyncio.get_running_loop().run_in_executor(
+            None, normalize_service.normalize, extracted_text
+        )
+    normalize_service.record(normalize_report)
+    tokens = {"raw": normalize_report["tokens_raw"], "normalized": normalize_report["tokens_normalized"]}
+    metrics_service.inc(metrics_service.INPUT_TOKENS, tokens["raw"], stage="raw")
+    metrics_service.inc(metrics_service.INPUT_TOKENS, tokens["normalized"], stage="normalized")
+    return extracted_text, tokens
+
+
+async def _near_duplicate(text: str, model_key: str, cache_key: str, filename: str):
+    """(signature, (similarity, result) or None). Near-duplicates of an analyzed document reuse its analysis."""
+    signature = await similarity_service.signature(text)
+    match = await similarity_service.lookup(signature, model_key)
+    if match is not None:
+        logging.info(f"Near-duplicate hit for file: {filename} (similarity {match[0]:.3f})")
+        await cache_service.store(cache_key, match[1])
+    return signature, match
+
+
+def _build_result(analysis_result, doc_type: str) -> dict:
+    """Simplified response for the frontend from the analysis, whatever shape the LLM returned."""
+    # Ensure analysis_result is a dictionary
+    if not isinstance(analysis_result, dict):
+        logging.warning("LLM returned non-dict analysis result. Wrapping it.")
+        analysis_result = {"document_type": doc_type, "summary": str(analysis_result), "key_points": [], "deadlines": []}
+
+    # Optional debug logging, sampled by LOG_PAYLOAD_SAMPLE_RATE
+    if metrics_service.should_log_payload():
+        logging.info(f"analysis_result type: {type(analysis_result)}, value: {analysis_result}")
+
+    return {
+        "document_type": analysis_result.get("document_type", doc_type),
+        "summary": analysis_result.get("summary", ""),
+        "key_points": analysis_result.get("key_points", []),
+        "deadlines": analysis_result.get("deadlines", [])
+    }
+
+
+async def _store_result(cache_key: str, model_key: str, signature, result: dict) -> None:
+    await cache_service.store(cache_key, result)
+    await similarity_service.store(signature, model_key, result)
+
+
+def _llm_http_error(e: llm_resilience.LLMCallError) -> HTTPException:
+    if isinstance(e, llm_resilience.CircuitOpenError):
+        return HTTPException(status_code=503, detail=f"Analysis provider unavailable: {e}")
+    return HTTPException(status_code=502, detail=f"Analysis failed: {e}")
+
+
+async def analyze_file(file_path: str, filename: str, content_type: Optional[str], content_hash: str,
+                       on_stage: Optional[StageCallback] = None, mode: Optional[str] = None,
+                       ocr_profile: Optional[str] = None) -> Tuple[dict, dict]:
+    """Run extraction, classification and analysis for a file already saved to disk.
+
+    on_stage, if given, is awaited with each stage name as it starts. mode overrides
+    PIPELINE_MODE and ocr_profile overrides OCR_PROFILE. Returns the response payload
+    and a metadata dict with the analysis cache status ("HIT", "NEAR" for a
+    near-duplicate, or "MISS"), the mode used, the LLM-stage latency, the estimated
+    input tokens before and after normalization (not for "HIT") and, for "NEAR", the
+    similarity.
+    """
+    mode = mode or PIPELINE_MODE
+    model_key, cache_key = _cache_keys(content_hash, ocr_profile)
+    cached_result = await cache_service.lookup(cache_key)
+    if cached_result is not None:
+        logging.info(f"Cache hit for file: {filename}")
+        return {"filename": filename, **cached_result}, {"cache": "HIT", "mode": mode, "llm_ms": 0.0}
+
+    # 1. Extract text using the hybrid service
+    await _notify(on_stage, "extract")
+    extracted_text, tokens = await _extract_text(file_path, filename, content_type, content_hash, ocr_profile)
+
+    signature, match = await _near_duplicate(extracted_text, model_key, cache_key, filename)
+    if match is not None:
+        similarity, near_result = match
+        meta = {"cache": "NEAR", "mode": mode, "llm_ms": 0.0, "similarity": round(similarity, 3), "tokens": tokens}
+        return {"filename": filename, **near_result}, meta
+
+    # 2. Classify and 3. analyze, according to the pipeline mode
+    llm_started = time.perf_counter()
+    try:
+        classification_result, analysis_result = await _run_llm_stages(extracted_text, mode, on_stage)
+    except llm_resilience.LLMCallError as e:
+        raise _llm_http_error(e)
+    llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+    _mode_latencies[mode].append(llm_ms)
+    if metrics_service.should_log_payload():
+        logging.info(f"classification_result type: {type(classification_result)}, value: {classification_result}")
+    logging.info(f"LLM stages took {llm_ms} ms in {mode} mode")
+    if not isinstance(classification_result, dict):
+        classification_result = {"document_type": str(classification_result)}
+    doc_type = classification_result.get("document_type", "GeneralDocument")
+
+    result = _build_result(analysis_result, doc_type)
+    await _store_result(cache_key, model_key, signature, result)
+    return {"filename": filename, **result}, {"cache": "MISS", "mode": mode, "llm_ms": llm_ms, "tokens": tokens}
+
+
+async def _stream_llm_events(text: str) -> AsyncIterator[Tuple[str, object]]:
+    """Classification and streamed analysis, run concurrently. Yields progress and partial-result events.
+
+    Events: ("classified", classification), then as the analysis streams in
+    ("document_type", str), ("summary", str), ("key_point", {"index", "text"}) and
+    ("deadline", {"index", **deadline}), and finally ("analysis", full analysis or None
+    when the streamed JSON could not be parsed).
+    """
+    classify_task = asyncio.create_task(_classify(text))
+    parser = json_stream.IncrementalJSONParser()
+    deltas = provider_router.stream_analysis(text, "Unknown")
+    next_delta = None
+    classified = False
+    try:
+        async with _llm_semaphore:
+            with metrics_service.stage_timer("analyze"):
+                next_delta = asyncio.ensure_future(deltas.__anext__())
+                while True:
+                    waiting = {next_delta} if classified else {next_delta, classify_task}
+                    done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                    if classify_task in done and not classified:
+                        classified = True
+                        yield "classified", classify_task.result()
+                    if next_delta not in done:
+                        continue
+                    try:
+                        delta = next_delta.result()
+                    except StopAsyncIteration:
+                        break
+                    next_delta = asyncio.ensure_future(deltas.__anext__())
+                    for path, value in parser.feed(delta):
+                        if path == ("document_type",) or path == ("summary",):
+                            yield path[0], value
+                        elif len(path) == 2 and path[0] == "key_points":
+                            yield "key_point", {"index": path[1], "text": value}
+                        elif len(path) == 2 and path[0] == "deadlines" and isinstance(value, dict):
+                            yield "deadline", {"index": path[1], **value}
+        if not classified:
+            yield "classified", await classify_task
+        analysis = parser.root
+        if analysis is None:
+            try:
+                analysis = json.loads(parser.text)  # a reply that was not a JSON object the parser could follow
+            except ValueError:
+                logging.warning("Streamed analysis was not valid JSON.")
+        yield "analysis", analysis
+    finally:
+        classify_task.cancel()
+        if next_delta is not None and not next_delta.done():
+            next_delta.cancel()
+            await asyncio.gather(next_delta, return_exceptions=True)
+        await asyncio.gather(classify_task, return_exceptions=True)
+        await deltas.aclose()
+
+
+async def analyze_file_stream(file_path: str, filename: str, content_type: Optional[str], content_hash: str,
+                              ocr_profile: Optional[str] = None) -> AsyncIterator[Tuple[str, object]]:
+    """Streaming variant of analyze_file: yields (event, data) pairs as the pipeline progresses.
+
+    Events, in order: "extracted" (text size and tokens), "classified", the partial results
+    of _stream_llm_events as the model writes them, then "meta" (as analyze_file's metadata,
+    mode "stream") and "result" (the response payload of analyze_file). Cache and
+    near-duplicate hits go straight to "meta" and "result". Errors raise HTTPException, as
+    in analyze_file. Documents that need chunking are analyzed without streaming.
+    """
+    model_key, cache_key = _cache_keys(content_hash, ocr_profile)
+    cached_result = await cache_service.lookup(cache_key)
+    if cached_result is not None:
+        logging.info(f"Cache hit for file: {filename}")
+        yield "meta", {"cache": "HIT", "mode": "stream", "llm_ms": 0.0}
+        yield "result", {"filename": filename, **cached_result}
+        return
+
+    extracted_text, tokens = await _extract_text(file_path, filename, content_type, content_hash, ocr_profile)
+    yield "extracted", {"characters": len(extracted_text), "tokens": tokens}
+
+    signature, match = await _near_duplicate(extracted_text, model_key, cache_key, filename)
+    if match is not None:
+        similarity, near_result = match
+        yield "meta", {"cache": "NEAR", "mode": "stream", "llm_ms": 0.0, "similarity": round(similarity, 3), "tokens": tokens}
+        yield "result", {"filename": filename, **near_result}
+        return
+
+    llm_started = time.perf_counter()
+    doc_type = "GeneralDocument"
+    try:
+        if chunking_service.needs_chunking(extracted_text):
+            classification_result = await _classify(extracted_text)
+            yield "classified", classification_result
+            doc_type = classification_result.get("document_type", doc_type)
+            analysis_result = await _analyze(extracted_text, doc_type)
+        else:
+            analysis_result = None
+            async for event, data in _stream_llm_events(extracted_text):
+                if event == "classified" and isinstance(data, dict):
+                    doc_type = data.get("document_type", doc_type)
+                if event == "analysis":
+                    analysis_result = data
+                else:
+                    yield event, data
+            if analysis_result is None:
+                raise HTTPException(status_code=502, detail="Analysis failed: the model's streamed reply was not valid JSON")
+    except llm_resilience.LLMCallError as e:
+        raise _llm_http_error(e)
+    llm_ms = round((time.perf_counter() - llm_started) * 1000, 1)
+    logging.info(f"LLM stages took {llm_ms} ms in stream mode")
+
+    result = _build_result(analysis_result, doc_type)
+    await _store_result(cache_key, model_key, signature, result)
+    yield "meta", {"cache": "MISS", "mode": "stream", "llm_ms": llm_ms, "tokens": tokens}
+    yield "result", {"filename": filename, **result}
@@ -42,6 +42,19 @@ Respond ONLY with valid JSON in this exact structure:
 If no deadlines are found, set deadlines to an empty array [].
 """
 
+# Single-call mode: classification and analysis in one structured response
+COMBINED_PROMPT = ANALYSIS_PROMPTS + """
+Additionally include a 'category' key classifying the document as exactly one of:
+'Invoice', 'BalanceSheet', 'ProfitAndLossStatement', 'Contract', 'GeneralDocument'.
+"""
+
+# Map-reduce: merge the summaries of consecutive sections of one long document
+SUMMARY_MERGE_PROMPT = """
+You are given summaries of consecutive sections of a single long document, in order.
+Write one concise 1-2 sentence summary of the whole document's purpose.
+Respond ONLY with a JSON object: {"summary": "..."}
+"""
+
 
 
 
@@ -0,0 +1,198 @@
+# provider_router.py
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator
+
+import openai_service
+import gemini_service
+import llm_resilience
+
+# Interchangeable LLM backends; each module exposes the same coroutine functions
+PROVIDERS = {
+    "openai": openai_service,
+    "gemini": gemini_service,
+}
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "gemini").lower()  # "none" disables failover
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+# Hedge after the primary's p95 latency for the operation, once enough samples exist
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_MS = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "5000"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "250"))
+
+if LLM_PROVIDER not in PROVIDERS:
+    logging.warning(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}'. Using 'openai'.")
+    LLM_PROVIDER = "openai"
+
+_latencies = {}  # (provider, operation) -> recent successful latencies in ms
+_stats = {"calls": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0}
+
+
+def _providers() -> list:
+    """Primary first, then the fallback, keeping only configured backends."""
+    names = [LLM_PROVIDER]
+    if LLM_FALLBACK_PROVIDER in PROVIDERS and LLM_FALLBACK_PROVIDER != LLM_PROVIDER:
+        names.append(LLM_FALLBACK_PROVIDER)
+    return [name for name in names if PROVIDERS[name].is_configured()] or [LLM_PROVIDER]
+
+
+def init_clients() -> None:
+    """Build long-lived provider clients at startup so the first request does not pay for it."""
+    try:
+        openai_service.init_client()
+    except Exception as e:
+        logging.warning(f"OpenAI client initialisation failed: {e}")
+    try:
+        gemini_service.init_client()
+    except Exception as e:
+        logging.warning(f"Gemini client initialisation failed: {e}")
+
+
+def shutdown() -> None:
+    gemini_service.shutdown()
+
+
+def cache_model_key() -> str:
+    """Identifies the primary backend and model for analysis cache keys."""
+    if LLM_PROVIDER == "gemini":
+        return f"gemini:{gemini_service.GEMINI_MODEL}"
+    return openai_service.OPENAI_MODEL
+
+
+def _record(provider: str, operation: str, started: float) -> None:
+    key = (provider, operation)
+    if key not in _latencies:
+        _latencies[key] = deque(maxlen=500)
+    _latencies[key].append((time.perf_counter() - started) * 1000)
+
+
+def _p95(provider: str, operation: str):
+    samples = sorted(_latencies.get((provider, operation), ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[int(0.95 * (len(samples) - 1))]
+
+
+def _hedge_delay(provider: str, operation: str) -> float:
+    p95 = _p95(provider, operation)
+    return max(HEDGE_MIN_DELAY_MS, p95 if p95 is not None else HEDGE_DEFAULT_DELAY_MS) / 1000
+
+
+async def _invoke(provider: str, operation: str, *args):
+    started = time.perf_counter()
+    result = await getattr(PROVIDERS[provider], operation)(*args)
+    _record(provider, operation, started)
+    return result
+
+
+async def _hedged(primary: str, secondary: str, operation: str, *args):
+    """Start the primary; if it has not answered within its p95, also start the secondary and take the first success."""
+    primary_task = asyncio.create_task(_invoke(primary, operation, *args))
+    tasks = [primary_task]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=_hedge_delay(primary, operation))
+        if done and not primary_task.exception():
+            return primary_task.result()
+
+        _stats["hedges"] += 1
+        logging.info(f"Hedging {operation}: {primary} {'failed' if done else 'is slow'}, also asking {secondary}.")
+        tasks.append(asyncio.create_task(_invoke(secondary, operation, *args)))
+        errors = [primary_task.exception()] if done else []
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary_task:
+                        _stats["hedge_wins"] += 1
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        # Also when the caller is cancelled: no losing call may keep a rate-limit token or a
+        # connection busy, and every task is awaited so none is left pending or unretrieved
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _route(operation: str, *args):
+    _stats["calls"] += 1
+    candidates = _providers()
+    available = [name for name in candidates if PROVIDERS[name].is_available()] or candidates
+
+    if LLM_HEDGING and len(available) > 1:
+        return await _hedged(available[0], available[1], operation, *args)
+
+    last_error = None
+    for index, name in enumerate(available):
+        if index > 0:
+            _stats["failovers"] += 1
+            logging.warning(f"Failing over {operation} to {name}: {last_error}")
+        try:
+            return await _invoke(name, operation, *args)
+        except llm_resilience.LLMCallError as e:
+            last_error = e
+    raise last_error
+
+
+async def classify_document(text: str) -> dict:
+    return await _route("classify_document", text)
+
+
+async def analyze_document_by_type(text: str, doc_type: str) -> dict:
+    return await _route("analyze_document_by_type", text, doc_type)
+
+
+async def stream_analysis(text: str, doc_type: str) -> AsyncIterator[str]:
+    """Streamed analysis text. Fails over only while nothing has been yielded; no hedging."""
+    _stats["calls"] += 1
+    candidates = _providers()
+    available = [name for name in candidates if PROVIDERS[name].is_available()] or candidates
+
+    last_error = None
+    for index, name in enumerate(available):
+        if index > 0:
+            _stats["failovers"] += 1
+            logging.warning(f"Failing over stream_analysis to {name}: {last_error}")
+        started = time.perf_counter()
+        streaming = False
+        try:
+            async for delta in PROVIDERS[name].stream_analysis(text, doc_type):
+                if not streaming:
+                    _record(name, "stream_analysis_first_byte", started)
+                    streaming = True
+                yield delta
+            return
+        except llm_resilience.LLMCallError as e:
+            if streaming:
+                raise
+            last_error = e
+    raise last_error
+
+
+async def classify_and_analyze(text: str) -> tuple:
+    return await _route("classify_and_analyze", text)
+
+
+async def merge_summaries(summaries: list) -> str:
+    return await _route("merge_summaries", summaries)
+
+
+def get_stats() -> dict:
+    latency = {
+        f"{provider}.{operation}": {"count": len(samples), "p95_ms": _p95(provider, operation)}
+        for (provider, operation), samples in _latencies.items()
+    }
+    return {
+        "primary": LLM_PROVIDER,
+        "fallback": LLM_FALLBACK_PROVIDER,
+        "hedging": LLM_HEDGING,
+        **_stats,
+        "latency": latency,
+        "providers": [PROVIDERS[name].get_stats() for name in PROVIDERS],
+    }
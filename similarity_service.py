@@ -0,0 +1,261 @@
+# similarity_service.py
+import os
+import re
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+import logging
+import asyncio
+import threading
+from typing import Optional, Tuple
+
+from cache_service import PROMPT_VERSION
+
+# Near-duplicate index configuration
+# Off by default: a hit serves another document's analysis, so validate the thresholds on your own documents first
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "false").lower() == "true"
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", ".cache/similarity.sqlite3")
+# Estimated Jaccard similarity of word shingles needed to reuse a stored analysis
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))
+# Share of numbers (amounts, dates, invoice numbers) two documents must have in common as well,
+# so a vendor's next invoice on the same template is not mistaken for a re-send
+SIMILARITY_NUMBER_THRESHOLD = float(os.getenv("SIMILARITY_NUMBER_THRESHOLD", "0.8"))
+SIMILARITY_MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "50000"))
+# Documents shorter than this many shingles are too small to compare reliably
+SIMILARITY_MIN_SHINGLES = int(os.getenv("SIMILARITY_MIN_SHINGLES", "20"))
+SIMILARITY_MAX_CHARS = int(os.getenv("SIMILARITY_MAX_CHARS", "200000"))
+# Shingles hashed per document; longer documents are compared on their first this many
+SIMILARITY_MAX_SHINGLES = int(os.getenv("SIMILARITY_MAX_SHINGLES", "10000"))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+# LSH banding: 16 bands of 8 rows puts the 50% candidate point at a similarity of about 0.7
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MAX_NUMBERS = 500
+# Stored with every entry; bump when the signature scheme changes so old entries are ignored
+SIGNATURE_VERSION = "oph1"
+
+_MAX_HASH = (1 << 32) - 1
+_BIN_BITS = NUM_PERM.bit_length() - 1  # NUM_PERM is a power of two
+_DENSIFY_STEP = 0x9E3779B1  # spreads values borrowed by empty bins (golden-ratio constant)
+
+# Entries only match under the same prompts and signature scheme
+_INDEX_VERSION = f"{PROMPT_VERSION}:{SIGNATURE_VERSION}"
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_NUMBER_RE = re.compile(r"\d[\d.,/-]*\d|\d")
+
+
+async def _run_blocking(func, *args, **kwargs):
+    """Run blocking I/O operations in executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+class Signature:
+    """MinHash of a document's word shingles, plus the set of numbers it mentions."""
+
+    def __init__(self, minhash: Tuple[int, ...], numbers: frozenset):
+        self.minhash = minhash
+        self.numbers = numbers
+
+    def similarity(self, other: "Signature") -> float:
+        """Estimated Jaccard similarity of the two documents' shingle sets."""
+        return sum(1 for a, b in zip(self.minhash, other.minhash) if a == b) / NUM_PERM
+
+    def number_overlap(self, other: "Signature") -> float:
+        if not self.numbers and not other.numbers:
+            return 1.0
+        return len(self.numbers & other.numbers) / len(self.numbers | other.numbers)
+
+    def bands(self) -> list:
+        """One bucket id per LSH band."""
+        buckets = []
+        for band in range(BANDS):
+            rows = self.minhash[band * ROWS:(band + 1) * ROWS]
+            digest = hashlib.blake2b(struct.pack(f"<{ROWS}I", *rows), digest_size=8).digest()
+            buckets.append(int.from_bytes(digest, "little") >> 1)  # fits SQLite's signed INTEGER
+        return buckets
+
+    def to_bytes(self) -> bytes:
+        return struct.pack(f"<{NUM_PERM}I", *self.minhash)
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _one_permutation_minhash(hashes: set) -> Tuple[int, ...]:
+    """NUM_PERM-bin one-permutation MinHash: each shingle hash is used once, its low bits pick a bin.
+
+    Costs one pass over the shingles instead of one per permutation. Empty bins borrow the
+    nearest filled bin to their right (rotation densification), so short documents still
+    get a full signature and similarity stays an estimate of Jaccard similarity.
+    """
+    bins = [None] * NUM_PERM
+    for h in hashes:
+        index, value = h & (NUM_PERM - 1), (h >> _BIN_BITS) & _MAX_HASH
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+    minhash = list(bins)
+    for i in range(NUM_PERM):
+        if bins[i] is None:
+            distance = next(d for d in range(1, NUM_PERM) if bins[(i + d) % NUM_PERM] is not None)
+            minhash[i] = (bins[(i + distance) % NUM_PERM] + distance * _DENSIFY_STEP) & _MAX_HASH
+    return tuple(minhash)
+
+
+def compute_signature(text: str) -> Optional[Signature]:
+    """Signature of extracted text, or None when the text is too short to compare. CPU-bound."""
+    text = text[:SIMILARITY_MAX_CHARS].lower()
+    words = _WORD_RE.findall(text)
+    hashes = {
+        _shingle_hash(" ".join(words[i:i + SHINGLE_WORDS]))
+        for i in range(min(SIMILARITY_MAX_SHINGLES, max(0, len(words) - SHINGLE_WORDS + 1)))
+    }
+    if len(hashes) < SIMILARITY_MIN_SHINGLES:
+        return None
+    minhash = _one_permutation_minhash(hashes)
+    numbers = frozenset(re.sub(r"[.,]", "", number) for number in _NUMBER_RE.findall(text))
+    return Signature(minhash, frozenset(sorted(numbers)[:MAX_NUMBERS]))
+
+
+class SimilarityIndex:
+    """MinHash LSH table persisted in SQLite: documents with their analyses, and band buckets pointing at them."""
+
+    def __init__(self, path: str = SIMILARITY_INDEX_PATH, max_entries: int = SIMILARITY_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT NOT NULL, prompt_version TEXT NOT NULL, "
+            "minhash BLOB NOT NULL, numbers TEXT NOT NULL, result TEXT NOT NULL, stored_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS bands (band INTEGER NOT NULL, bucket INTEGER NOT NULL, doc_id INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, bucket);"
+            "CREATE INDEX IF NOT EXISTS bands_doc ON bands (doc_id);"
+        )
+        self._conn.commit()
+
+    def find(self, signature: Signature, model: str) -> Optional[Tuple[float, dict]]:
+        """Best stored analysis above both thresholds, as (similarity, result)."""
+        clauses = " OR ".join("(band = ? AND bucket = ?)" for _ in range(BANDS))
+        params = [value for pair in enumerate(signature.bands()) for value in pair]
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.minhash, d.numbers, d.result FROM documents d WHERE d.id IN "
+                f"(SELECT doc_id FROM bands WHERE {clauses}) AND d.model = ? AND d.prompt_version = ?",
+                params + [model, _INDEX_VERSION],
+            ).fetchall()
+        best = None
+        for minhash, numbers, result in rows:
+            candidate = Signature(struct.unpack(f"<{NUM_PERM}I", minhash), frozenset(json.loads(numbers)))
+            similarity = signature.similarity(candidate)
+            if similarity < SIMILARITY_THRESHOLD or signature.number_overlap(candidate) < SIMILARITY_NUMBER_THRESHOLD:
+                continue
+            if best is None or similarity > best[0]:
+                best = (similarity, json.loads(result))
+        return best
+
+    def add(self, signature: Signature, model: str, result: dict) -> None:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO documents (model, prompt_version, minhash, numbers, result, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (model, _INDEX_VERSION, signature.to_bytes(), json.dumps(sorted(signature.numbers)),
+                 json.dumps(result), time.time()),
+            )
+            doc_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO bands (band, bucket, doc_id) VALUES (?, ?, ?)",
+                [(band, bucket, doc_id) for band, bucket in enumerate(signature.bands())],
+            )
+            if doc_id % 100 == 0:  # prune in batches rather than on every insert
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self) -> None:
+        cutoff = self._conn.execute(
+            "SELECT id FROM documents ORDER BY id DESC LIMIT 1 OFFSET ?", (self.max_entries,)
+        ).fetchone()
+        if cutoff is not None:
+            self._conn.execute("DELETE FROM bands WHERE doc_id <= ?", cutoff)
+            self._conn.execute("DELETE FROM documents WHERE id <= ?", cutoff)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def _build_index():
+    if not SIMILARITY_ENABLED:
+        logging.info("Near-duplicate index disabled.")
+        return None
+    try:
+        return SimilarityIndex()
+    except Exception as e:
+        logging.warning(f"Failed to open near-duplicate index at {SIMILARITY_INDEX_PATH}: {e}")
+        return None
+
+
+_index = _build_index()
+_stats = {"hits": 0, "misses": 0, "skipped": 0}
+
+
+async def signature(text: str) -> Optional[Signature]:
+    if _index is None:
+        return None
+    return await _run_blocking(compute_signature, text)
+
+
+async def lookup(sig: Optional[Signature], model: str) -> Optional[Tuple[float, dict]]:
+    """Analysis of a stored near-duplicate as (similarity, result), counting the hit or miss."""
+    if _index is None:
+        return None
+    if sig is None:
+        _stats["skipped"] += 1
+        return None
+    try:
+        match = await _run_blocking(_index.find, sig, model)
+    except Exception as e:
+        logging.warning(f"Near-duplicate lookup failed: {e}")
+        match = None
+    if match is None:
+        _stats["misses"] += 1
+    else:
+        _stats["hits"] += 1
+    return match
+
+
+async def store(sig: Optional[Signature], model: str, result: dict) -> None:
+    """Index a fresh analysis. Failures are logged and never break the request."""
+    if _index is None or sig is None:
+        return
+    try:
+        await _run_blocking(_index.add, sig, model, result)
+    except Exception as e:
+        logging.warning(f"Near-duplicate store failed: {e}")
+
+
+def get_stats() -> dict:
+    entries = 0
+    if _index is not None:
+        try:
+            entries = len(_index)
+        except Exception as e:
+            logging.warning(f"Failed to read near-duplicate index size: {e}")
+    return {
+        "enabled": _index is not None,
+        "threshold": SIMILARITY_THRESHOLD,
+        "number_threshold": SIMILARITY_NUMBER_THRESHOLD,
+        "entries": entries,
+        **_stats,
+    }
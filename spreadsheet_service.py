@@ -0,0 +1,308 @@
+# spreadsheet_service.py
+import os
+import re
+import csv
+import random
+import logging
+from collections import deque
+from datetime import date, datetime, time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Spreadsheet extraction configuration
+# Sheets with at most this many data rows are emitted verbatim; larger ones are profiled
+SPREADSHEET_MAX_VERBATIM_ROWS = int(os.getenv("SPREADSHEET_MAX_VERBATIM_ROWS", "200"))
+# Rows shown for a profiled sheet: the first rows, a uniform sample of the rest, and the last rows
+SPREADSHEET_HEAD_ROWS = int(os.getenv("SPREADSHEET_HEAD_ROWS", "10"))
+SPREADSHEET_SAMPLE_ROWS = int(os.getenv("SPREADSHEET_SAMPLE_ROWS", "10"))
+SPREADSHEET_TAIL_ROWS = int(os.getenv("SPREADSHEET_TAIL_ROWS", "5"))
+SPREADSHEET_MAX_COLUMNS = int(os.getenv("SPREADSHEET_MAX_COLUMNS", "40"))
+SPREADSHEET_MAX_CELL_CHARS = int(os.getenv("SPREADSHEET_MAX_CELL_CHARS", "80"))
+
+# Sheet name shown for a CSV file, like a workbook's default first sheet
+CSV_SHEET_NAME = "Sheet1"
+
+NUMBER = "number"
+DATE = "date"
+TEXT = "text"
+BOOLEAN = "boolean"
+
+_CURRENCY_RE = re.compile(r"[$€£¥\s]")
+# A number written with "." or with "," as its decimal separator; the other one may group thousands
+_POINT_DECIMAL_RE = re.compile(r"^(\d{1,3}(,\d{3})+|\d*)(\.\d*)?$")
+_COMMA_DECIMAL_RE = re.compile(r"^(\d{1,3}(\.\d{3})+|\d*)(,\d*)?$")
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2})?)?$")
+_CSV_SNIFF_BYTES = 64 * 1024
+
+
+def _parse_number(text: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """Parse numbers as exported by accounting tools: 1,234.50, 1.234,50, $99, 12%, (1,000) for negatives.
+
+    Returns the value read with "." as the decimal separator and the value read with ",",
+    either None where the text is not valid that way ("1,234.50" is only the first,
+    "1.234,50" only the second, "1.234" both), or None when the text is not a number.
+    The column decides which reading applies (_ColumnProfile).
+    """
+    value = _CURRENCY_RE.sub("", text)
+    negative = value.startswith("(") and value.endswith(")")
+    if negative:
+        value = value[1:-1]
+    elif value[:1] in "+-":
+        negative = value[:1] == "-"
+        value = value[1:]
+    if value.endswith("%"):
+        value = value[:-1]
+    if not any(char.isdigit() for char in value):
+        return None
+    point = float(value.replace(",", "")) if _POINT_DECIMAL_RE.match(value) else None
+    comma = float(value.replace(".", "").replace(",", ".")) if _COMMA_DECIMAL_RE.match(value) else None
+    if point is None and comma is None:
+        return None
+    return tuple(-number if negative and number is not None else number for number in (point, comma))
+
+
+def _cell(value) -> Tuple[str, str, Optional[tuple]]:
+    """(display text, type, numeric readings as _parse_number returns them) for one cell from either csv or openpyxl."""
+    if isinstance(value, bool):
+        return str(value).upper(), BOOLEAN, None
+    if isinstance(value, int):
+        return str(value), NUMBER, (float(value), float(value))
+    if isinstance(value, float):
+        return f"{value:.12g}", NUMBER, (value, value)
+    if isinstance(value, datetime):
+        text = value.date().isoformat() if value.time() == time(0) else value.isoformat(sep=" ")
+        return text, DATE, None
+    if isinstance(value, (date, time)):
+        return value.isoformat(), DATE, None
+    text = " ".join(str(value).split())
+    if len(text) > SPREADSHEET_MAX_CELL_CHARS:
+        text = text[:SPREADSHEET_MAX_CELL_CHARS - 1] + "…"
+    number = _parse_number(text) if text else None
+    if number is not None:
+        return text, NUMBER, number
+    if _ISO_DATE_RE.match(text):
+        return text, DATE, None
+    return text, TEXT, None
+
+
+def _trim(row: Iterable) -> List:
+    """Drop trailing empty cells; read-only sheets often pad rows to the sheet's used range."""
+    values = list(row)
+    while values and (values[-1] is None or values[-1] == ""):
+        values.pop()
+    return values
+
+
+class _Aggregate:
+    __slots__ = ("count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, number: float) -> None:
+        self.count += 1
+        self.total += number
+        self.minimum = number if self.minimum is None else min(self.minimum, number)
+        self.maximum = number if self.maximum is None else max(self.maximum, number)
+
+
+class _ColumnProfile:
+    """Running type counts and numeric aggregates for one column, in constant memory.
+
+    Numbers are aggregated under both decimal separators. The column's separator is the
+    one its unambiguous values ("1,234.50", "12,5") use; with none, values that read
+    differently either way ("1.234") are left out of the aggregates.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.non_empty = 0
+        self.types = {}
+        self.numbers = 0
+        self.votes = {".": 0, ",": 0}
+        self.aggregates = {".": _Aggregate(), ",": _Aggregate(), None: _Aggregate()}
+        self.first_date = None
+        self.last_date = None
+        self.examples = []
+
+    def add(self, text: str, kind: str, number: Optional[tuple]) -> None:
+        if not text:
+            return
+        self.non_empty += 1
+        self.types[kind] = self.types.get(kind, 0) + 1
+        if number is not None:
+            self.numbers += 1
+            point, comma = number
+            if point is not None:
+                self.aggregates["."].add(point)
+            if comma is not None:
+                self.aggregates[","].add(comma)
+            if point is None or comma is None:
+                self.votes["." if comma is None else ","] += 1
+            elif point == comma:
+                self.aggregates[None].add(point)
+        elif kind == DATE:
+            self.first_date = text if self.first_date is None else min(self.first_date, text)
+            self.last_date = text if self.last_date is None else max(self.last_date, text)
+        elif len(self.examples) < 3 and text not in self.examples:
+            self.examples.append(text)
+
+    def describe(self) -> str:
+        if not self.non_empty:
+            return f"- {self.name}: empty"
+        kind = max(self.types, key=self.types.get)
+        parts = [f"- {self.name}: {kind}, {self.non_empty} values"]
+        if kind == NUMBER and self.numbers:
+            # A tie (usually no unambiguous values at all) aggregates only values both readings agree on
+            separator = None if self.votes["."] == self.votes[","] else max(self.votes, key=self.votes.get)
+            numbers = self.aggregates[separator]
+            if numbers.count:
+                parts.append(f"min {numbers.minimum:.12g}, max {numbers.maximum:.12g}, sum {numbers.total:.12g}, "
+                             f"mean {numbers.total / numbers.count:.6g}")
+            if numbers.count < self.numbers:
+                parts.append(f"{self.numbers - numbers.count} ambiguous numbers not aggregated")
+        elif kind == DATE and self.first_date:
+            parts.append(f"{self.first_date} to {self.last_date}")
+        elif self.examples:
+            parts.append("e.g. " + ", ".join(self.examples))
+        return ", ".join(parts)
+
+
+def _escape(text: str) -> str:
+    return text.replace("|", "\\|")
+
+
+def _markdown_row(cells: List[str], width: int) -> str:
+    cells = cells[:width] + [""] * (width - len(cells))
+    return "| " + " | ".join(_escape(cell) for cell in cells) + " |"
+
+
+def render_table(name: str, rows: Iterable[Iterable]) -> str:
+    """Render one sheet as a compact markdown table, or as a profile when it is large.
+
+    Rows are consumed as a stream. At most SPREADSHEET_MAX_VERBATIM_ROWS rows plus a
+    fixed-size sample are held in memory regardless of the sheet's size.
+    """
+    header = None
+    profiles = []
+    verbatim = []
+    head, tail = [], deque()
+    sample = []  # (row number, cells) reservoir over rows between the head and the tail
+    sampler = random.Random(0)  # deterministic, so cached and fresh extractions agree
+    passed = 0
+    row_count = 0
+    width = 0
+    dropped_columns = 0
+
+    def push(number: int, texts: List[str]) -> None:
+        nonlocal passed
+        tail.append((number, texts))
+        if len(tail) <= SPREADSHEET_TAIL_ROWS:
+            return
+        leaving = tail.popleft()
+        passed += 1
+        if len(sample) < SPREADSHEET_SAMPLE_ROWS:
+            sample.append(leaving)
+        else:
+            slot = sampler.randrange(passed)
+            if slot < SPREADSHEET_SAMPLE_ROWS:
+                sample[slot] = leaving
+
+    for raw in rows:
+        values = _trim(raw)
+        if not values:
+            continue
+        if len(values) > SPREADSHEET_MAX_COLUMNS:
+            dropped_columns = max(dropped_columns, len(values) - SPREADSHEET_MAX_COLUMNS)
+            values = values[:SPREADSHEET_MAX_COLUMNS]
+        cells = [_cell(value) if value is not None else ("", TEXT, None) for value in values]
+        if header is None:
+            header = [text or f"column_{i + 1}" for i, (text, _, _) in enumerate(cells)]
+            continue
+
+        row_count += 1
+        width = max(width, len(cells))
+        while len(profiles) < len(cells):
+            index = len(profiles)
+            profiles.append(_ColumnProfile(header[index] if index < len(header) else f"column_{index + 1}"))
+        for profile, cell in zip(profiles, cells):
+            profile.add(*cell)
+
+        texts = [text for text, _, _ in cells]
+        if verbatim is None:
+            push(row_count, texts)
+            continue
+        verbatim.append(texts)
+        if len(verbatim) > SPREADSHEET_MAX_VERBATIM_ROWS:
+            # Too big to show whole: from here on only the head, sample and tail are kept
+            head = verbatim[:SPREADSHEET_HEAD_ROWS]
+            for number, row in enumerate(verbatim[SPREADSHEET_HEAD_ROWS:], start=SPREADSHEET_HEAD_ROWS + 1):
+                push(number, row)
+            verbatim = None
+
+    if header is None:
+        return ""
+    width = max(width, len(header))
+    columns = header + [f"column_{i + 1}" for i in range(len(header), width)]
+    lines = []
+    suffix = f", {dropped_columns} more columns omitted" if dropped_columns else ""
+
+    if verbatim is not None:
+        lines.append(f"## Sheet: {name} ({row_count} rows x {width} columns{suffix})")
+        lines.append(_markdown_row(columns, width))
+        lines.append("|" + "---|" * width)
+        lines.extend(_markdown_row(row, width) for row in verbatim)
+        return "\n".join(lines)
+
+    lines.append(f"## Sheet: {name} ({row_count} rows x {width} columns{suffix}, profiled)")
+    lines.append("Columns:")
+    lines.extend(profile.describe() for profile in profiles)
+    lines.append(f"Rows (first {len(head)}, {len(sample)} sampled, last {len(tail)}):")
+    lines.append(_markdown_row(columns, width))
+    lines.append("|" + "---|" * width)
+    lines.extend(_markdown_row(row, width) for row in head)
+    if sample:
+        lines.append(_markdown_row(["…"], width))
+        lines.extend(_markdown_row(row, width) for _, row in sorted(sample, key=lambda item: item[0]))
+    lines.append(_markdown_row(["…"], width))
+    lines.extend(_markdown_row(row, width) for _, row in tail)
+    return "\n".join(lines)
+
+
+def _iter_csv_rows(file_path: str) -> Iterator[list]:
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.read(_CSV_SNIFF_BYTES), delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        yield from csv.reader(f, dialect)
+
+
+def iter_sheets(file_path: str) -> Iterator[Tuple[str, Iterator]]:
+    """Yield (sheet name, row iterator) for every sheet; a CSV file is a single sheet."""
+    if file_path.lower().endswith(".csv"):
+        # The path is a temporary upload file, so its name means nothing to the LLM
+        yield CSV_SHEET_NAME, _iter_csv_rows(file_path)
+        return
+    # openpyxl is only imported once a workbook arrives
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield sheet.title, sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def extract_spreadsheet(file_path: str) -> str:
+    """Text for every sheet of a .csv or .xlsx file. Blocking; run it in an executor."""
+    sections = []
+    for name, rows in iter_sheets(file_path):
+        section = render_table(name, rows)
+        if section:
+            sections.append(section)
+    logging.info(f"Extracted {len(sections)} non-empty sheets from {file_path}")
+    return "\n\n".join(sections)
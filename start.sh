@@ -1,8 +1,12 @@
 #!/bin/bash
 PORT=${PORT:-8000}
+# Exported so the app knows it shares state across workers (job_service picks the SQLite job store)
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-3}
 
+# gunicorn.conf.py preloads the libraries named in WARMUP_EXTRACTORS before forking workers
 gunicorn main:app \
-    --workers 3 \
+    --config gunicorn.conf.py \
+    --workers $WEB_CONCURRENCY \
     --worker-class uvicorn.workers.UvicornWorker \
     --bind 0.0.0.0:$PORT \
     --timeout 300
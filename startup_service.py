@@ -0,0 +1,132 @@
+# startup_service.py
+import os
+import sys
+import time
+import logging
+import importlib
+from typing import Iterable, Optional
+
+import ocr_service
+
+# Set when this module is first imported; main.py imports it before anything heavy
+_started = time.perf_counter()
+
+# Heavy third-party libraries behind each extractor, imported on first use.
+# .docx and .txt extraction only use the standard library. "llm" covers the provider SDKs;
+# their clients are still built per worker at startup (provider_router.init_clients).
+HEAVY_LIBRARIES = {
+    "pdf": ("pdfplumber", "pdfminer.pdftypes"),
+    "ocr": ("PIL.Image", "PIL.ImageOps", "pytesseract") + (("tesserocr",) if ocr_service.HAS_TESSEROCR else ()),
+    "spreadsheet": ("openpyxl",),
+    "llm": ("openai", "google.generativeai"),
+}
+
+# Groups worth preloading: the ones used inside the web worker itself. PDF pages and OCR
+# run in "spawn" process pools that import their libraries afresh, so preloading those
+# in the web worker or gunicorn master would add RSS without being shared
+PRELOAD_GROUPS = {group: HEAVY_LIBRARIES[group] for group in ("spreadsheet", "llm")}
+# Groups warmed by starting their pool at startup instead (ocr_service.start_pool in each
+# web worker); otherwise the pool starts with the first job that needs it
+POOL_GROUPS = ("ocr",)
+
+# Groups to warm before serving: comma-separated PRELOAD_GROUPS or POOL_GROUPS names, "all" or "none".
+# Under gunicorn imports run in the master (gunicorn.conf.py), so forked workers share the pages
+WARMUP_EXTRACTORS = os.getenv("WARMUP_EXTRACTORS", "none").lower()
+
+_preload_ms = {}      # module -> import milliseconds in this process (0.0 when it was already loaded)
+_failed = {}          # module -> import error
+_marks = {}           # "imported" / "preloaded" / "ready" -> seconds since _started
+
+
+def _selected(value: Optional[str]) -> list:
+    value = (WARMUP_EXTRACTORS if value is None else value).lower()
+    if value in ("", "none"):
+        return []
+    if value == "all":
+        return list(PRELOAD_GROUPS) + list(POOL_GROUPS)
+    return [name for name in (part.strip() for part in value.split(",")) if name]
+
+
+def warmup_groups(value: Optional[str] = None) -> list:
+    """PRELOAD_GROUPS names selected by a WARMUP_EXTRACTORS-style setting."""
+    groups = []
+    for name in _selected(value):
+        if name in PRELOAD_GROUPS:
+            groups.append(name)
+        elif name in POOL_GROUPS:
+            continue
+        elif name in HEAVY_LIBRARIES:
+            logging.warning(f"Ignoring warm-up group '{name}': it runs in its own process pool, "
+                            f"so preloading it here would not be shared.")
+        else:
+            logging.warning(f"Unknown warm-up group '{name}'. "
+                            f"Expected one of: {', '.join(list(PRELOAD_GROUPS) + list(POOL_GROUPS))}")
+    return groups
+
+
+def warmup_pools(value: Optional[str] = None) -> list:
+    """POOL_GROUPS names selected by a WARMUP_EXTRACTORS-style setting."""
+    return [name for name in _selected(value) if name in POOL_GROUPS]
+
+
+def _timed_import(module: str) -> None:
+    if module in sys.modules:
+        _preload_ms.setdefault(module, 0.0)
+        return
+    started = time.perf_counter()
+    try:
+        importlib.import_module(module)
+    except Exception as e:  # an optional SDK that is not installed
+        _failed[module] = repr(e)
+        logging.warning(f"Warm-up could not import {module}: {e}")
+        return
+    _preload_ms[module] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def preload(groups: Optional[Iterable[str]] = None) -> list:
+    """Import the libraries for the given groups (default WARMUP_EXTRACTORS) now. Returns the groups."""
+    groups = warmup_groups() if groups is None else list(groups)
+    started = time.perf_counter()
+    for group in groups:
+        for module in PRELOAD_GROUPS[group]:
+            _timed_import(module)
+    if groups:
+        mark("preloaded")
+        logging.info(f"Preloaded {', '.join(groups)} in {time.perf_counter() - started:.2f}s (pid {os.getpid()}).")
+    return groups
+
+
+def mark(event: str) -> None:
+    _marks[event] = round(time.perf_counter() - _started, 3)
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process started, including interpreter start-up (Linux only)."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 2)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def ready_seconds() -> Optional[float]:
+    return _marks.get("ready")
+
+
+def get_report() -> dict:
+    """Start-up timings for this worker and which heavy libraries it has loaded so far."""
+    return {
+        "pid": os.getpid(),
+        "process_age_seconds": _process_age(),
+        "seconds": dict(_marks),
+        "warmup": warmup_groups(),
+        "preload_ms": dict(_preload_ms),
+        "preload_failed": dict(_failed),
+        "loaded": {
+            group: [module for module in modules if module in sys.modules]
+            for group, modules in HEAVY_LIBRARIES.items()
+        },
+    }
@@ -0,0 +1,57 @@
+# tests/test_chunking_service.py
+import chunking_service
+from chunking_service import estimate_tokens, merge_analyses, split_text
+
+
+def _pages(count: int, paragraphs: int = 4, words: int = 60) -> str:
+    return chunking_service.PAGE_BREAK.join(
+        "\n\n".join(" ".join(f"p{page}w{i}x{j}" for j in range(words)) for i in range(paragraphs))
+        for page in range(count)
+    )
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("hello world", max_tokens=100) == ["hello world"]
+    assert not chunking_service.needs_chunking("hello world", max_tokens=100)
+
+
+def test_chunks_respect_the_budget_and_keep_every_paragraph():
+    text = _pages(6)
+    chunks = split_text(text, max_tokens=600, overlap_tokens=150)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 600 + 10 for chunk in chunks)  # joins add a few separators
+    joined = "\n\n".join(chunks)
+    for paragraph in text.replace(chunking_service.PAGE_BREAK, "\n\n").split("\n\n"):
+        assert paragraph.strip() in joined
+
+
+def test_consecutive_chunks_overlap():
+    chunks = split_text(_pages(4, paragraphs=8, words=20), max_tokens=300, overlap_tokens=100)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.split("\n\n")[0] in previous
+
+
+def test_single_huge_line_is_hard_split():
+    chunks = split_text("x" * 10000, max_tokens=500, overlap_tokens=0)
+    assert "".join(chunks) == "x" * 10000
+    assert all(estimate_tokens(chunk) <= 500 for chunk in chunks)
+
+
+def test_merge_dedupes_and_votes_on_type():
+    merged = merge_analyses([
+        {"document_type": "Contract", "summary": "first", "key_points": ["Term: 2 years"],
+         "deadlines": [{"date": "2024-05-01", "description": "Renewal notice"}]},
+        {"document_type": "Contract", "key_points": ["term - 2 years", "Fee: 100"],
+         "deadlines": [{"date": "2024-05-01", "description": "renewal notice."},
+                       {"date": "2024-01-01", "description": "Start"}]},
+        {"document_type": "Invoice", "summary": "third"},
+        ValueError("failed chunk"),
+    ], "Unknown")
+    assert merged["document_type"] == "Contract"
+    assert merged["summary"] == "first"
+    assert merged["key_points"] == ["Term: 2 years", "Fee: 100"]
+    assert [d["date"] for d in merged["deadlines"]] == ["2024-01-01", "2024-05-01"]
+
+
+def test_merge_of_nothing_keeps_the_requested_type():
+    assert merge_analyses([], "Invoice")["document_type"] == "Invoice"
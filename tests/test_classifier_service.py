@@ -0,0 +1,65 @@
+# tests/test_classifier_service.py
+import asyncio
+
+import pytest
+
+import classifier_service
+from classifier_service import LinearModel
+
+_CONTRACT = (
+    "This agreement is made between the parties. The supplier shall send an invoice monthly; "
+    "each invoice is payable in 30 days and a disputed invoice is handled under clause 7. "
+    "This agreement is governed by the laws of England."
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch, tmp_path):
+    monkeypatch.setattr(classifier_service, "_model", None)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_ENABLED", True)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_KEYWORD_FALLBACK", False)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_COLLECT_LABELS", False)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_LABEL_LOG", str(tmp_path / "labels.jsonl"))
+    monkeypatch.setattr(classifier_service, "_stats", dict.fromkeys(classifier_service._stats, 0))
+
+
+def test_without_a_model_everything_goes_to_the_llm():
+    assert classifier_service.classify("Invoice number 12. Bill to: ACME. Amount due: 10.00") is None
+
+
+def test_keyword_fallback_is_opt_in(monkeypatch):
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_KEYWORD_FALLBACK", True)
+    label, _ = classifier_service.predict(_CONTRACT)
+    assert label == "Invoice"  # why it is off by default
+
+
+def test_confident_predictions_are_sometimes_audited(monkeypatch):
+    model = LinearModel().fit([("invoice amount due", "Invoice"), ("agreement parties", "Contract")] * 20)
+    monkeypatch.setattr(classifier_service, "_model", model)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_MIN_CONFIDENCE", 0.0)
+    assert classifier_service.classify("invoice amount due") == {"document_type": "Invoice"}
+
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_COLLECT_LABELS", True)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_AUDIT_RATE", 1.0)
+    assert classifier_service.classify("invoice amount due") is None
+    assert classifier_service._stats["audited"] == 1
+
+
+def test_labels_are_only_recorded_when_enabled():
+    asyncio.run(classifier_service.record_label("some text", "Invoice", 120.0))
+    assert classifier_service._stats["labels_recorded"] == 0
+
+
+def test_label_log_rotates_at_max_bytes(monkeypatch):
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_COLLECT_LABELS", True)
+    monkeypatch.setattr(classifier_service, "CLASSIFIER_LABEL_LOG_MAX_BYTES", 300)
+    for i in range(10):
+        asyncio.run(classifier_service.record_label(f"document {'x' * 50} {i}", "Contract", 100.0, source="single"))
+
+    log = classifier_service.CLASSIFIER_LABEL_LOG
+    with open(log, encoding="utf-8") as f:
+        assert sum(len(line) for line in f) <= 300
+    records = list(classifier_service.read_labels(log))
+    assert records[-1]["text"].endswith(" 9")
+    assert records[-1]["source"] == "single" and records[-1]["llm_ms"] == 100.0
+    assert len(records) < 10  # older rotations are dropped
@@ -0,0 +1,58 @@
+# tests/test_job_service.py
+import time
+
+import job_service
+from job_service import COMPLETED, FAILED, QUEUED, RUNNING, MemoryJobStore, SQLiteJobStore
+
+
+def _job(job_id: str, status: str, owner: str = "host:1", created_at: float = None) -> dict:
+    now = time.time() if created_at is None else created_at
+    return {"id": job_id, "status": status, "created_at": now, "updated_at": now, "owner": owner,
+            "stage": None, "stages": {}, "error": None, "result": None, "payload": {}}
+
+
+def test_memory_store_never_evicts_unfinished_jobs():
+    store = MemoryJobStore(max_jobs=3)
+    store.put(_job("queued", QUEUED))
+    store.put(_job("running", RUNNING))
+    store.put(_job("done", COMPLETED))
+    store.put(_job("newer", COMPLETED))
+    assert store.get("queued") is not None
+    assert store.get("running") is not None
+    assert store.get("done") is None
+    assert store.get("newer") is not None
+
+
+def test_sqlite_store_evicts_only_finished_jobs(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite3"), max_jobs=1)
+    store.put(_job("queued", QUEUED, created_at=1))
+    store.put(_job("done", COMPLETED, created_at=2))
+    store.put(_job("newer", FAILED, created_at=3))
+    assert store.get("queued") is not None
+    assert store.get("done") is None
+
+
+def test_fail_stale_spares_jobs_with_live_leases(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker_a, worker_b = SQLiteJobStore(path), SQLiteJobStore(path)
+    worker_a.put(_job("a", RUNNING, owner="host:1"))
+    # A second worker booting must not fail the first worker's live job
+    assert worker_b.fail_stale("restarted") == 0
+    assert worker_b.get("a")["status"] == RUNNING
+
+    monkeypatch.setattr(job_service, "JOB_LEASE_SECONDS", -1)
+    worker_a.renew("host:1")  # an expired lease, as if worker A stopped renewing
+    assert worker_b.fail_stale("restarted") == 1
+    assert worker_b.get("a")["status"] == FAILED
+
+
+def test_renew_extends_only_the_owners_leases(tmp_path, monkeypatch):
+    store = SQLiteJobStore(str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(job_service, "JOB_LEASE_SECONDS", -1)
+    store.put(_job("mine", QUEUED, owner="host:1"))
+    store.put(_job("theirs", QUEUED, owner="host:2"))
+    monkeypatch.setattr(job_service, "JOB_LEASE_SECONDS", 60)
+    store.renew("host:1")
+    assert store.fail_stale("gone") == 1
+    assert store.get("mine")["status"] == QUEUED
+    assert store.get("theirs")["status"] == FAILED
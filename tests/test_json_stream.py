@@ -0,0 +1,59 @@
+# tests/test_json_stream.py
+import json
+
+from json_stream import IncrementalJSONParser
+
+_DOCUMENT = {
+    "document_type": "Invoice",
+    "summary": "Pay \"ACME\" {soon}, [really] \\ now",
+    "total": -12.5e1,
+    "paid": False,
+    "notes": None,
+    "key_points": ["a", {"b": [1, 2]}, "c"],
+    "deadlines": [{"date": "2024-01-31", "description": "Pay"}],
+}
+
+
+def _events(text: str, chunk_size: int, **kwargs) -> list:
+    parser = IncrementalJSONParser(**kwargs)
+    events = []
+    for start in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[start:start + chunk_size]))
+    return events, parser
+
+
+def test_fields_are_reported_in_order_whatever_the_chunking():
+    text = json.dumps(_DOCUMENT, indent=2)
+    expected = None
+    for chunk_size in (1, 2, 7, len(text)):
+        events, parser = _events(text, chunk_size)
+        assert parser.done and parser.root == _DOCUMENT
+        if expected is None:
+            expected = events
+        assert events == expected
+    top_level = [(path[0], value) for path, value in expected if len(path) == 1]
+    assert top_level == list(_DOCUMENT.items())
+    assert expected[-1] == ((), _DOCUMENT)
+
+
+def test_array_elements_arrive_before_the_array_closes():
+    text = json.dumps(_DOCUMENT)
+    parser = IncrementalJSONParser()
+    cut = text.index('"c"')
+    events = parser.feed(text[:cut])
+    assert (("key_points", 0), "a") in events
+    assert (("key_points", 1), {"b": [1, 2]}) in events
+    assert not any(path == ("key_points",) for path, _ in events)
+    # Deeper values are not reported at the default depth
+    assert not any(len(path) > 2 for path, _ in events)
+
+
+def test_code_fence_and_trailing_text_are_ignored():
+    events, parser = _events("```json\n" + json.dumps({"a": 1}) + "\n```\n{\"b\": 2}", 3)
+    assert parser.root == {"a": 1}
+    assert events == [(("a",), 1), ((), {"a": 1})]
+
+
+def test_unfinished_document_is_not_done():
+    _, parser = _events('{"summary": "half', 4)
+    assert not parser.done and parser.root is None
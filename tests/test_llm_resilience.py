@@ -0,0 +1,114 @@
+# tests/test_llm_resilience.py
+import asyncio
+import json
+
+import pytest
+
+import llm_resilience
+from llm_resilience import CircuitBreaker, CircuitOpenError, LLMCallError, ResilientCaller
+
+
+class _ServerError(Exception):
+    status_code = 503
+
+
+def _tripped(breaker: CircuitBreaker) -> CircuitBreaker:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_reset():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=60)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.opened_at -= 60
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_half_open_admits_one_probe():
+    breaker = _tripped(CircuitBreaker("test", failure_threshold=1, reset_seconds=0))
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_call() is False
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = _tripped(CircuitBreaker("test", failure_threshold=1, reset_seconds=60))
+    breaker.opened_at -= 60
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_cancelled_probe_releases_the_breaker():
+    caller = ResilientCaller("test")
+    caller.breaker = _tripped(CircuitBreaker("test", failure_threshold=1, reset_seconds=0))
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        probe = asyncio.create_task(caller.call(hang))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def answer():
+            return "ok"
+
+        return await caller.call(answer)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_call_retries_server_errors_then_succeeds(monkeypatch):
+    monkeypatch.setitem(llm_resilience.RETRY_POLICIES, llm_resilience.SERVER,
+                        llm_resilience.RetryPolicy(max_attempts=3, base_delay=0.0))
+    caller = ResilientCaller("test")
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _ServerError("unavailable")
+        return "ok"
+
+    assert asyncio.run(caller.call(flaky)) == "ok"
+    assert caller.retries == 2
+    assert caller.breaker.failures == 0
+
+
+def test_client_errors_are_not_retried_and_do_not_trip_the_breaker():
+    caller = ResilientCaller("test")
+
+    class _BadRequest(Exception):
+        status_code = 400
+
+    async def bad():
+        raise _BadRequest("nope")
+
+    with pytest.raises(LLMCallError) as error:
+        asyncio.run(caller.call(bad))
+    assert error.value.kind == llm_resilience.CLIENT
+    assert caller.retries == 0
+    assert caller.breaker.failures == 0
+
+
+def test_classify_error():
+    assert llm_resilience.classify_error(json.JSONDecodeError("x", "", 0)) == llm_resilience.PARSE
+    assert llm_resilience.classify_error(asyncio.TimeoutError()) == llm_resilience.TIMEOUT
+    assert llm_resilience.classify_error(_ServerError()) == llm_resilience.SERVER
+    assert llm_resilience.classify_error(ConnectionError()) == llm_resilience.SERVER
@@ -0,0 +1,62 @@
+# tests/test_mailbox_service.py
+import asyncio
+from email.message import EmailMessage
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import mailbox_service  # noqa: E402
+
+
+def _message(subject: str, body: str = "", attachments=()) -> bytes:
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = "sender@example.com"
+    message.set_content(body)
+    for filename, data in attachments:
+        message.add_attachment(data, subtype="plain", filename=filename)
+    return bytes(message)
+
+
+def _write_mbox(tmp_path, messages) -> str:
+    path = tmp_path / "mail.mbox"
+    path.write_bytes(b"".join(b"From sender@example.com Mon Jan  1 00:00:00 2024\n" + m + b"\n" for m in messages))
+    return str(path)
+
+
+def test_mbox_is_split_on_separator_lines(tmp_path):
+    first = _message("one", "Hello,\nFrom the desk of the CFO\n\n>From here on, quoted\n")
+    path = _write_mbox(tmp_path, [first, _message("two", "second")])
+    raws = list(mailbox_service.iter_raw_messages(path, is_mbox=True))
+    assert [index for index, _, _ in raws] == [0, 1]
+    assert all(error is None for _, _, error in raws)
+    parsed = [mailbox_service.parse_message(raw) for _, raw, _ in raws]
+    assert [m["subject"] for m in parsed] == ["one", "two"]
+    # Only a "From " line after a blank line separates messages, and mboxrd quoting is undone
+    assert "From the desk of the CFO" in parsed[0]["body"]
+    assert "From here on, quoted" in parsed[0]["body"]
+
+
+def test_oversized_messages_are_reported_not_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(mailbox_service, "MAX_MESSAGE_BYTES", 200)
+    path = _write_mbox(tmp_path, [_message("big", "x" * 1000), _message("small", "ok")])
+    raws = list(mailbox_service.iter_raw_messages(path, is_mbox=True))
+    assert raws[0][1] is None and "larger than" in raws[0][2]
+    assert raws[1][1] is not None
+
+
+def test_body_is_keyed_on_the_mime_part_not_the_filename(monkeypatch):
+    async def fake_analyze_part(filename, content_type, data, ocr_profile):
+        return {"filename": filename, "status": "ok", "text": data.decode()}
+
+    monkeypatch.setattr(mailbox_service, "_analyze_part", fake_analyze_part)
+    raw = _message("no body", "", attachments=[("message-body.txt", "attached notes")])
+    result = asyncio.run(mailbox_service._analyze_message(0, raw, [".txt"], None))
+    assert result["body"] is None
+    assert [a["text"].strip() for a in result["attachments"]] == ["attached notes"]
+
+    raw = _message("with body", "hello", attachments=[("message-body.txt", "attached notes")])
+    result = asyncio.run(mailbox_service._analyze_message(0, raw, [".txt"], None))
+    assert result["body"]["text"].strip() == "hello"
+    assert [a["text"].strip() for a in result["attachments"]] == ["attached notes"]
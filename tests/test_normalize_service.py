@@ -0,0 +1,100 @@
+# tests/test_normalize_service.py
+from chunking_service import PAGE_BREAK
+import normalize_service
+from normalize_service import clean_ocr_text, is_noise, normalize, remove_repeated_lines
+
+
+def _document(pages):
+    return f"\n{PAGE_BREAK}\n".join("\n".join(lines) for lines in pages)
+
+
+def _statement_page(page: int) -> list:
+    return [f"Item A {page}", f"Page subtotal: ${page * 100}.00", f"Balance carried forward: ${page * 250}.00"]
+
+
+def test_short_statement_pages_survive_intact():
+    text = _document([_statement_page(page) for page in range(1, 4)])
+    normalized, _ = normalize(text)
+    for page in range(1, 4):
+        for line in _statement_page(page):
+            assert line in normalized
+
+
+def test_lines_differing_in_numbers_are_not_headers():
+    pages = [
+        ["Statement"] + [f"Transaction {page}-{row}: ${row}.{page:02d}" for row in range(14)] + [f"Closing balance ${page}"]
+        for page in range(1, 5)
+    ]
+    normalized = remove_repeated_lines(_document(pages))
+    for lines in pages:
+        for line in lines[1:]:
+            assert line in normalized
+
+
+def test_verbatim_headers_footers_and_page_numbers_are_removed():
+    pages = [
+        ["ACME Corp - Confidential"] + [f"Clause {page}.{row} text" for row in range(14)] + ["ACME Corp footer", f"Page {page} of 4"]
+        for page in range(1, 5)
+    ]
+    normalized = remove_repeated_lines(_document(pages))
+    assert normalized.count("ACME Corp - Confidential") == 1
+    assert normalized.count("ACME Corp footer") == 1
+    assert "Page 2 of 4" not in normalized
+    for page in range(1, 5):
+        assert f"Clause {page}.13 text" in normalized
+
+
+def test_lone_number_ending_one_page_is_kept():
+    pages = [[f"Row {page}-{row}" for row in range(14)] for page in range(1, 4)]
+    pages[1].append("12")
+    assert "\n12" in remove_repeated_lines(_document(pages))
+
+
+def test_table_rows_are_never_headers():
+    row = "| Widget | 2 | $10.00 |"
+    pages = [[row] + [f"Line {page}-{i}" for i in range(14)] + [row] for page in range(1, 4)]
+    assert remove_repeated_lines(_document(pages)).count(row) == 6
+
+
+def test_data_lines_are_not_ocr_noise():
+    for line in ["$ 1,234.00 / $ 5.00 = -", "1 2 3 4", "(1) (2) (3) (4)", "a) b) c) d)", "Total: 42"]:
+        assert not is_noise(line), line
+
+
+def test_garbage_is_ocr_noise():
+    for line in ["~ ' . ,| ~~ ;", "l i ' t . ,"]:
+        assert is_noise(line), line
+
+
+def test_noise_removal_only_runs_on_ocr_output():
+    text = "Invoice\n~ ' . ,| ~~ ;\nTotal due"
+    assert "~~" in normalize(text)[0]
+    assert "~~" not in clean_ocr_text(text)
+    assert "ocr_noise" not in normalize_service.RULES
+
+
+def test_report_counts_tokens():
+    text = "word   " * 200
+    normalized, report = normalize(text)
+    assert report["tokens_raw"] > report["tokens_normalized"] > 0
+    assert report["removed_chars"]["whitespace"] == len(text) - len(normalized)
+
+
+def test_boilerplate_keeps_first_copy_of_long_paragraphs():
+    disclaimer = "This statement is provided for information only and does not constitute an offer or advice."
+    unique = "The customer ordered forty-two widgets in March and paid the full amount on the due date."
+    text = _document([[unique, "", disclaimer], ["Other text", "", disclaimer]])
+    normalized, _ = normalize(text)
+    assert normalized.count(disclaimer) == 1
+    assert unique in normalized
+
+
+def test_repeated_line_items_are_kept():
+    item = "Consulting services, senior engineer, on-site support for migration project, hourly  100.00"
+    text = "\n".join(["Invoice 2024-017", item, item, "Total 200.00"])
+    normalized, _ = normalize(text)
+    assert normalized.count(item.replace("  ", " ")) == 2
+    assert "Total 200.00" in normalized
+    # The same holds when each item is its own paragraph
+    normalized, _ = normalize("\n\n".join([item, item]))
+    assert normalized.count(item.replace("  ", " ")) == 2
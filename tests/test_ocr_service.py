@@ -0,0 +1,70 @@
+# tests/test_ocr_service.py
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ocr_service
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(ocr_service, "OCR_POOL_WORKERS", 1)
+    monkeypatch.setattr(ocr_service, "_pool", executor)
+    monkeypatch.setattr(ocr_service, "_pool_jobs", 0)
+    monkeypatch.setattr(ocr_service, "_pool_stats", dict.fromkeys(ocr_service._pool_stats, 0))
+    monkeypatch.setattr(ocr_service, "_last_check", None)
+    monkeypatch.setattr(ocr_service, "_check_task", None)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_pool_state_does_not_start_the_pool(monkeypatch):
+    monkeypatch.setattr(ocr_service, "OCR_POOL_WORKERS", 2)
+    monkeypatch.setattr(ocr_service, "_pool", None)
+    state = ocr_service.pool_state()
+    assert state["status"] == "idle"
+    assert ocr_service._pool is None
+    assert asyncio.run(ocr_service.readiness_check())["status"] == "idle"
+    assert ocr_service._pool is None
+
+
+def test_readiness_check_reports_and_caches(pool, monkeypatch):
+    monkeypatch.setattr(ocr_service, "_ping", lambda: {"pid": 1, "engine": "test"})
+    result = asyncio.run(ocr_service.readiness_check())
+    assert result["status"] == "ok" and result["engine"] == "test"
+    assert ocr_service.pool_state()["last_check"] is result
+    # A check is not a job: it does not count toward recycling or the job counters
+    assert ocr_service._pool_jobs == 0
+    assert ocr_service._pool_stats["submitted"] == 0
+
+
+def test_timed_out_check_stays_in_flight_until_the_worker_is_free(pool, monkeypatch):
+    monkeypatch.setattr(ocr_service, "OCR_POOL_HEALTH_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(ocr_service, "_ping", lambda: time.sleep(0.3) or {"pid": 1})
+
+    async def scenario():
+        result = await ocr_service.readiness_check()
+        in_flight = ocr_service._pool_stats["in_flight"]
+        await asyncio.sleep(0.5)
+        return result, in_flight
+
+    result, in_flight = asyncio.run(scenario())
+    assert result["status"] == "error"
+    assert in_flight == 1
+    assert ocr_service._pool_stats["in_flight"] == 0
+    assert ocr_service.pool_state()["last_check"]["status"] == "error"
+
+
+def test_concurrent_checks_share_one_ping(pool, monkeypatch):
+    calls = []
+    monkeypatch.setattr(ocr_service, "_ping", lambda: calls.append(1) or time.sleep(0.05) or {"pid": 1})
+
+    async def scenario():
+        return await asyncio.gather(*(ocr_service.readiness_check() for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,76 @@
+# tests/test_provider_router.py
+import asyncio
+
+import pytest
+
+import provider_router
+
+
+class _Backend:
+    def __init__(self, delay: float, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.started = self.finished = self.cancelled = 0
+
+    async def classify_document(self, text):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.finished += 1
+        if self.error is not None:
+            raise self.error
+        return {"document_type": "Invoice", "delay": self.delay}
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    primary, secondary = _Backend(0.5), _Backend(0.01)
+    monkeypatch.setattr(provider_router, "PROVIDERS", {"primary": primary, "secondary": secondary})
+    monkeypatch.setattr(provider_router, "HEDGE_MIN_DELAY_MS", 20)
+    monkeypatch.setattr(provider_router, "HEDGE_DEFAULT_DELAY_MS", 20)
+    monkeypatch.setattr(provider_router, "_latencies", {})
+    return primary, secondary
+
+
+def _pending_tasks() -> set:
+    return {task for task in asyncio.all_tasks() if task is not asyncio.current_task()}
+
+
+def test_slow_primary_is_hedged_and_cancelled(backends):
+    primary, secondary = backends
+
+    async def scenario():
+        result = await provider_router._hedged("primary", "secondary", "classify_document", "text")
+        return result, _pending_tasks()
+
+    result, pending = asyncio.run(scenario())
+    assert result["delay"] == 0.01
+    assert primary.cancelled == 1 and primary.finished == 0
+    assert not pending
+
+
+def test_cancelled_caller_cancels_every_call(backends):
+    primary, secondary = backends
+
+    async def scenario():
+        call = asyncio.create_task(provider_router._hedged("primary", "secondary", "classify_document", "text"))
+        await asyncio.sleep(0.005)  # still waiting on the primary, before the hedge
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        return _pending_tasks()
+
+    assert not asyncio.run(scenario())
+    assert primary.started == 1 and primary.cancelled == 1
+    assert secondary.started == 0
+
+
+def test_both_failing_raises_the_first_error(backends):
+    primary, secondary = backends
+    primary.delay, primary.error = 0.0, RuntimeError("primary down")
+    secondary.error = RuntimeError("secondary down")
+    with pytest.raises(RuntimeError, match="primary down"):
+        asyncio.run(provider_router._hedged("primary", "secondary", "classify_document", "text"))
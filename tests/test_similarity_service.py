@@ -0,0 +1,64 @@
+# tests/test_similarity_service.py
+import random
+import time
+
+import similarity_service
+from similarity_service import NUM_PERM, SimilarityIndex, compute_signature
+
+_rng = random.Random(7)
+# Letters only: digits in the words would count as shared numbers
+_VOCABULARY = ["".join(_rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(7)) for _ in range(3000)]
+
+
+def _words(count: int) -> list:
+    return [_rng.choice(_VOCABULARY) for _ in range(count)]
+
+
+def test_short_text_has_no_signature():
+    assert compute_signature("too short to compare") is None
+
+
+def test_identical_text_is_fully_similar():
+    text = " ".join(_words(500))
+    assert compute_signature(text).similarity(compute_signature(text)) == 1.0
+
+
+def test_similarity_tracks_jaccard():
+    words = _words(3000)
+    edited = list(words)
+    for i in range(0, len(edited), 50):
+        edited[i] = "changed"
+    unrelated = _words(3000)
+    base = compute_signature(" ".join(words))
+    assert base.similarity(compute_signature(" ".join(edited))) > 0.7
+    assert base.similarity(compute_signature(" ".join(unrelated))) < 0.1
+
+
+def test_signature_has_every_bin_filled_for_short_documents():
+    signature = compute_signature(" ".join(_words(40)))
+    assert len(signature.minhash) == NUM_PERM
+    assert all(0 <= value < 2 ** 32 for value in signature.minhash)
+
+
+def test_long_documents_are_capped():
+    text = " ".join(_words(200_000))
+    started = time.perf_counter()
+    compute_signature(text)
+    assert time.perf_counter() - started < 1.0
+    assert compute_signature(text).similarity(compute_signature(text + " tail")) == 1.0
+
+
+def test_index_matches_near_duplicates_and_respects_numbers(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity_service, "SIMILARITY_THRESHOLD", 0.8)
+    index = SimilarityIndex(str(tmp_path / "similarity.sqlite3"))
+    words = _words(1000)
+    original = " ".join(words) + " total 1234.50 due 2024-12-15"
+    index.add(compute_signature(original), "model", {"summary": "original"})
+
+    resent = original + " forwarded"
+    match = index.find(compute_signature(resent), "model")
+    assert match is not None and match[1] == {"summary": "original"}
+
+    assert index.find(compute_signature(resent), "other-model") is None
+    next_invoice = " ".join(words) + " total 999.00 due 2025-01-15"
+    assert index.find(compute_signature(next_invoice), "model") is None
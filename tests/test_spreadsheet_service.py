@@ -0,0 +1,41 @@
+# tests/test_spreadsheet_service.py
+import spreadsheet_service
+
+
+def test_csv_sheet_is_not_named_after_the_temp_file(tmp_path):
+    path = tmp_path / "tmpq8x1z_upload.csv"
+    path.write_text("item;amount\nrent;1200\npower;80\n", encoding="utf-8")
+    text = spreadsheet_service.extract_spreadsheet(str(path))
+    assert spreadsheet_service.CSV_SHEET_NAME in text
+    assert "tmpq8x1z" not in text
+    assert "rent" in text and "1200" in text
+
+
+def _profile(values) -> str:
+    profile = spreadsheet_service._ColumnProfile("amount")
+    for value in values:
+        profile.add(*spreadsheet_service._cell(value))
+    return profile.describe()
+
+
+def test_decimal_separator_is_inferred_per_column():
+    assert "min 1.5, max 1234.5, sum 1236, mean 618" in _profile(["1.234,50", "1,50"])
+    assert "min 1.5, max 1234.5, sum 1236, mean 618" in _profile(["1,234.50", "1.50"])
+    # "2.000" reads as two thousand in a column that writes decimals with commas
+    assert "max 2000, sum 2001.25" in _profile(["1,25", "2.000"])
+    assert "max 2, sum 3.25" in _profile(["1.25", "2.000"])
+    assert "sum 1200" in _profile([1000, "200", 5.5, "(5,5)"])
+
+
+def test_ambiguous_numbers_are_left_out_of_the_aggregates():
+    description = _profile(["1.234", "2.500", "10"])
+    assert "sum 10," in description
+    assert "2 ambiguous numbers not aggregated" in description
+
+
+def test_semicolon_csv_with_european_amounts(tmp_path, monkeypatch):
+    monkeypatch.setattr(spreadsheet_service, "SPREADSHEET_MAX_VERBATIM_ROWS", 2)
+    path = tmp_path / "bank.csv"
+    path.write_text("omschrijving;bedrag\nhuur;1.234,50\nstroom;80,25\nwater;20,00\n", encoding="utf-8")
+    text = spreadsheet_service.extract_spreadsheet(str(path))
+    assert "- bedrag: number, 3 values, min 20, max 1234.5, sum 1334.75" in text
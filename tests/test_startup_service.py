@@ -0,0 +1,19 @@
+# tests/test_startup_service.py
+import startup_service
+
+
+def test_pool_groups_are_not_preloaded():
+    assert startup_service.warmup_groups("all") == ["spreadsheet", "llm"]
+    assert startup_service.warmup_groups("pdf,ocr,llm") == ["llm"]
+    assert startup_service.warmup_groups("none") == []
+
+
+def test_ocr_pool_starts_only_when_warmed():
+    assert startup_service.warmup_pools("none") == []
+    assert startup_service.warmup_pools("llm") == []
+    assert startup_service.warmup_pools("llm,ocr") == ["ocr"]
+    assert startup_service.warmup_pools("all") == ["ocr"]
+
+
+def test_report_lists_every_heavy_library_group():
+    assert set(startup_service.get_report()["loaded"]) == set(startup_service.HEAVY_LIBRARIES)
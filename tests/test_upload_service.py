@@ -0,0 +1,134 @@
+# tests/test_upload_service.py
+import io
+import os
+import asyncio
+import hashlib
+import zipfile
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import upload_service  # noqa: E402
+
+
+def _zip(tmp_path, members, compression=zipfile.ZIP_DEFLATED) -> str:
+    path = tmp_path / "batch.zip"
+    with zipfile.ZipFile(path, "w", compression=compression) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return str(path)
+
+
+def _cleanup(saved):
+    for entry in saved:
+        os.remove(entry["tmp_path"])
+
+
+def test_total_decompressed_size_is_capped(tmp_path):
+    # Highly compressible members: small on the wire, large once extracted
+    path = _zip(tmp_path, [(f"doc{i}.txt", b"a" * 1000) for i in range(5)])
+    saved, skipped = upload_service.save_zip_members(path, [".txt"], max_bytes=1000, max_total_bytes=2500)
+    try:
+        assert [entry["filename"] for entry in saved] == ["doc0.txt", "doc1.txt"]
+        assert sum(entry["size"] for entry in saved) == 2000
+        assert len(skipped) == 3 and all("Batch size limit" in entry["detail"] for entry in skipped)
+    finally:
+        _cleanup(saved)
+
+
+def test_corrupt_member_is_skipped_and_its_file_removed(tmp_path, monkeypatch):
+    path = _zip(tmp_path, [("bad.txt", b"x" * 5000), ("good.txt", b"fine")], compression=zipfile.ZIP_STORED)
+    raw = bytearray(open(path, "rb").read())
+    raw[raw.index(b"x" * 100) + 10] = ord("y")  # breaks bad.txt's CRC
+    with open(path, "wb") as f:
+        f.write(raw)
+
+    created = []
+    real_temp = upload_service.tempfile.NamedTemporaryFile
+
+    def tracking_temp(*args, **kwargs):
+        tmp = real_temp(*args, **kwargs)
+        created.append(tmp.name)
+        return tmp
+
+    monkeypatch.setattr(upload_service.tempfile, "NamedTemporaryFile", tracking_temp)
+    saved, skipped = upload_service.save_zip_members(path, [".txt"])
+    try:
+        assert [entry["filename"] for entry in saved] == ["good.txt"]
+        assert skipped[0]["filename"] == "bad.txt" and "Corrupt" in skipped[0]["detail"]
+        assert [name for name in created if os.path.exists(name)] == [saved[0]["tmp_path"]]
+    finally:
+        _cleanup(saved)
+
+
+class _Upload:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.file = io.BytesIO(data)
+
+
+def test_save_upload_copies_and_hashes(tmp_path):
+    tmp_name, content_hash, size = asyncio.run(upload_service.save_upload(_Upload("a.txt", b"hello")))
+    try:
+        assert open(tmp_name, "rb").read() == b"hello" and tmp_name.endswith(".txt")
+        assert content_hash == hashlib.sha256(b"hello").hexdigest() and size == 5
+    finally:
+        os.remove(tmp_name)
+
+
+def test_save_upload_over_limit_removes_its_file(monkeypatch):
+    created = []
+    real_temp = upload_service.tempfile.NamedTemporaryFile
+
+    def tracking_temp(*args, **kwargs):
+        tmp = real_temp(*args, **kwargs)
+        created.append(tmp.name)
+        return tmp
+
+    monkeypatch.setattr(upload_service.tempfile, "NamedTemporaryFile", tracking_temp)
+    with pytest.raises(upload_service.HTTPException) as info:
+        asyncio.run(upload_service.save_upload(_Upload("a.txt", b"x" * 10), max_bytes=5))
+    assert info.value.status_code == 413
+    assert created and not any(os.path.exists(name) for name in created)
+
+
+def _run_middleware(headers, chunks, limit=100):
+    received, sent = [], []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message)
+            if not message.get("more_body"):
+                break
+
+    async def receive():
+        body = chunks.pop(0)
+        return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = upload_service.UploadSizeLimitMiddleware(app, max_bytes=limit)
+    scope = {"type": "http", "method": "POST", "path": "/analyze-document", "headers": headers}
+    asyncio.run(middleware(scope, receive, send))
+    return received, sent
+
+
+def test_middleware_rejects_declared_length_without_reading_body(monkeypatch):
+    monkeypatch.setattr(upload_service, "MULTIPART_OVERHEAD_BYTES", 0)
+    received, sent = _run_middleware([(b"content-length", b"500")], [b"x" * 500])
+    assert received == [] and sent[0]["status"] == 413
+
+
+def test_middleware_stops_a_chunked_body_at_the_limit(monkeypatch):
+    monkeypatch.setattr(upload_service, "MULTIPART_OVERHEAD_BYTES", 0)
+    with pytest.raises(upload_service.HTTPException) as info:
+        _run_middleware([], [b"x" * 60, b"x" * 60, b"x" * 60])
+    assert info.value.status_code == 413
+
+
+def test_middleware_passes_bodies_under_the_limit():
+    received, sent = _run_middleware([(b"content-length", b"50")], [b"x" * 50])
+    assert [message["body"] for message in received] == [b"x" * 50] and sent == []
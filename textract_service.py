@@ -1,83 +1,237 @@
-from dotenv import load_dotenv
-load_dotenv()
-
 import os
 import logging
-import pdfplumber
-import pandas as pd
-from docx import Document
-from PIL import Image
-from io import BytesIO
 from mimetypes import guess_type
+from typing import Optional, Union
 import asyncio
-import pytesseract
-
-load_dotenv()
-
-# Configure Tesseract path for Windows
-# Common installation paths for Windows
-TESSERACT_PATHS = [
-    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-    os.getenv('TESSERACT_CMD')  # Custom path from environment variable
-]
-
-# Set Tesseract path if found
-for path in TESSERACT_PATHS:
-    if path and os.path.exists(path):
-        pytesseract.pytesseract.tesseract_cmd = path
-        logging.info(f"Tesseract configured at: {path}")
-        break
-else:
-    logging.warning("Tesseract executable not found. OCR functionality may not work.")
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import time
+import cache_service
+import ocr_service
+import pdf_text_service
+import spreadsheet_service
+import docx_service
+import normalize_service
+import metrics_service
+
+# Page-parallel PDF pipeline settings
+# Per web worker, like the OCR pool: defaults to its share of the host's cores
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(ocr_service.CPU_SHARE)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+# Pages with fewer extracted characters than this are treated as scanned and OCR'd
+MIN_PAGE_TEXT_CHARS = int(os.getenv("MIN_PAGE_TEXT_CHARS", "25"))
+# Pages checked for a text layer before choosing an extractor for the whole document
+PDF_PRESCAN_PAGES = int(os.getenv("PDF_PRESCAN_PAGES", "3"))
+
+# PDF text modes: "layout" reconstructs reading order with pdfplumber; "fast" dumps the
+# raw text operators and only falls back to pdfplumber when that output looks garbled.
+# The mode is per deployment: every request classifies and analyzes the same extracted
+# text, so there is no classification-only extraction to run in "fast" mode on its own
+PDF_TEXT_MODES = ("layout", "fast")
+PDF_TEXT_MODE = os.getenv("PDF_TEXT_MODE", "layout").lower()
+if PDF_TEXT_MODE not in PDF_TEXT_MODES:
+    logging.warning(f"Unknown PDF_TEXT_MODE '{PDF_TEXT_MODE}'. Using 'layout'.")
+    PDF_TEXT_MODE = "layout"
+
+# Bump whenever extraction output changes so cached text is invalidated
+EXTRACTOR_VERSION = "9"
+
+def extraction_cache_key(content_hash: str, ext: str, ocr_profile: str = None) -> str:
+    """Cache key covering the content, the file type, the extractor version and the OCR settings."""
+    return ":".join([
+        content_hash,
+        ext,
+        EXTRACTOR_VERSION,
+        PDF_TEXT_MODE,
+        ocr_service.resolve_profile(ocr_profile).name,
+        ocr_service.TESSERACT_LANG,
+        ocr_service.TESSERACT_CONFIG,
+        ocr_service.TESSERACT_CMD,
+        "ocr_noise" if normalize_service.NORMALIZE_ENABLED and normalize_service.NORMALIZE_OCR_NOISE else "raw",
+    ])
 
 async def _run_blocking(func, *args, **kwargs):
     """Run blocking I/O operations in executor."""
     loop = asyncio.get_running_loop()
     return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
 
-async def extract_text_from_upload(file_path: str, file_bytes: bytes, mime_type_hint: str = None) -> str:
+_process_pool = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Lazily create the bounded process pool used for CPU-bound page work."""
+    global _process_pool
+    if _process_pool is None:
+        # "spawn" avoids forking a process that already runs event loop and executor threads
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max(1, PDF_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logging.info(f"Started PDF process pool with {max(1, PDF_WORKERS)} workers.")
+    return _process_pool
+
+def shutdown_process_pool():
+    """Stop the PDF process pool. Called on application shutdown."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+def _prescan_pdf(file_path: str):
+    """Page count and the kinds of the first PDF_PRESCAN_PAGES pages, from content streams only."""
+    import pdfplumber
+    with pdfplumber.open(file_path) as pdf:
+        return pdf_text_service.prescan(pdf, PDF_PRESCAN_PAGES)
+
+def _page_text(page, text_mode: str) -> str:
+    if text_mode == "fast":
+        text = pdf_text_service.raw_page_text(page.page_obj)
+        if len(text) >= MIN_PAGE_TEXT_CHARS and pdf_text_service.readable(text):
+            return text
+    return (page.extract_text() or "").strip()
+
+def _extract_pdf_pages(file_path: str, page_numbers: list, ocr_profile: str = None, text_mode: str = "layout",
+                       scanned: bool = False) -> list:
+    """Process-pool worker: extract text for the given pages, OCR'ing pages whose own text layer is too sparse.
+
+    Each page is first classified from its content streams; pages with no text
+    operators skip pdfplumber entirely, as do all pages when scanned is True.
+    Returns a list of (page_number, text, ocr_seconds, ocr_confidence, kind) tuples;
+    the OCR fields are None when the page was not OCR'd.
+    """
+    import pdfplumber
+    results = []
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in page_numbers:
+            page = pdf.pages[page_number]
+            kind = pdf_text_service.SCANNED if scanned else pdf_text_service.page_kind(page.page_obj)
+            text = _page_text(page, text_mode) if kind == pdf_text_service.DIGITAL else ""
+            ocr_seconds = ocr_confidence = None
+            if len(text) < MIN_PAGE_TEXT_CHARS and kind != pdf_text_service.BLANK:
+                ocr_started = time.perf_counter()
+                try:
+                    image = page.to_image(resolution=OCR_DPI).original
+                    ocr_text, ocr_confidence, _ = ocr_service.ocr_image(image, ocr_profile)
+                    ocr_text = normalize_service.clean_ocr_text(ocr_text)
+                    if len(ocr_text.strip()) > len(text):
+                        text = ocr_text.strip()
+                except Exception as e:
+                    logging.warning(f"OCR failed for page {page_number + 1}: {e}")
+                ocr_seconds = time.perf_counter() - ocr_started
+            results.append((page_number, text, ocr_seconds, ocr_confidence, kind))
+    return results
+
+async def _extract_pdf_parallel(file_path: str, ocr_profile: str = None) -> str:
+    """Fan pdfplumber text extraction and per-page OCR out to the process pool and reassemble pages in order."""
+    page_count, sampled_kinds = await _run_blocking(_prescan_pdf, file_path)
+    if page_count == 0:
+        return ""
+    document_class = pdf_text_service.document_class(sampled_kinds)
+    # A scan throughout the sample is OCR'd without per-page text-layer checks
+    scanned = document_class == pdf_text_service.DOC_SCANNED
+
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    batches = [
+        list(range(start, min(start + PDF_PAGES_PER_TASK, page_count)))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ]
+    batch_results = await asyncio.gather(
+        *(loop.run_in_executor(pool, _extract_pdf_pages, file_path, batch, ocr_profile, PDF_TEXT_MODE, scanned)
+          for batch in batches)
+    )
+
+    pages = sorted((result for batch in batch_results for result in batch), key=lambda page: page[0])
+    ocr_pages = 0
+    profile_name = ocr_service.resolve_profile(ocr_profile).name
+    for _, _, ocr_seconds, ocr_confidence, kind in pages:
+        metrics_service.inc(metrics_service.PDF_PAGES, kind=kind)
+        if ocr_seconds is not None:
+            ocr_pages += 1
+            # per-page worker time, summed across processes
+            metrics_service.record_ocr(profile_name, ocr_seconds, ocr_confidence)
+    logging.info(f"Extracted {page_count} PDF pages ({document_class}, {ocr_pages} via OCR) across {len(batches)} tasks.")
+    # Form feeds mark page boundaries for the chunker
+    return "\n\f\n".join(text for _, text, _, _, _ in pages if text)
+
+def _extractor_name(file_path: str) -> str:
+    """Extractor branch label used for stage metrics."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in (".csv", ".xlsx"):
+        return "spreadsheet"
+    if ext in (".png", ".jpg", ".jpeg"):
+        return "image"
+    return ext.lstrip(".") or "unknown"
+
+async def extract_text_from_upload(file_path: str, file_bytes: Optional[bytes] = None, mime_type_hint: str = None,
+                                   content_hash: str = None, ocr_profile: str = None) -> str:
+    """Extracts text from various formats, reusing previously extracted text for identical content.
+
+    Extractors read from file_path; file_bytes is optional and only used to hash the content
+    when content_hash is not supplied. ocr_profile selects an ocr_service profile
+    (defaults to OCR_PROFILE); PDFs use PDF_TEXT_MODE.
+    """
+    if content_hash is None:
+        if file_bytes is not None:
+            content_hash = cache_service.hash_bytes(file_bytes)
+        else:
+            content_hash = await _run_blocking(cache_service.hash_file, file_path)
+    cache_key = extraction_cache_key(content_hash, os.path.splitext(file_path)[1].lower(), ocr_profile)
+
+    with metrics_service.stage_timer("extract_cache"):
+        cached_text = await cache_service.lookup_extraction(cache_key)
+    if cached_text is not None:
+        logging.info(f"Extraction cache hit for {file_path}")
+        return cached_text
+
+    with metrics_service.stage_timer(f"extract_{_extractor_name(file_path)}"):
+        text = await _extract_text(file_path, mime_type_hint, ocr_profile)
+    if text and text.strip():
+        await cache_service.store_extraction(cache_key, text)
+    return text
+
+async def _extract_text(file_path: str, mime_type_hint: str = None, ocr_profile: str = None) -> str:
     """Extracts text from various formats. Uses OCR for scanned documents and images."""
 
     ext = file_path.lower()
-    logging.info(f"extract_text_from_upload called: file_path={file_path}, mime_type={mime_type_hint}, file_size={len(file_bytes)} bytes")
+    logging.info(f"extract_text_from_upload called: file_path={file_path}, mime_type={mime_type_hint}, file_size={os.path.getsize(file_path)} bytes")
 
-    # 1. Extract text from digital PDFs
+    # 1. Extract text from PDFs (digital and scanned)
     if ext.endswith(".pdf"):
         try:
-            def _extract_pdf():
-                with pdfplumber.open(file_path) as pdf:
-                    return "".join(page.extract_text() or "" for page in pdf.pages)
-            
-            full_text = await _run_blocking(_extract_pdf)
+            # Scanned pages are detected and OCR'd per page inside the pipeline
+            full_text = await _extract_pdf_parallel(file_path, ocr_profile)
             if full_text.strip():
-                logging.info("Successfully extracted text using pdfplumber.")
-                return full_text.strip()
+                logging.info("Successfully extracted text from PDF.")
             else:
-                # PDF appears to be scanned, try OCR
-                logging.info("PDF appears to be scanned. Trying OCR...")
-                return await _extract_with_ocr(file_bytes)
+                logging.warning("No text could be extracted from PDF, even with OCR.")
+            return full_text.strip()
         except Exception as e:
-            logging.warning(f"pdfplumber failed: {e}. Trying OCR fallback.")
-            return await _extract_with_ocr(file_bytes)
+            # Scanned pages are already OCR'd above; rasterizing needs pdfplumber too, and
+            # Tesseract cannot read a PDF path, so there is nothing left to fall back to
+            logging.error(f"PDF extraction failed: {e}", exc_info=True)
+            return ""
 
     # 2. Extract text from Word documents (.docx)
     elif ext.endswith(".docx"):
         try:
-            def _extract_docx():
-                doc = Document(file_path)
-                return "\n".join([para.text for para in doc.paragraphs])
-            
-            full_text = await _run_blocking(_extract_docx)
+            # Streams the body, headers, footers and notes out of the zip in document order
+            full_text, images = await _run_blocking(docx_service.extract_docx, file_path)
             if full_text.strip():
                 logging.info("Successfully extracted text from DOCX.")
                 return full_text.strip()
-            else:
-                logging.warning("DOCX appears empty. Trying OCR fallback.")
-                return await _extract_with_ocr(file_bytes)
+            if not images:
+                logging.warning("DOCX appears empty and has no images to OCR.")
+                return ""
+            logging.warning(f"DOCX has no text. OCR'ing {len(images)} embedded images.")
+            texts = []
+            for name in images:
+                image_bytes = await _run_blocking(docx_service.read_member, file_path, name)
+                texts.append(await _extract_with_ocr(image_bytes, ocr_profile))
+            return "\n\f\n".join(text for text in texts if text)
         except Exception as e:
-            logging.warning(f"python-docx failed: {e}. Trying OCR fallback.")
-            return await _extract_with_ocr(file_bytes)
+            logging.warning(f"DOCX extraction failed: {e}")
+            return ""
 
     # 3. Extract from plain text files (.txt)
     elif ext.endswith(".txt"):
@@ -97,42 +251,35 @@ async def extract_text_from_upload(file_path: str, file_bytes: bytes, mime_type_
     # 4. Extract from Excel and CSV (.xlsx, .csv)
     elif ext.endswith(".xlsx") or ext.endswith(".csv"):
         try:
-            def _extract_excel():
-                if ext.endswith(".csv"):
-                    df = pd.read_csv(file_path)
-                else:
-                    df = pd.read_excel(file_path)
-                return df.to_string(index=False)
-            
-            full_text = await _run_blocking(_extract_excel)
+            # Streams rows from every sheet; large sheets are summarised rather than dumped
+            full_text = await _run_blocking(spreadsheet_service.extract_spreadsheet, file_path)
             if full_text.strip():
                 logging.info("Successfully extracted text from Excel/CSV.")
                 return full_text.strip()
         except Exception as e:
-            logging.warning(f"pandas failed to extract table: {e}")
+            logging.warning(f"Failed to extract table: {e}")
             return ""
 
     # 5. Extract from images (.png, .jpg, .jpeg) - use OCR
     elif ext.endswith((".png", ".jpg", ".jpeg")):
         logging.info("Image detected. Using OCR extraction.")
-        return await _extract_with_ocr(file_bytes)
+        return await _extract_with_ocr(file_path, ocr_profile)
 
     # Unsupported file type
     else:
         logging.warning(f"Unsupported file type: {ext}")
         return ""
 
-async def _extract_with_ocr(file_bytes: bytes) -> str:
-    """Extract text using pytesseract OCR for scanned documents and images."""
+async def _extract_with_ocr(source: Union[str, bytes], ocr_profile: str = None) -> str:
+    """Extract text with Tesseract OCR for scanned documents and images.
+
+    source is a file path (preferred, avoids holding the file in memory) or raw image bytes.
+    """
     try:
-        def _run_ocr():
-            image = Image.open(BytesIO(file_bytes))
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            text = pytesseract.image_to_string(image)
-            return text.strip()
-        
-        text = await _run_blocking(_run_ocr)
+        # Runs on the long-lived OCR worker pool
+        text, confidence, seconds = await ocr_service.ocr_async(source, ocr_profile)
+        text = normalize_service.clean_ocr_text(text.strip())
+        metrics_service.record_ocr(ocr_service.resolve_profile(ocr_profile).name, seconds, confidence)
         logging.info(f"OCR extraction successful. Extracted {len(text)} characters.")
         return text
     except Exception as e:
@@ -0,0 +1,184 @@
+# upload_service.py
+import os
+import asyncio
+import hashlib
+import logging
+import zlib
+import zipfile
+import tempfile
+import mimetypes
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+
+# Streaming ingest configuration
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+# Multipart boundaries and form fields sent along with the file(s) in a request body
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Total bytes written to disk for one batch, uploads and decompressed zip members together
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+def _too_large(size: int, max_bytes: int = MAX_UPLOAD_BYTES) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large: {size} bytes. Maximum allowed size is {max_bytes} bytes."
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware that rejects request bodies over a per-path limit with 413.
+
+    Starlette spools the whole multipart body to a temporary file before a handler runs,
+    so a size check in the handler comes too late to save the disk or the transfer. This
+    rejects a declared Content-Length over the limit before any of the body is read, and
+    stops a chunked body as soon as the bytes received cross it.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, path_limits: Optional[dict] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            await self.app(scope, receive, send)
+            return
+        limit = self.path_limits.get(scope["path"], self.max_bytes) + MULTIPART_OVERHEAD_BYTES
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            exc = _too_large(int(declared), limit)
+            await JSONResponse({"detail": exc.detail}, status_code=exc.status_code)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _too_large(received, limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _copy_to_temp(src, suffix: str, max_bytes: int) -> Tuple[str, str, int]:
+    digest = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    try:
+        with tmp:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(size, max_bytes)
+                digest.update(chunk)
+                tmp.write(chunk)
+    except BaseException:
+        os.remove(tmp.name)
+        raise
+    return tmp.name, digest.hexdigest(), size
+
+
+async def save_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, str, int]:
+    """Copy an upload to a named temporary file in chunks while hashing it.
+
+    By the time a handler runs, Starlette has already received the whole body into a
+    spooled file (in memory up to 1 MB), which has no path the extractors could open;
+    oversized bodies are refused earlier, by UploadSizeLimitMiddleware. The copy runs in
+    the thread pool, one chunk in memory at a time. Returns (tmp_path, sha256_hex,
+    size_bytes); the caller owns tmp_path and must remove it. Raises 413 for a file over
+    max_bytes.
+    """
+    declared_size: Optional[int] = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise _too_large(declared_size, max_bytes)
+
+    tmp_path, content_hash, size = await asyncio.get_running_loop().run_in_executor(
+        None, _copy_to_temp, file.file, Path(file.filename).suffix, max_bytes
+    )
+    logging.info(f"Saved upload {file.filename} to {tmp_path} ({size} bytes)")
+    return tmp_path, content_hash, size
+
+
+def save_zip_members(zip_path: str, allowed_extensions: list, max_bytes: int = MAX_UPLOAD_BYTES,
+                     max_members: int = MAX_BATCH_FILES, max_total_bytes: int = MAX_BATCH_BYTES) -> Tuple[list, list]:
+    """Stream each supported member of a zip archive to its own temporary file.
+
+    Blocking; run it in an executor. Each member is capped at max_bytes and all members
+    together at max_total_bytes, counting decompressed bytes rather than the declared
+    sizes. Returns (saved, skipped): saved is a list of {"filename", "tmp_path",
+    "content_hash", "content_type", "size"} dicts owned by the caller, skipped is a list
+    of {"filename", "detail"} dicts for members that were not extracted.
+    """
+    saved, skipped = [], []
+    total = 0
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = info.filename
+                ext = Path(name).suffix.lower()
+                if ext not in allowed_extensions:
+                    skipped.append({"filename": name, "detail": f"Unsupported file type: {ext}"})
+                    continue
+                if len(saved) >= max_members:
+                    skipped.append({"filename": name, "detail": f"Batch limit of {max_members} files reached"})
+                    continue
+                if info.file_size > max_bytes:
+                    skipped.append({"filename": name, "detail": f"File too large: {info.file_size} bytes"})
+                    continue
+                if total + info.file_size > max_total_bytes:
+                    skipped.append({"filename": name, "detail": f"Batch size limit of {max_total_bytes} bytes reached"})
+                    continue
+
+                digest = hashlib.sha256()
+                size = 0
+                # Do not trust the declared sizes: stop at whichever limit the real bytes cross first
+                limit = min(max_bytes, max_total_bytes - total)
+                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
+                try:
+                    with archive.open(info) as src, tmp:
+                        for chunk in iter(lambda: src.read(UPLOAD_CHUNK_BYTES), b""):
+                            size += len(chunk)
+                            if size > limit:
+                                break
+                            digest.update(chunk)
+                            tmp.write(chunk)
+                except (zipfile.BadZipFile, EOFError, zlib.error) as e:  # e.g. a CRC mismatch in this member
+                    os.remove(tmp.name)
+                    skipped.append({"filename": name, "detail": f"Corrupt zip member: {e}"})
+                    continue
+                except BaseException:
+                    os.remove(tmp.name)
+                    raise
+                if size > limit:
+                    os.remove(tmp.name)
+                    detail = f"File too large: over {max_bytes} bytes" if limit == max_bytes \
+                        else f"Batch size limit of {max_total_bytes} bytes reached"
+                    skipped.append({"filename": name, "detail": detail})
+                    continue
+                total += size
+                saved.append({
+                    "filename": name,
+                    "tmp_path": tmp.name,
+                    "content_hash": digest.hexdigest(),
+                    "content_type": mimetypes.guess_type(name)[0],
+                    "size": size,
+                })
+    except zipfile.BadZipFile as e:
+        skipped.append({"filename": Path(zip_path).name, "detail": f"Invalid zip archive: {e}"})
+    except Exception:
+        for entry in saved:
+            os.remove(entry["tmp_path"])
+        raise
+    logging.info(f"Extracted {len(saved)} members from zip ({len(skipped)} skipped)")
+    return saved, skipped